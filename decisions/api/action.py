@@ -22,10 +22,12 @@ class AttachmentSerializer(DataModelSerializer):
 class ActionFilter(BaseFilter):
     case = CharFilter(name='case_id')
     event = CharFilter(name='event_id')
+    function_prefix = CharFilter(name='case__function__function_id', lookup_expr='startswith', help_text=(
+        'Beginning of the identifier of a function, e.g. "00 00", to list the actions of the cases under it'))
 
     class Meta:
         model = Action
-        fields = BaseFilter.Meta.fields + ('case', 'event')
+        fields = BaseFilter.Meta.fields + ('case', 'event', 'function_prefix')
 
 
 class ActionSerializer(DataModelSerializer):
@@ -16,10 +16,12 @@ class CaseGeometrySerializer(DataModelSerializer):
 
 class CaseFilter(BaseFilter):
     function = CharFilter(name='function_id')
+    function_prefix = CharFilter(name='function__function_id', lookup_expr='startswith', help_text=(
+        'Beginning of the identifier of a function, e.g. "00 00", to list the cases of it and the functions under it'))
 
     class Meta:
         model = Case
-        fields = BaseFilter.Meta.fields + ('function', 'register_id')
+        fields = BaseFilter.Meta.fields + ('function', 'function_prefix', 'register_id')
 
 
 class CaseSerializer(DataModelSerializer):
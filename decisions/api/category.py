@@ -12,5 +12,5 @@ class FunctionSerializer(DataModelSerializer):
 
 
 class FunctionViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Function.objects.select_related('data_source', 'parent', 'parent__parent', 'parent__parent__parent')
+    queryset = Function.objects.select_related('data_source')
     serializer_class = FunctionSerializer
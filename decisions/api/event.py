@@ -1,3 +1,5 @@
+from django.db.models import Q
+from django_filters import NumberFilter
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import serializers, viewsets
 
@@ -7,9 +9,15 @@ from .base import BaseFilter, DataModelSerializer
 
 
 class EventFilter(BaseFilter):
+    organization_descendants_of = NumberFilter(method='filter_organization_descendants_of', help_text=(
+        'ID of an organization to list the events of it and the organizations under it'))
+
     class Meta:
         model = Event
-        fields = BaseFilter.Meta.fields + ('organization',)
+        fields = BaseFilter.Meta.fields + ('organization', 'organization_descendants_of')
+
+    def filter_organization_descendants_of(self, queryset, name, value):
+        return queryset.filter(Q(organization=value) | Q(organization__ancestor_ids__contains=[value]))
 
 
 class EventSerializer(DataModelSerializer):
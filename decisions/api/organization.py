@@ -1,8 +1,28 @@
+from django_filters import NumberFilter
+from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import serializers, viewsets
 
 from decisions.models import Event, Organization, OrganizationClass, Post
 
-from .base import DataModelSerializer
+from .base import BaseFilter, DataModelSerializer
+
+
+class OrganizationFilter(BaseFilter):
+    descendants_of = NumberFilter(method='filter_descendants_of', help_text=(
+        'ID of an organization to list the organizations under'))
+    ancestors_of = NumberFilter(method='filter_ancestors_of', help_text=(
+        'ID of an organization to list the organizations containing'))
+
+    class Meta:
+        model = Organization
+        fields = BaseFilter.Meta.fields + ('parent', 'descendants_of', 'ancestors_of')
+
+    def filter_descendants_of(self, queryset, name, value):
+        return queryset.filter(ancestor_ids__contains=[value])
+
+    def filter_ancestors_of(self, queryset, name, value):
+        ancestor_ids = Organization.objects.filter(pk=value).values_list('ancestor_ids', flat=True).first()
+        return queryset.filter(pk__in=ancestor_ids or [])
 
 
 class OrganizationClassSerializer(DataModelSerializer):
@@ -24,3 +44,5 @@ class OrganizationSerializer(DataModelSerializer):
 class OrganizationViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Organization.objects.select_related('data_source').prefetch_related('events', 'posts')
     serializer_class = OrganizationSerializer
+    filter_backends = (DjangoFilterBackend,)
+    filter_class = OrganizationFilter
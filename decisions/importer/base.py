@@ -7,13 +7,11 @@ import struct
 from django.db import transaction
 
 from decisions.models import Membership, Organization, OrganizationClass, Person, Post, PostClass
+from .diff import update_fields
+from .hierarchy import update_ancestor_ids
 from .sync import ModelSyncher
 
 
-def isclose(a, b, rel_tol=1e-09, abs_tol=0.0):
-    return abs(a - b) <= max(rel_tol * max(abs(a), abs(b)), abs_tol)
-
-
 class Importer(object):
     @staticmethod
     def clean_text(text):
@@ -21,59 +19,38 @@ class Importer(object):
         # remove consecutive whitespaces
         return re.sub(r'\s\s+', ' ', text, re.U).strip()
 
-    def _set_field(self, obj, field_name, val):
-        field = obj._meta.get_field(field_name)
-        if not hasattr(obj, field_name):
-            raise Exception("Object %s doesn't have '%s' field" % (type(obj), field_name))
-
-        obj_val = getattr(obj, field_name)
-        if isinstance(obj_val, datetime.datetime) and isinstance(val, str):
-            obj_val = obj_val.isoformat()
-            if obj_val.endswith('000+00:00'):
-                obj_val = obj_val.replace('000+00:00', 'Z')
-        elif isinstance(obj_val, datetime.datetime) and isinstance(val, datetime.datetime):
-            val = val.astimezone(obj_val.tzinfo)
-        elif isinstance(obj_val, datetime.date) and isinstance(val, str):
-            obj_val = obj_val.isoformat()
-        elif isinstance(obj_val, float) and isinstance(val, float):
-            # If floats are close enough, treat them as the same
-            if isclose(obj_val, val):
-                val = obj_val
-        if obj_val == val:
-            return
-
-        if field.get_internal_type() == 'CharField' and val is not None:
-            if len(val) > field.max_length:
-                raise Exception("field '%s' too long (max. %d): %s" % field_name, field.max_length, val)
-
-        setattr(obj, field_name, val)
-        obj._changed = True
-        obj._changed_fields.append(field_name)
-
     def _update_fields(self, obj, data, skip_fields=[]):
-        data = data.copy()
-
-        if not hasattr(obj, '_changed_fields'):
-            obj._changed_fields = []
-        obj_fields = list(obj._meta.fields)
-        for d in skip_fields:
-            for f in obj_fields:
-                if f.name == d:
-                    obj_fields.remove(f)
-                    break
-
-        # Make sure object supports all incoming fields
-        field_names = []
-        for field in obj_fields:
-            field_name = field.name
-            if field.is_relation:
-                field_name = field_name + '_id'
-            if field_name not in data:
-                continue
-            self._set_field(obj, field_name, data.pop(field_name))
-
-        if data:
-            raise Exception("%s doesn't support fields %s" % (type(obj), ', '.join(data.keys())))
+        self._update_fields_in_batch([obj], [data], skip_fields)
+
+    def _update_fields_in_batch(self, objs, datas, skip_fields=[]):
+        """
+        Set values to model instances, collecting the changed fields.
+
+        The attribute names of the changed fields are appended to the
+        ``_changed_fields`` list of each instance.
+
+        :type objs: list[django.db.models.Model]
+        :type datas: list[dict]
+        """
+        for (obj, changed) in zip(objs, update_fields(objs, datas, skip_fields)):
+            if not hasattr(obj, '_changed_fields'):
+                obj._changed_fields = []
+            if changed:
+                obj._changed = True
+                obj._changed_fields.extend(changed)
+
+    def _save_if_changed(self, obj, name, syncher=None):
+        if not obj._changed_fields:
+            return
+        self.logger.info('{}: {} (changed: {})'.format(
+            obj.origin_id, name, ', '.join(obj._changed_fields)
+        ))
+        if syncher:
+            syncher.save(obj, obj._changed_fields)
+        elif obj.pk is not None:
+            obj.save(update_fields=obj._changed_fields)
+        else:
+            obj.save()
 
     def _generate_id(self):
         t = datetime.time.time() * 1000000
@@ -113,7 +90,12 @@ class Importer(object):
 
         return membership
 
-    def save_organization(self, obj, info):
+    def save_organization(self, obj, info, syncher=None):
+        self._prepare_organization_info(info)
+        self._update_fields(obj, info)
+        self._save_if_changed(obj, obj.name, syncher)
+
+    def _prepare_organization_info(self, info):
         info.pop('memberships', None)
         info.pop('contact_details', None)
         info['data_source_id'] = self.data_source.id
@@ -128,15 +110,12 @@ class Importer(object):
                 ).id
             info['classification_id'] = classification_id
 
+    def save_post(self, obj, info, syncher=None):
+        self._prepare_post_info(info)
         self._update_fields(obj, info)
+        self._save_if_changed(obj, obj.label, syncher)
 
-        if obj._changed_fields:
-            self.logger.info('{}: {} (changed: {})'.format(
-                obj.origin_id, obj.name, ', '.join(obj._changed_fields)
-            ))
-            obj.save()
-
-    def save_post(self, obj, info):
+    def _prepare_post_info(self, info):
         info.pop('memberships', None)
         info.pop('contact_details', None)
 
@@ -152,19 +131,16 @@ class Importer(object):
                 ).id
             info['classification_id'] = classification_id
 
-        self._update_fields(obj, info)
-
-        if obj._changed_fields:
-            self.logger.info('{}: {} (changed: {})'.format(
-                obj.origin_id, obj.label, ', '.join(obj._changed_fields)
-            ))
-            obj.save()
-
     @transaction.atomic
     def update_organizations(self, orgs):
         org_qs = Organization.objects.filter(data_source=self.data_source).prefetch_related('posts')
-        syncher = ModelSyncher(queryset=org_qs, generate_obj_id=lambda x: x.origin_id, delete_limit=0.1)
+        syncher = ModelSyncher(queryset=org_qs, generate_obj_id=lambda x: x.origin_id, delete_limit=0.1, bulk=True)
 
+        # New parents get their ids when the syncher is flushed, so
+        # their children are linked to them after that
+        unsaved_parents = []
+        objs = []
+        infos = []
         for org_info in orgs:
             org_info = org_info.copy()
             origin_id = org_info.pop('origin_id')
@@ -177,19 +153,39 @@ class Importer(object):
             if parent_id:
                 parent_obj = syncher.get(parent_id)
                 assert parent_obj is not None
-                org_info['parent_id'] = parent_obj.id
-
-            self.save_organization(org_obj, org_info)
+                if parent_obj.id is None:
+                    unsaved_parents.append((org_obj, parent_obj))
+                    del org_info['parent_id']
+                else:
+                    org_info['parent_id'] = parent_obj.id
+
+            self._prepare_organization_info(org_info)
+            objs.append(org_obj)
+            infos.append(org_info)
+
+        self._update_fields_in_batch(objs, infos)
+        for org_obj in objs:
+            self._save_if_changed(org_obj, org_obj.name, syncher)
+
+        syncher.flush()
+        for (org_obj, parent_obj) in unsaved_parents:
+            org_obj._changed_fields = []
+            self._update_fields(org_obj, {'parent_id': parent_obj.id})
+            if org_obj._changed_fields:
+                syncher.save(org_obj, org_obj._changed_fields)
 
         syncher.finish()
+        update_ancestor_ids(Organization, name_field='name')
 
     @transaction.atomic
     def update_posts(self, posts):
         post_qs = Post.objects.filter(data_source=self.data_source)
-        syncher = ModelSyncher(queryset=post_qs, generate_obj_id=lambda x: x.origin_id, delete_limit=0.1)
+        syncher = ModelSyncher(queryset=post_qs, generate_obj_id=lambda x: x.origin_id, delete_limit=0.1, bulk=True)
         org_qs = Organization.objects.filter(data_source=self.data_source)
         orgs_by_id = {x.origin_id: x for x in org_qs}
 
+        objs = []
+        infos = []
         for post in posts:
             post = post.copy()
             origin_id = post.pop('origin_id')
@@ -203,6 +199,12 @@ class Importer(object):
                 org_obj = orgs_by_id[organization_id]
                 post['organization_id'] = org_obj.id
 
-            self.save_post(obj, post)
+            self._prepare_post_info(post)
+            objs.append(obj)
+            infos.append(post)
+
+        self._update_fields_in_batch(objs, infos)
+        for obj in objs:
+            self._save_if_changed(obj, obj.label, syncher)
 
         syncher.finish()
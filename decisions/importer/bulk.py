@@ -0,0 +1,156 @@
+"""
+Helpers for writing many model instances with a few queries.
+"""
+import collections
+
+from django.db import connections, router
+from django.db.models import Case, Value, When
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+DEFAULT_BATCH_SIZE = 500
+
+
+def set_changed_fields(obj, values):
+    """
+    Set the attribute values of a model instance.
+
+    The values are converted to the Python types of the fields before
+    comparing, so that e.g. a date string is not seen as a change of a
+    datetime field.
+
+    :type obj: django.db.models.Model
+    :type values: dict[str,object]
+    :param values: New values by the attribute name, e.g. ``case_id``
+    :rtype: list[str]
+    :return: Names of the attributes which were changed
+    """
+    meta = obj._meta
+    changed = []
+    for (name, value) in values.items():
+        value = _to_python(meta.get_field(name), value)
+        if getattr(obj, name) != value:
+            setattr(obj, name, value)
+            changed.append(name)
+    return changed
+
+
+def _to_python(field, value):
+    value = field.to_python(value)
+    if field.get_internal_type() == 'DateTimeField' and value is not None and timezone.is_naive(value):
+        # The same conversion is done by Django when saving, with a warning
+        value = timezone.make_aware(value)
+    return value
+
+
+def bulk_create(model, objs, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Insert model instances and make sure their primary keys get set.
+
+    Only some databases (e.g. PostgreSQL) return the primary keys from
+    a bulk insert.  On others the instances are saved one by one.
+
+    :type model: type
+    :type objs: list[django.db.models.Model]
+    """
+    if not objs:
+        return
+    connection = connections[router.db_for_write(model)]
+    if connection.features.can_return_ids_from_bulk_insert:
+        model.objects.bulk_create(objs, batch_size=batch_size)
+    else:
+        for obj in objs:
+            obj.save(force_insert=True)
+
+
+def bulk_update(model, objs, fields, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Update given fields of model instances with one query per batch.
+
+    Each batch is written with a single ``UPDATE ... SET field = CASE
+    id WHEN ... END WHERE id IN (...)`` statement.
+
+    :type model: type
+    :type objs: list[django.db.models.Model]
+    :type fields: collections.Iterable[str]
+    :param fields: Names or attribute names of the fields to update
+    """
+    meta = model._meta
+    fields = [meta.get_field(name) for name in sorted(set(fields))]
+    if not objs or not fields:
+        return
+    for start in range(0, len(objs), batch_size):
+        batch = objs[start:start + batch_size]
+        model.objects.filter(pk__in=[obj.pk for obj in batch]).update(**{
+            field.name: Case(*[
+                When(pk=obj.pk, then=Cast(
+                    Value(getattr(obj, field.attname), output_field=field),
+                    output_field=field))
+                for obj in batch])
+            for field in fields
+        })
+
+
+class ModelChanges(object):
+    """
+    Collect new and changed instances of a model to be saved in bulk.
+    """
+
+    def __init__(self, model, data_source=None, counts=None, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Initialize the changes.
+
+        :type model: type
+        :type data_source: decisions.models.DataSource|None
+        :param data_source: Data source to set to the new instances
+        :type counts: collections.Counter|None
+        :param counts:
+          Counter to add the numbers of created and updated instances to,
+          keyed by (model name, 'created'|'updated')
+        :type batch_size: int
+        """
+        self.model = model
+        self.data_source = data_source
+        self.counts = counts if counts is not None else collections.Counter()
+        self.batch_size = batch_size
+        self.new = []
+        self.changed = []
+        self.changed_fields = set()
+
+    def add(self, obj, values, origin_id=None):
+        """
+        Add an instance with given values to be saved.
+
+        :param obj: Existing instance, or None to create a new one
+        :type values: dict[str,object]
+        :param origin_id: Origin id of the instance, if it is new
+        :return: The instance, with the values set
+        """
+        if obj is None:
+            obj = self.model()
+        if obj.pk is None:
+            if self.data_source is not None:
+                obj.data_source = self.data_source
+            if origin_id is not None:
+                obj.origin_id = origin_id
+            set_changed_fields(obj, values)
+            self.new.append(obj)
+            return obj
+        changed_fields = set_changed_fields(obj, values)
+        if changed_fields:
+            self.changed.append(obj)
+            self.changed_fields.update(changed_fields)
+        return obj
+
+    def save(self):
+        """
+        Save the collected instances and start a new collection.
+        """
+        bulk_create(self.model, self.new, self.batch_size)
+        bulk_update(self.model, self.changed, self.changed_fields, self.batch_size)
+        name = self.model.__name__
+        self.counts[(name, 'created')] += len(self.new)
+        self.counts[(name, 'updated')] += len(self.changed)
+        self.new = []
+        self.changed = []
+        self.changed_fields = set()
@@ -0,0 +1,136 @@
+"""
+Comparison of imported values against model instances.
+
+The fields of a model are described once in a table of `FieldInfo`s,
+so that diffing many instances does not look up the model meta for
+every field of every instance.
+"""
+import collections
+import datetime
+import functools
+
+from django.utils.dateparse import parse_datetime
+
+FieldInfo = collections.namedtuple('FieldInfo', [
+    'name', 'attname', 'internal_type', 'max_length', 'compare'])
+
+
+def isclose(a, b, rel_tol=1e-09, abs_tol=0.0):
+    return abs(a - b) <= max(rel_tol * max(abs(a), abs(b)), abs_tol)
+
+
+def compare_default(obj_val, val):
+    """
+    Compare a value of an instance to an imported value.
+
+    :return: The value to set, or the instance value if they are equal
+    """
+    return obj_val if obj_val == val else val
+
+
+def compare_datetime(obj_val, val):
+    if isinstance(obj_val, datetime.datetime):
+        if isinstance(val, str):
+            parsed = parse_datetime(val)
+            if parsed is not None and parsed.tzinfo is not None:
+                return obj_val if obj_val == parsed else val
+            return obj_val if _format_datetime(obj_val) == val else val
+        if isinstance(val, datetime.datetime):
+            val = val.astimezone(obj_val.tzinfo)
+    return compare_default(obj_val, val)
+
+
+def compare_date(obj_val, val):
+    if isinstance(obj_val, datetime.date) and isinstance(val, str):
+        return obj_val if obj_val.isoformat() == val else val
+    return compare_default(obj_val, val)
+
+
+def compare_float(obj_val, val):
+    # If floats are close enough, treat them as the same
+    if isinstance(obj_val, float) and isinstance(val, float) and isclose(obj_val, val):
+        return obj_val
+    return compare_default(obj_val, val)
+
+
+COMPARATORS = {
+    'DateTimeField': compare_datetime,
+    'DateField': compare_date,
+    'FloatField': compare_float,
+}
+
+
+def _format_datetime(value):
+    value = value.isoformat()
+    if value.endswith('000+00:00'):
+        value = value.replace('000+00:00', 'Z')
+    return value
+
+
+@functools.lru_cache(maxsize=None)
+def get_field_table(model, skip_fields=()):
+    """
+    Get descriptions of the concrete fields of a model.
+
+    :type model: type
+    :type skip_fields: tuple[str]
+    :param skip_fields: Names of the fields to leave out
+    :rtype: dict[str,FieldInfo]
+    :return: Field descriptions by the attribute name, e.g. ``parent_id``
+    """
+    table = collections.OrderedDict()
+    for field in model._meta.fields:
+        if field.name in skip_fields:
+            continue
+        internal_type = field.get_internal_type()
+        table[field.attname] = FieldInfo(
+            name=field.name,
+            attname=field.attname,
+            internal_type=internal_type,
+            max_length=field.max_length if internal_type == 'CharField' else None,
+            compare=COMPARATORS.get(internal_type, compare_default),
+        )
+    return table
+
+
+def update_fields(objs, values, skip_fields=()):
+    """
+    Set imported values to model instances and tell what changed.
+
+    All instances must be of the same model.  The values of the fields
+    are compared so that e.g. an ISO formatted timestamp equal to the
+    value of a datetime field is not seen as a change.
+
+    :type objs: list[django.db.models.Model]
+    :type values: list[dict[str,object]]
+    :param values: Values for each instance by the attribute name
+    :type skip_fields: collections.Iterable[str]
+    :param skip_fields: Names of the fields which may not be updated
+    :rtype: list[list[str]]
+    :return: Attribute names of the changed fields of each instance,
+      e.g. for ``save(update_fields=...)``
+    :raises Exception: If a value has no field or is too long for it
+    """
+    if not objs:
+        return []
+    model = type(objs[0])
+    table = get_field_table(model, tuple(skip_fields))
+    result = []
+    for (obj, data) in zip(objs, values):
+        unsupported = [name for name in data if name not in table]
+        if unsupported:
+            raise Exception("%s doesn't support fields %s" % (model, ', '.join(unsupported)))
+
+        changed = []
+        for (name, val) in data.items():
+            info = table[name]
+            obj_val = getattr(obj, name)
+            new_val = info.compare(obj_val, val)
+            if new_val is obj_val:
+                continue
+            if info.max_length is not None and new_val is not None and len(new_val) > info.max_length:
+                raise Exception("field '%s' too long (max. %d): %s" % (info.name, info.max_length, new_val))
+            setattr(obj, name, new_val)
+            changed.append(name)
+        result.append(changed)
+    return result
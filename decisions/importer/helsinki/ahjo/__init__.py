@@ -1,3 +1,4 @@
+from .cache import ArchiveCache, ListingCache
 from .db_importer import DatabaseImporter
 from .docinfo import DocumentInfo
 from .document import Document
@@ -5,9 +6,11 @@ from .scanner import Scanner, scan_dir
 from .xmlparser import parse_xml
 
 __all__ = [
+    'ArchiveCache',
     'DatabaseImporter',
     'Document',
     'DocumentInfo',
+    'ListingCache',
     'Scanner',
     'parse_xml',
     'scan_dir',
@@ -0,0 +1,287 @@
+"""
+Throughput benchmark of the Ahjo XML parser.
+
+The benchmark generates a corpus of synthetic, but structurally
+realistic, Poytakirja documents and measures the parsing, the schema
+validation and the JSON serialization of them separately.
+"""
+import datetime
+import itertools
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+import timeit
+
+from lxml import etree
+
+from .document import Document
+from .xmlparser import (
+    ParseContext, XmlParser, _parse_localized_datetime, parse_guid, parse_xml)
+
+FIRST_NAMES = [
+    'Anna', 'Elina', 'Hannu', 'Jussi', 'Kaisa', 'Laura', 'Markku', 'Mikko',
+    'Pekka', 'Riikka', 'Sari', 'Tuomas', 'Veera', 'Ville']
+LAST_NAMES = [
+    'Heinonen', 'Hämäläinen', 'Korhonen', 'Laine', 'Mäkinen', 'Nieminen',
+    'Rantanen', 'Saarinen', 'Salminen', 'Virtanen']
+WORDS = (
+    'kaupunginhallitus päättää esittää kaupunginvaltuustolle että '
+    'asemakaavan muutos hyväksytään liitteen mukaisena ja talousarvion '
+    'määräraha myönnetään rakennusviraston käytettäväksi vuonna').split()
+
+
+def generate_minutes(actions=20, attendees=15, attachments=2, xhtml_sections=1,
+                     paragraphs=5, seed=0):
+    """
+    Generate a synthetic Ahjo minutes document.
+
+    :type actions: int
+    :param actions: Number of actions (Paatos elements)
+    :type attendees: int
+    :param attendees: Number of attendees of the meeting
+    :type attachments: int
+    :param attachments: Number of attachments per action
+    :type xhtml_sections: int
+    :param xhtml_sections: Number of embedded XHTML tables per action
+    :type paragraphs: int
+    :param paragraphs: Number of text paragraphs per action
+    :type seed: int
+    :param seed: Seed of the random generator for repeatable output
+    :rtype: bytes
+    :return: The document as UTF-8 encoded XML
+    """
+    rnd = random.Random(seed)
+    date = datetime.date(2016, 1, 1) + datetime.timedelta(days=rnd.randrange(365))
+
+    def text(words):
+        return ' '.join(rnd.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+    def guid():
+        return '{{{:08X}-{:04X}-{:04X}-{:04X}-{:012X}}}'.format(
+            rnd.getrandbits(32), rnd.getrandbits(16), rnd.getrandbits(16),
+            rnd.getrandbits(16), rnd.getrandbits(48))
+
+    def sub(parent, tag, value=None):
+        el = etree.SubElement(parent, tag)
+        if value is not None:
+            el.text = str(value)
+        return el
+
+    root = etree.Element('Poytakirja')
+    header = sub(root, 'YlatunnisteSektio')
+    sub(header, 'Paattaja', 'Kaupunginhallitus')
+    sub(header, 'Asiakirjatunnus', 'Pöytäkirja {}/{}'.format(seed + 1, date.year))
+    sub(header, 'Paivays', date.isoformat())
+
+    cover = sub(sub(root, 'PkKansilehtiSektio'), 'KansilehtiToisto')
+    group = sub(sub(cover, 'Lasnaolotiedot'), 'Osallistujaryhma')
+    sub(group, 'OsallistujaryhmaOtsikko', 'Jäsenet')
+    for num in range(attendees):
+        attendee = sub(group, 'Osallistujat')
+        sub(attendee, 'Nimi', '{}, {}'.format(rnd.choice(LAST_NAMES), rnd.choice(FIRST_NAMES)))
+        sub(attendee, 'Titteli', 'jäsen')
+        if num == 0:
+            sub(sub(attendee, 'OsallistujaOptiot'), 'Rooli', 'puheenjohtaja')
+    meeting = sub(cover, 'Kokoustiedot')
+    sub(meeting, 'Kokouspaikka', 'Kaupungintalo')
+    sub(meeting, 'Kokousaika', '{:%d.%m.%Y} 16:00 - 19:30'.format(date))
+
+    decisions = sub(root, 'Paatokset')
+    for num in range(actions):
+        action = sub(decisions, 'Paatos')
+        metadata = sub(action, 'KuvailutiedotOpenDocument')
+        sub(metadata, 'Otsikko', text(8))
+        sub(metadata, 'Tehtavaluokka', '{:02d} {:02d} {:02d} {}'.format(
+            rnd.randrange(15), rnd.randrange(10), rnd.randrange(10), text(3)))
+        sub(metadata, 'AsiaGuid', guid())
+        sub(metadata, 'Paatospaiva', '{:%d.%m.%Y} 16:00:00'.format(date))
+        sub(metadata, 'Pykala', num + 1)
+        sub(sub(metadata, 'Dnro'), 'DnroLyhyt', 'HEL {}-{:06d}'.format(
+            date.year, rnd.randrange(1000000)))
+        sub(metadata, 'Asiakirjantila', 'Hyväksytty')
+
+        section = sub(sub(action, 'SisaltoSektioToisto'), 'SisaltoSektio')
+        sub(section, 'SisaltoOtsikko', 'Päätös')
+        level = sub(sub(section, 'TekstiSektio'), 'taso1')
+        sub(level, 'Otsikko', text(4))
+        for _ in range(paragraphs):
+            sub(sub(level, 'Kappale'), 'KappaleTeksti', text(rnd.randrange(20, 80)))
+        for _ in range(xhtml_sections):
+            table = sub(sub(level, 'XHTML'), 'table')
+            for row_num in range(rnd.randrange(3, 10)):
+                row = sub(table, 'tr')
+                for _ in range(4):
+                    sub(row, 'th' if row_num == 0 else 'td', text(2))
+
+        attachment_list = sub(sub(action, 'LiitteetOptio'), 'Liitteet')
+        for attachment_num in range(attachments):
+            attachment = sub(attachment_list, 'LiitteetToisto')
+            sub(attachment, 'Liiteteksti', text(5))
+            sub(attachment, 'JulkaisuKytkin', 'true')
+            sub(attachment, 'LiitteetId', guid())
+            sub(attachment, 'Liitenumero', attachment_num + 1)
+
+    signatures = sub(root, 'SahkoinenAllekirjoitusSektio')
+    sub(sub(signatures, 'PuheenjohtajaSektio'), 'Puheenjohtajanimi', 'Puheenjohtaja')
+
+    return etree.tostring(root, xml_declaration=True, encoding='utf-8')
+
+
+def run_benchmark(documents=20, streaming=True, micro=False, **generator_kwargs):
+    """
+    Run the parser benchmark.
+
+    :type documents: int
+    :param documents: Number of documents in the generated corpus
+    :type streaming: bool
+    :param streaming: Use the streaming mode of the parser
+    :type micro: bool
+    :param micro: Also run `run_micro_benchmark`
+    :param generator_kwargs: Arguments for `generate_minutes`
+    :rtype: dict
+    :return:
+      The parameters and results of the benchmark.  Results of each
+      phase contain the time spent, documents per second and megabytes
+      of XML per second.
+    """
+    directory = tempfile.mkdtemp(prefix='ahjo-benchmark-')
+    try:
+        filenames = []
+        total_bytes = 0
+        for num in range(documents):
+            filename = os.path.join(directory, '{}.xml'.format(num))
+            with open(filename, 'wb') as fp:
+                total_bytes += fp.write(generate_minutes(seed=num, **generator_kwargs))
+            filenames.append(filename)
+
+        # Validation is measured as a phase of its own
+        validate_every = Document.validate_every
+        Document.validate_every = 0
+        try:
+            (parsed, parse_time) = _timed(
+                lambda: [parse_xml(x, streaming=streaming) for x in filenames])
+        finally:
+            Document.validate_every = validate_every
+        (_, validate_time) = _timed(lambda: [x.validate() for x in parsed])
+        (_, as_json_time) = _timed(lambda: [x.as_json() for x in parsed])
+    finally:
+        shutil.rmtree(directory)
+
+    phases = [('parse', parse_time), ('validate', validate_time), ('as_json', as_json_time)]
+    phases.append(('total', sum(seconds for (_name, seconds) in phases)))
+    result = {
+        'revision': _get_revision(),
+        'date': datetime.datetime.utcnow().isoformat(),
+        'parameters': dict(generator_kwargs, documents=documents, streaming=streaming),
+        'bytes': total_bytes,
+        'results': {
+            name: {
+                'seconds': seconds,
+                'docs_per_second': documents / seconds if seconds else None,
+                'mb_per_second': total_bytes / 1e6 / seconds if seconds else None,
+            }
+            for (name, seconds) in phases
+        },
+        # Kilobytes on Linux
+        'peak_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+    if micro:
+        result['micro'] = run_micro_benchmark()
+    return result
+
+
+def run_micro_benchmark(number=2000):
+    """
+    Measure the per-call cost of the helpers run for every action.
+
+    The shape based and the strptime based parsing of timestamps, which
+    are the fast path and the fallback of `XmlParser.parse_datetime`,
+    are measured separately for a comparison.  Every call parses a
+    distinct timestamp and the timestamp cache is cleared first, so
+    that the parsing rather than the cache is measured.
+
+    :type number: int
+    :param number: Number of calls to time for each helper
+    :rtype: dict[str,float]
+    :return: Microseconds per call by the name of the helper
+    """
+    document = etree.fromstring(generate_minutes(actions=1, attendees=0))
+    action = document.find('Paatokset/Paatos')
+    parser = XmlParser()
+    ctx = ParseContext('benchmark')
+    timestamps = _generate_timestamps(number)
+    helpers = {
+        'parse_datetime': lambda: XmlParser.parse_datetime(next(timestamps)),
+        'parse_datetime_by_shape': lambda: XmlParser._parse_datetime_by_shape(next(timestamps)),
+        'parse_datetime_by_strptime': lambda: XmlParser._parse_datetime_by_formats(next(timestamps)),
+        'parse_funcid': lambda: XmlParser.parse_funcid('00 00 03 Valtuuston aloitetoiminta'),
+        'parse_guid': lambda: parse_guid('{0DC9A5F0-6A8E-4B6E-9B2E-3A8F1C2D4E5F}'),
+        'import_action': lambda: parser.import_action(ctx, action),
+    }
+    _parse_localized_datetime.cache_clear()
+    return {
+        name: timeit.timeit(func, number=number) / number * 1e6
+        for (name, func) in helpers.items()
+    }
+
+
+def _generate_timestamps(count):
+    """
+    Generate distinct timestamps in the formats of the Ahjo documents.
+
+    :type count: int
+    :return: Endless iterator repeating the `count` timestamps
+    :rtype: collections.Iterator[str]
+    """
+    start = datetime.datetime(2016, 1, 1, 8, 0)
+    timestamps = []
+    for num in range(count):
+        value = start + datetime.timedelta(days=num // 48, minutes=15 * (num % 48))
+        if num % 2:
+            timestamps.append('{:%d.%m.%Y %H:%M:%S}'.format(value))
+        else:
+            timestamps.append('{}/{}/{} {}:{:%M:%S %p}'.format(
+                value.month, value.day, value.year, value.hour % 12 or 12, value))
+    return itertools.cycle(timestamps)
+
+
+def save_result(filename, result):
+    """
+    Append a benchmark result to a JSON file of earlier results.
+
+    :type filename: str
+    :type result: dict
+    :rtype: dict|None
+    :return: The latest earlier result with the same parameters
+    """
+    try:
+        with open(filename, 'r', encoding='utf-8') as fp:
+            history = json.load(fp)
+    except FileNotFoundError:
+        history = []
+    previous = [x for x in history if x['parameters'] == result['parameters']]
+    history.append(result)
+    with open(filename, 'w', encoding='utf-8') as fp:
+        json.dump(history, fp, indent=2, sort_keys=True)
+    return previous[-1] if previous else None
+
+
+def _timed(func):
+    start = time.perf_counter()
+    value = func()
+    return (value, time.perf_counter() - start)
+
+
+def _get_revision():
+    try:
+        output = subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(__file__), stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.decode('ascii').strip()
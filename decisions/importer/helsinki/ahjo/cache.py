@@ -0,0 +1,294 @@
+import collections
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+import dateutil.parser
+
+from .parse_dirlist import DirEntry
+
+LOG = logging.getLogger(__name__)
+
+
+class ListingCache(object):
+    """
+    On-disk cache of Ahjo directory listings.
+
+    Every listing is stored as a JSON file named by the hash of its
+    path.  The file contains the parsed dir entries together with the
+    ETag and Last-Modified validators of the response, so that the
+    listing can be revalidated with a conditional GET.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, path):
+        """
+        Get cached listing of given path.
+
+        :type path: str
+        :rtype: CachedListing|None
+        """
+        data = self._read(self._get_filename('listing', path))
+        if data is None:
+            return None
+        return CachedListing(
+            etag=data['etag'],
+            last_modified=data['last_modified'],
+            dir_entries=[DirEntry(href, text) for (href, text) in data['entries']])
+
+    def set(self, path, dir_entries, etag=None, last_modified=None):
+        """
+        Store listing of given path.
+
+        :type path: str
+        :type dir_entries: list[DirEntry]
+        :type etag: str|None
+        :type last_modified: str|None
+        """
+        self._write(self._get_filename('listing', path), {
+            'path': path,
+            'etag': etag,
+            'last_modified': last_modified,
+            'entries': [[x.href, x.preceeding_text] for x in dir_entries],
+        })
+
+    def get_last_scan(self, root):
+        """
+        Get the start time of the last successful scan of given root.
+
+        :type root: str
+        :rtype: datetime.datetime|None
+        """
+        data = self._read(self._get_filename('scan', root))
+        return dateutil.parser.parse(data['started_at']) if data else None
+
+    def set_last_scan(self, root, started_at):
+        """
+        Record a successful scan of given root.
+
+        :type root: str
+        :type started_at: datetime.datetime
+        """
+        self._write(self._get_filename('scan', root), {
+            'root': root,
+            'started_at': started_at.isoformat(),
+        })
+
+    def _get_filename(self, kind, path):
+        digest = hashlib.sha1(path.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, '{}-{}.json'.format(kind, digest))
+
+    def _read(self, filename):
+        try:
+            with open(filename, 'r', encoding='utf-8') as fp:
+                return json.load(fp)
+        except (IOError, ValueError):
+            return None
+
+    def _write(self, filename, data):
+        # Write to a temporary file first so that concurrent scanner
+        # threads never see a half-written entry
+        (fd, temp_filename) = tempfile.mkstemp(dir=self.directory)
+        try:
+            with open(fd, 'w', encoding='utf-8') as fp:
+                json.dump(data, fp)
+            os.replace(temp_filename, filename)
+        except BaseException:
+            os.unlink(temp_filename)
+            raise
+
+
+class CachedListing(object):
+    def __init__(self, etag, last_modified, dir_entries):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.dir_entries = dir_entries
+
+    @property
+    def has_subdirs(self):
+        return any(x.type == 'dir' for x in self.dir_entries)
+
+    def get_validator_headers(self):
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class ArchiveCache(object):
+    """
+    Local content-addressed cache of Ahjo document archives.
+
+    Archives are keyed by their path and modification time text, so a
+    document changed on the server is never served from the cache.  The
+    least recently used archives are evicted when the total size of the
+    cache exceeds the given maximum.
+    """
+
+    def __init__(self, directory, max_size=None):
+        """
+        Initialize an archive cache.
+
+        :type directory: str
+        :type max_size: int|None
+        :param max_size: Maximum total size of the cached archives in bytes
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._total_size = sum(size for (_path, size, _atime) in self._scan())
+
+    def get(self, path, version):
+        """
+        Get the filename of a cached archive.
+
+        :type path: str
+        :type version: str
+        :rtype: str|None
+        """
+        filename = self._get_filename(path, version)
+        try:
+            os.utime(filename)  # Mark as recently used
+        except FileNotFoundError:
+            return None
+        return filename
+
+    def fetch(self, path, version, download):
+        """
+        Get the filename of an archive, downloading it on a cache miss.
+
+        :type path: str
+        :type version: str
+        :type download: function
+        :param download: Function writing the archive to a file object
+        :rtype: str
+        """
+        filename = self.get(path, version)
+        if filename:
+            LOG.debug("Archive cache hit: %s", path)
+            return filename
+
+        filename = self._get_filename(path, version)
+        (fd, temp_filename) = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with open(fd, 'wb') as fp:
+                download(fp)
+            size = os.path.getsize(temp_filename)
+            os.replace(temp_filename, filename)
+        except BaseException:
+            os.unlink(temp_filename)
+            raise
+
+        with self._lock:
+            self._total_size += size
+            if self.max_size is not None and self._total_size > self.max_size:
+                self._evict(keep=filename)
+        return filename
+
+    def _evict(self, keep):
+        entries = sorted(self._scan(), key=(lambda x: x[2]))
+        # Other processes may share the directory, so trust the disk
+        # over the running total
+        self._total_size = sum(size for (_filename, size, _atime) in entries)
+        for (filename, size, _atime) in entries:
+            if self._total_size <= self.max_size:
+                break
+            if filename == keep:
+                continue
+            try:
+                os.unlink(filename)
+            except FileNotFoundError:
+                pass
+            self._total_size -= size
+            LOG.debug("Evicted from archive cache: %s", filename)
+
+    def _scan(self):
+        for name in os.listdir(self.directory):
+            if not name.endswith('.zip'):
+                continue
+            filename = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(filename)
+            except FileNotFoundError:  # Evicted by another process
+                continue
+            yield (filename, stat.st_size, stat.st_mtime)
+
+    def _get_filename(self, path, version):
+        key = '{}\n{}'.format(path, version).encode('utf-8')
+        return os.path.join(self.directory, hashlib.sha1(key).hexdigest() + '.zip')
+
+
+class IdentityCache(object):
+    """
+    In-memory cache of model instances by their identifier.
+
+    The cache may be bounded to a maximum number of items, in which case
+    the least recently used items are dropped.  Hits and misses are
+    counted for logging the efficiency of the cache.
+    """
+
+    def __init__(self, name, items=(), max_size=None):
+        """
+        Initialize an identity cache.
+
+        :type name: str
+        :param name: Name of the cache for the statistics
+        :type items: collections.Iterable[(object, object)]
+        :param items: (Key, value) pairs to preload the cache with
+        :type max_size: int|None
+        :param max_size: Maximum number of items to keep in the cache
+        """
+        self.name = name
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._items = collections.OrderedDict()
+        for (key, value) in items:
+            self.set(key, value)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get_or_create(self, key, create):
+        """
+        Get an item from the cache, creating it on a cache miss.
+
+        :param key: Key of the item
+        :type create: function
+        :param create: Function returning the value of a missing item
+        """
+        try:
+            value = self._items[key]
+        except KeyError:
+            self.misses += 1
+            value = create()
+            self.set(key, value)
+            return value
+        self.hits += 1
+        self._items.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        self._items[key] = value
+        self._items.move_to_end(key)
+        if self.max_size is not None and len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def log_stats(self):
+        total = self.hits + self.misses
+        LOG.info(
+            "%s cache: %d hits, %d misses (%.1f%% hit rate), %d items",
+            self.name, self.hits, self.misses,
+            (100.0 * self.hits / total) if total else 0.0, len(self))
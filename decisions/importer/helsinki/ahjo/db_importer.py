@@ -1,3 +1,4 @@
+import collections
 import logging
 
 from django.db import transaction
@@ -5,22 +6,70 @@ from django.db import transaction
 from ....models import (
     Action, Case, Content, DataSource, Event, Function, ImportedFile,
     Organization, Post, OrganizationClass, Person, Attachment)
+from ...bulk import ModelChanges, bulk_create, bulk_update
+from ...hierarchy import update_ancestor_ids
+from .cache import IdentityCache
 from .importer import ChangeImporter
 
 LOG = logging.getLogger(__name__)
 
+# Number of imported versions to collect before writing them
+IMPORTED_VERSION_BATCH_SIZE = 500
+
 
 class DatabaseImporter(ChangeImporter):
     """
     Importer that imports from Ahjo to the database.
     """
-    def __init__(self, data_source=None):
+
+    def __init__(self, data_source=None, scanner=None, workers=1, bulk=False,
+                 identity_cache_size=None):
+        """
+        Initialize the importer.
+
+        :type data_source: DataSource|None
+        :type scanner: .scanner.Scanner|None
+        :type workers: int
+        :type bulk: bool
+        :param bulk:
+          Write the cases, actions, contents and attachments of each
+          document with bulk queries instead of one by one
+        :type identity_cache_size: int|None
+        :param identity_cache_size:
+          Maximum number of persons and functions to keep in memory
+          for resolving them without queries, or None for no limit
+        """
+        super(DatabaseImporter, self).__init__(scanner, workers)
+        self.bulk = bulk
+        self.counts = collections.Counter()
         if data_source is None:
             (data_source, _created) = DataSource.objects.get_or_create(
                 identifier='helsinki', defaults={'name': 'Helsinki'})
         self.data_source = data_source
         self.orgs_by_id = {x.origin_id: x for x in Organization.objects.filter(data_source=data_source)}
         self.posts_by_id = {x.origin_id: x for x in Post.objects.filter(data_source=data_source)}
+        self.persons_by_id = IdentityCache('Person', (
+            (x.origin_id, x) for x in Person.objects.filter(data_source=data_source)
+        ), max_size=identity_cache_size)
+        self.functions_by_id = IdentityCache('Function', (
+            (x.function_id, x) for x in Function.objects.filter(data_source=data_source)
+        ), max_size=identity_cache_size)
+        self.imported_files = {
+            x.path: x for x in ImportedFile.objects.filter(data_source=data_source)}
+        self._unsaved_imported_files = {}
+
+    def import_changes(self, *args, **kwargs):
+        try:
+            super(DatabaseImporter, self).import_changes(*args, **kwargs)
+        finally:
+            # Versions of the documents imported before a failure are
+            # still valid, since every document is imported atomically
+            self._save_imported_versions()
+        update_ancestor_ids(Function, name_field='name', code_field='function_id')
+        self.persons_by_id.log_stats()
+        self.functions_by_id.log_stats()
+        if self.bulk:
+            _log_counts("Bulk import totals", self.counts)
 
     def should_import(self, doc_info):
         # Currently only "minutes" are imported, "agenda" is not.
@@ -29,40 +78,55 @@ class DatabaseImporter(ChangeImporter):
             LOG.debug("Skipping %s: %s", doc_info.doc_type, doc_info.origin_id)
         return should_import
 
-    def _import_single(self, doc_info):
+    def _import_changed(self, doc_info, old_version, document=None):
         with transaction.atomic():
-            super(DatabaseImporter, self)._import_single(doc_info)
+            super(DatabaseImporter, self)._import_changed(doc_info, old_version, document)
 
     def get_imported_version(self, doc_info):
-        imported_file = ImportedFile.objects.filter(
-            data_source=self.data_source, path=doc_info.path).first()
+        imported_file = self.imported_files.get(doc_info.path)
         return imported_file.imported_version if imported_file else None
 
     def set_imported_version(self, doc_info, version):
-        ImportedFile.objects.update_or_create(
-            data_source=self.data_source, path=doc_info.path, defaults={
-                'imported_version': version})
+        imported_file = self.imported_files.get(doc_info.path)
+        if imported_file is None:
+            imported_file = ImportedFile(data_source=self.data_source, path=doc_info.path)
+            self.imported_files[doc_info.path] = imported_file
+        imported_file.imported_version = version
+        self._unsaved_imported_files[doc_info.path] = imported_file
+        if len(self._unsaved_imported_files) >= IMPORTED_VERSION_BATCH_SIZE:
+            self._save_imported_versions()
 
-    def handle_document_changed(self, doc_info):
+    def _save_imported_versions(self):
+        unsaved = list(self._unsaved_imported_files.values())
+        self._unsaved_imported_files = {}
+        with transaction.atomic():
+            bulk_create(ImportedFile, [x for x in unsaved if x.pk is None])
+            bulk_update(ImportedFile, [x for x in unsaved if x.pk is not None],
+                        ['imported_version'])
+
+    def handle_document_changed(self, doc_info, document=None):
         """
         Handle document change or a new document.
 
         Import or update the data from the document to the database.
 
         :type doc_info: .docinfo.DocumentInfo
+        :type document: .document.Document|None
+        :param document: The document if it was loaded in the parse pool
         """
         LOG.info("Updating data from %s", doc_info.origin_id)
-        doc = doc_info.get_document()
-        doc.attachments = doc_info.open_attachments()
-        self._import_document(doc_info, doc)
-        for attachment in doc.attachments:
-            attachment.close()
+        if document is None:
+            document = self.document_loader(doc_info)
+        self._import_document(doc_info, document)
 
     def _import_document(self, doc_info, doc):
         # Skip office-holder documents for now
         event = self._import_event(doc_info, doc)
         self._import_attendees(doc, event)
-        self._import_actions(doc, event)
+        if self.bulk:
+            self._import_actions_in_bulk(doc, event)
+        else:
+            self._import_actions(doc, event)
 
     def _import_event(self, doc_info, doc):
         policymaker_id = doc_info.policymaker_id
@@ -108,13 +172,18 @@ class DatabaseImporter(ChangeImporter):
         event.attendees.exclude(pk__in=imported_attendees).delete()
 
     def _get_or_create_person(self, data):
+        origin_id = '{name}/{title}'.format(
+            name=data.name, title=(data.title or ''))
+        return self.persons_by_id.get_or_create(
+            origin_id, lambda: self._query_person(origin_id, data))
+
+    def _query_person(self, origin_id, data):
         names = data.name.split(None, 1) or ['']
         first_name = names[0] if len(names) >= 2 else ''
         last_name = names[-1]
         (person, created) = Person.objects.get_or_create(
             data_source=self.data_source,
-            origin_id='{name}/{title}'.format(
-                name=data.name, title=(data.title or '')),
+            origin_id=origin_id,
             defaults={
                 'name': data.name,
                 'given_name': first_name,
@@ -153,6 +222,10 @@ class DatabaseImporter(ChangeImporter):
     def _get_or_create_function(self, data):
         if not data.function_id:
             return None
+        return self.functions_by_id.get_or_create(
+            data.function_id, lambda: self._query_function(data))
+
+    def _query_function(self, data):
         (function, created) = Function.objects.get_or_create(
             data_source=self.data_source,
             function_id=data.function_id,
@@ -182,7 +255,6 @@ class DatabaseImporter(ChangeImporter):
                 # the attachment might be removed and we have to remove the file accordingly
                 file = None
             _log_update_or_create(attachment, created, logging.INFO)
-            return attachment
 
     def _import_action(self, action_data, event, num, case):
         defaults = {
@@ -214,6 +286,113 @@ class DatabaseImporter(ChangeImporter):
             defaults=defaults)
         _log_update_or_create(content, created)
 
+    def _import_actions_in_bulk(self, doc, event):
+        """
+        Import the actions of a document with bulk queries.
+
+        The existing cases, actions, contents and attachments are loaded
+        with one query per model and compared to the document.  Only new
+        and changed rows are written.
+        """
+        counts = collections.Counter()
+        actions_data = list(doc.event.actions or [])
+        cases = self._bulk_import_cases(actions_data, counts)
+
+        action_ids = ['{}:{}'.format(event.origin_id, num)
+                      for num in range(len(actions_data))]
+        existing = {x.origin_id: x for x in Action.objects.filter(
+            data_source=self.data_source, origin_id__in=action_ids)}
+        actions = []
+        changes = ModelChanges(Action, self.data_source, counts)
+        for (num, (origin_id, action_data)) in enumerate(zip(action_ids, actions_data)):
+            case = cases.get(action_data.register_id)
+            values = {
+                'case_id': case.pk if case else None,
+                'title': action_data.title,
+                'ordering': num,
+                'resolution': action_data.resolution or '',
+                'event_id': event.pk,
+                'article_number': str(action_data.article_number or ''),
+                'post_id': event.post_id,
+            }
+            actions.append(changes.add(existing.get(origin_id), values, origin_id))
+        changes.save()
+
+        # Delete all old non-updated actions (if there is any)
+        (_total, deleted) = event.actions.exclude(
+            pk__in=[x.pk for x in actions]).delete()
+        for (label, count) in deleted.items():
+            counts[(label.rsplit('.', 1)[-1], 'deleted')] += count
+
+        self._bulk_import_contents(actions_data, actions, counts)
+        self._bulk_import_attachments(actions_data, actions, counts)
+        _log_counts("Bulk import of {}".format(event.origin_id), counts)
+        self.counts.update(counts)
+
+    def _bulk_import_cases(self, actions_data, counts):
+        values_by_register_id = collections.OrderedDict()
+        for action_data in actions_data:
+            if action_data.register_id:
+                function = self._get_or_create_function(action_data)
+                values_by_register_id[action_data.register_id] = {
+                    'title': action_data.title,
+                    'function_id': function.pk if function else None,
+                }
+        existing = {x.register_id: x for x in Case.objects.filter(
+            data_source=self.data_source,
+            register_id__in=list(values_by_register_id))}
+        changes = ModelChanges(Case, self.data_source, counts)
+        cases = {}
+        for (register_id, values) in values_by_register_id.items():
+            case = existing.get(register_id)
+            if case is None:
+                case = Case(register_id=register_id)
+            cases[register_id] = changes.add(case, values)
+        changes.save()
+        return cases
+
+    def _bulk_import_contents(self, actions_data, actions, counts):
+        existing = {
+            (x.action_id, x.origin_id): x for x in Content.objects.filter(
+                data_source=self.data_source, action__in=actions)}
+        changes = ModelChanges(Content, self.data_source, counts)
+        for (action_data, action) in zip(actions_data, actions):
+            content = existing.get((action.pk, action.origin_id))
+            if content is None:
+                content = Content(action=action)
+            changes.add(content, {
+                'hypertext': action_data.content,
+                'type': 'decision',  # XXX
+                'ordering': 1,
+            }, action.origin_id)
+        changes.save()
+
+    def _bulk_import_attachments(self, actions_data, actions, counts):
+        existing = {
+            (x.action_id, x.origin_id): x for x in Attachment.objects.filter(
+                data_source=self.data_source, action__in=actions)}
+        changes = ModelChanges(Attachment, self.data_source, counts)
+        for (action_data, action) in zip(actions_data, actions):
+            for attachment_data in (action_data.attachments or []):
+                origin_id = attachment_data['id'] or ''
+                attachment = existing.get((action.pk, origin_id))
+                if attachment is None:
+                    attachment = Attachment(action=action)
+                changes.add(attachment, {
+                    'name': attachment_data['name'] or '',
+                    'public': attachment_data['public'],
+                    'number': attachment_data['ordering'],
+                    'confidentiality_reason': attachment_data['confidentiality_reason'],
+                }, origin_id)
+        changes.save()
+
+
+def _log_counts(title, counts):
+    LOG.info("%s: %s", title, ', '.join(
+        '{} {} {}'.format(count, name, change)
+        for ((name, change), count) in sorted(counts.items()) if count
+    ) or "no changes")
+
 
 def _log_update_or_create(obj, created, level=logging.DEBUG):
     if created:
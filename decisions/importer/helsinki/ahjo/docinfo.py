@@ -1,16 +1,25 @@
 import contextlib
 import logging
 import re
+import tempfile
 import zipfile
 
-import httpio
+import requests
 from django.utils.functional import cached_property
 
 from .parse_dirlist import parse_file_path
-from .xmlparser import parse_xml, parse_guid, GUID_REGEX
+from .xmlparser import GUID_RX, parse_guid, parse_xml
 
 LOG = logging.getLogger(__name__)
 
+# Archives larger than this are spooled to a temporary file on disk
+MAX_IN_MEMORY_ARCHIVE_SIZE = 16 * 1024 * 1024
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Some archives have the XML file without the extension, e.g. "...xml_"
+MISNAMED_XML_RX = re.compile(r'\w+\d+xml_')
+
 
 class _DocumentInfoDataProperty(object):
     def __init__(self, name):
@@ -23,17 +32,35 @@ class _DocumentInfoDataProperty(object):
 
 
 class DocumentInfo(object):
-    def __init__(self, dir_entry, base_url, tz):
+    def __init__(self, dir_entry, base_url, tz, session=None, timeout=None,
+                 archive_cache=None, offline=False, streaming_parse=False):
         """
         Initialize document info from directory entry.
 
         :type dir_entry: .parse_dirlist.DirEntry
         :type base_url: str
         :type tz: pytz.tzinfo.DstTzInfo|pytz.tzinfo.StaticTzInfo
+        :type session: requests.Session|None
+        :param session: HTTP session to download the document with
+        :type timeout: float|(float, float)|None
+        :param timeout: Timeout of the download request
+        :type archive_cache: .cache.ArchiveCache|None
+        :param archive_cache: Local cache to read the archive from
+        :type offline: bool
+        :param offline: Only read the archive from the cache
+        :type streaming_parse: bool
+        :param streaming_parse:
+          Parse the document XML in the streaming mode of the parser
+          instead of building the full tree first
         """
         self.dir_entry = dir_entry
         self.base_url = base_url
         self.tz = tz
+        self.session = session
+        self.timeout = timeout
+        self.archive_cache = archive_cache
+        self.offline = offline
+        self.streaming_parse = streaming_parse
         self.path = dir_entry.href
         self.url = base_url + self.path
         self._data = self._parse_path(self.path)
@@ -70,57 +97,110 @@ class DocumentInfo(object):
     def mtime_text(self):
         return self.dir_entry.mtime_text
 
-    def get_document(self):
+    def get_document(self, archive=None):
         """
         Get the parsed Ahjo document of this document info.
 
+        :type archive: zipfile.ZipFile|None
+        :param archive:
+          The archive opened with `open_archive`.  If not given, the
+          archive is downloaded just for parsing the document.
         :rtype: Document
         """
-        with self._open_remote_xml_file() as xml_file:
-            document = parse_xml(xml_file)
+        if archive is None:
+            with self.open_archive() as archive:
+                return self.get_document(archive)
+        with self._open_xml_file_from_zip(archive) as xml_file:
+            document = parse_xml(xml_file, streaming=self.streaming_parse)
         return document
 
-    def open_attachments(self):
+    def load_document(self):
+        """
+        Download and parse the document with its attachment names.
+
+        The attachments of the returned document are the names of the
+        archive members rather than open files, so that the document
+        can be passed between processes.
+
+        :rtype: Document
         """
-        Open the attachment binaries of this document info.
+        with self.open_archive() as archive:
+            document = self.get_document(archive)
+            document.attachments = self.get_attachment_names(archive)
+        return document
 
-        :rtype: Array
+    def get_attachment_names(self, archive):
         """
-        attachments = {}
-        for attachment in self._open_remote_attachments():
-            # save attachment reference under parsed guid
-            guid = re.search(GUID_REGEX, attachment.name).group(0)
-            print(guid)
-            attachments[parse_guid(guid)] = attachment
-            print(attachment.name)
-        print('opened the following attachments:')
-        print(attachments)
-        return attachments
+        Get the names of the attachment files in the archive.
+
+        :type archive: zipfile.ZipFile
+        :rtype: dict[str,str]
+        :return: The archive member names by the attachment GUID
+        """
+        names = {}
+        # Any PDF may be an attachment, so save references to all of
+        # them for the duration of the document import
+        for name in archive.namelist():
+            if not name.endswith('.pdf'):
+                continue
+            guid_match = GUID_RX.search(name)
+            if not guid_match:
+                LOG.debug("No GUID in attachment name: %s", name)
+                continue
+            names[parse_guid(guid_match.group(0))] = name
+        return names
 
     @contextlib.contextmanager
-    def _open_remote_xml_file(self):
-        with httpio.open(self.url) as remote_file:
-            with zipfile.ZipFile(remote_file) as zipf:
-                with self._open_xml_file_from_zip(zipf) as xml_file:
-                    yield xml_file
+    def open_archive(self):
+        """
+        Download the ZIP archive of this document info.
+
+        The archive is downloaded once and kept in memory or, if it is
+        large, in a temporary file until the context is exited, so that
+        the XML and the attachments can be read from the same copy.
+        With an archive cache the archive is read from the local disk
+        and downloaded only if it is not cached yet.
+
+        :rtype: zipfile.ZipFile
+        """
+        if self.archive_cache is not None:
+            if self.offline:
+                filename = self.archive_cache.get(self.path, self.mtime_text)
+                if not filename:
+                    raise IOError("Not in archive cache: {}".format(self.url))
+            else:
+                filename = self.archive_cache.fetch(
+                    self.path, self.mtime_text, self._download)
+            with zipfile.ZipFile(filename) as zipf:
+                yield zipf
+            return
+
+        if self.offline:
+            raise IOError("Cannot download {} when offline".format(self.url))
+
+        with tempfile.SpooledTemporaryFile(MAX_IN_MEMORY_ARCHIVE_SIZE) as fp:
+            self._download(fp)
+            fp.seek(0)
+            with zipfile.ZipFile(fp) as zipf:
+                yield zipf
+
+    def _download(self, fp):
+        session = self.session or requests
+        with session.get(self.url, stream=True, timeout=self.timeout) as response:
+            if response.status_code != 200:
+                raise IOError("Failed to download {} (HTTP {})".format(
+                    self.url, response.status_code))
+            for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                fp.write(chunk)
 
     def _open_xml_file_from_zip(self, zipf):
         name_list = zipf.namelist()
         xml_names = [x for x in name_list if x.endswith('.xml')]
         if len(xml_names) == 0:
             # FIXME: Workaround for a silly bug
-            xml_names = [x for x in name_list if re.match(r'\w+\d+xml_', x)]
+            xml_names = [x for x in name_list if MISNAMED_XML_RX.match(x)]
             if len(xml_names) != 1:
                 raise IOError("No XML file in ZIP: {}".format(self.url))
         if len(xml_names) > 1:
             raise IOError("Too many XML files in ZIP: {}".format(self.url))
         return zipf.open(xml_names[0])
-
-    def _open_remote_attachments(self):
-        with httpio.open(self.url) as remote_file:
-            with zipfile.ZipFile(remote_file) as zipf:
-                name_list = zipf.namelist()
-                # any pdf may be an attachment, we save all the references for the duration of document import
-                pdf_names = (x for x in name_list if x.endswith('.pdf'))
-                while pdf_names:
-                    yield zipf.open(next(pdf_names))
\ No newline at end of file
@@ -1,6 +1,8 @@
 import datetime
 import json
 
+from django.utils.functional import cached_property
+
 from .schema_validated import SchemaValidated
 
 
@@ -27,17 +29,22 @@ class Document(SchemaValidated):
     def __init__(self, data=None, errors=None):
         self._data = data or {}
         self._errors = errors or []
+        # Names of the attachment files in the document archive by the
+        # attachment GUID, see `DocumentInfo.load_document`
+        self.attachments = {}
         super(Document, self).__init__()
 
     @property
     def type(self):
         return self._data['type']
 
-    @property
+    @cached_property
     def event(self):
+        # Built on the first access only, since the importers read the
+        # event many times per document
         return _DocumentObject.create_from(self._data['event'])
 
-    @property
+    @cached_property
     def errors(self):
         return _DocumentObject.create_from(self._errors)
 
@@ -1,27 +1,174 @@
-from .scanner import scan_dir
+import collections
+import concurrent.futures
+import datetime
+import sys
+
+from django.utils import timezone
+
+from .parse_dirlist import DirEntry
+from .scanner import Scanner
+
+# Tolerance for the clock difference between the server and us when
+# comparing directory modification times to the last scan time
+CLOCK_SKEW_MARGIN = datetime.timedelta(hours=1)
+
+# Options and scanner of a parse pool worker process.  The scanner is
+# created on the first document the worker loads, so that its HTTP
+# session and archive cache are shared by all documents of the worker.
+_worker_options = None
+_worker_scanner = None
+
+
+def load_document(doc_info):
+    """
+    Download and parse the document of given document info.
+
+    :type doc_info: .docinfo.DocumentInfo
+    :rtype: .document.Document
+    """
+    return doc_info.load_document()
+
+
+def init_worker(scanner_options):
+    """
+    Set up a parse pool worker process.
+
+    :type scanner_options: dict
+    :param scanner_options: Options from `Scanner.get_worker_options`
+    """
+    global _worker_options, _worker_scanner
+    _worker_options = scanner_options
+    _worker_scanner = None
+
+
+def _load_in_worker(loader, href, preceeding_text):
+    """
+    Load a document in a parse pool worker process.
+
+    Only the directory entry of the document is passed to the worker,
+    the document info is rebuilt with the scanner of the worker.
+    """
+    global _worker_scanner
+    if _worker_scanner is None:
+        _worker_scanner = Scanner.from_worker_options(_worker_options)
+    doc_info = _worker_scanner.create_document_info(DirEntry(href, preceeding_text))
+    return loader(doc_info)
 
 
 class ChangeImporter(object):
-    def import_changes(self, root='/files'):
+    # Function to load the documents with in the parse pool.  It must be
+    # a picklable module level function.
+    document_loader = staticmethod(load_document)
+
+    def __init__(self, scanner=None, workers=1):
+        """
+        Initialize the importer.
+
+        :type scanner: .scanner.Scanner|None
+        :param scanner: The scanner to detect the documents with
+        :type workers: int
+        :param workers:
+          Number of processes to download and parse the documents in.
+          With a single worker everything is done in this process.
+        """
+        self.scanner = scanner or Scanner()
+        self.workers = workers
+
+    def import_changes(self, root='/files', ordered=False, incremental=False):
         """
         Detect changes on the server and import them.
 
         :type root: str
         :param root: The root directory of the files to import
+        :type ordered: bool
+        :param ordered:
+          Import the documents in the directory listing order even if
+          the scanner fetches the listings concurrently
+        :type incremental: bool
+        :param incremental:
+          Skip the directories that have not been modified since the
+          last successful import.  Requires a scanner with a listing
+          cache.
+        """
+        listing_cache = self.scanner.listing_cache
+        modified_since = None
+        if incremental and listing_cache:
+            last_scan = listing_cache.get_last_scan(root)
+            modified_since = (last_scan - CLOCK_SKEW_MARGIN) if last_scan else None
+        started_at = timezone.now()
+
+        doc_infos = self.scanner.scan_dir(
+            root, max_depth=9999, ordered=ordered, modified_since=modified_since)
+        if self.workers > 1:
+            self._import_in_pipeline(doc_infos)
+        else:
+            for doc_info in doc_infos:
+                if self.should_import(doc_info):
+                    self._import_single(doc_info)
+        self.scanner.log_stats()
+
+        if listing_cache and not self.scanner.offline:
+            listing_cache.set_last_scan(root, started_at)
+
+    def _import_in_pipeline(self, doc_infos):
+        """
+        Import the changed documents using a pool of worker processes.
+
+        The documents are downloaded and parsed in the pool and the
+        results are passed in the scanning order to `_import_single`,
+        which runs in this process.  At most two documents per worker
+        are kept in flight.
         """
-        doc_infos = scan_dir(root, max_depth=9999)
-        for doc_info in doc_infos:
-            if self.should_import(doc_info):
-                self._import_single(doc_info)
+        loader = self.document_loader
+        in_flight = collections.OrderedDict()
+        with self._create_parse_pool() as executor:
+            for doc_info in doc_infos:
+                if not self.should_import(doc_info):
+                    continue
+                old_version = self.get_imported_version(doc_info)
+                if old_version == doc_info.mtime_text:
+                    continue
+                dir_entry = doc_info.dir_entry
+                future = executor.submit(_load_in_worker, loader, dir_entry.href, dir_entry.preceeding_text)
+                in_flight[future] = (doc_info, old_version)
+                if len(in_flight) >= 2 * self.workers:
+                    self._import_first_loaded(in_flight)
+            while in_flight:
+                self._import_first_loaded(in_flight)
 
-    def _import_single(self, doc_info):
-        old_version = self.get_imported_version(doc_info)
+    def _create_parse_pool(self):
+        options = self.scanner.get_worker_options()
+        if sys.version_info >= (3, 7):
+            return concurrent.futures.ProcessPoolExecutor(
+                self.workers, initializer=init_worker, initargs=(options,))
+        # Without the initializer argument rely on the workers being
+        # forked from this process after the options are set
+        init_worker(options)
+        return concurrent.futures.ProcessPoolExecutor(self.workers)
+
+    def _import_first_loaded(self, in_flight):
+        (future, (doc_info, old_version)) = in_flight.popitem(last=False)
+        self._import_changed(doc_info, old_version, future.result())
+
+    def _import_single(self, doc_info, document=None):
+        self._import_changed(doc_info, self.get_imported_version(doc_info), document)
+
+    def _import_changed(self, doc_info, old_version, document=None):
+        """
+        Import a document if it has been added or changed.
+
+        :type doc_info: .docinfo.DocumentInfo
+        :type old_version: str|None
+        :param old_version: The last imported version of the document
+        :type document: .document.Document|None
+        :param document: The document if it was loaded in the parse pool
+        """
         new_version = doc_info.mtime_text
         if not old_version:
-            self.handle_document_added(doc_info)
+            self.handle_document_added(doc_info, document)
             self.set_imported_version(doc_info, new_version)
         elif old_version != new_version:
-            self.handle_document_changed(doc_info)
+            self.handle_document_changed(doc_info, document)
             self.set_imported_version(doc_info, new_version)
 
     def should_import(self, doc_info):
@@ -51,18 +198,26 @@ class ChangeImporter(object):
         """
         pass
 
-    def handle_document_added(self, doc_info):
+    def handle_document_added(self, doc_info, document=None):
         """
         Handle a new document being added.
 
         :type doc_info: .docinfo.DocumentInfo
+        :type document: .document.Document|None
+        :param document:
+          The document as loaded by `document_loader` in the parse
+          pool, or None if it has not been loaded yet
         """
-        self.handle_document_changed(doc_info)
+        self.handle_document_changed(doc_info, document)
 
-    def handle_document_changed(self, doc_info):
+    def handle_document_changed(self, doc_info, document=None):
         """
         Handle a document being changed.
 
         :type doc_info: .docinfo.DocumentInfo
+        :type document: .document.Document|None
+        :param document:
+          The document as loaded by `document_loader` in the parse
+          pool, or None if it has not been loaded yet
         """
         pass
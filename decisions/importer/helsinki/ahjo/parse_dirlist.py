@@ -15,7 +15,7 @@ DIRLIST_LINE_RX = re.compile(
 class DirEntry(object):
     def __init__(self, href, preceeding_text):
         self.href = href
-        self._preceeding_text = preceeding_text
+        self.preceeding_text = preceeding_text
         self._groups = self._parse(preceeding_text)
         self.mtime_text = self._groups['datetime']  # Modification time as text
 
@@ -1,9 +1,16 @@
+import collections
+import concurrent.futures
 import logging
+import threading
+import time
+from urllib.parse import urlparse
 
 import pytz
 import requests
+from requests.adapters import HTTPAdapter
 
 from ._scanner_consts import DOCS_TO_SKIP, PATHS_TO_SKIP
+from .cache import ArchiveCache
 from .docinfo import DocumentInfo
 from .parse_dirlist import parse_dir_listing
 
@@ -12,35 +19,263 @@ LOG = logging.getLogger(__name__)
 BASE_URL = 'http://openhelsinki.hel.fi'
 SERVER_TIMEZONE = pytz.timezone('EET')
 
+# HTTP statuses that are worth retrying
+RETRY_STATUSES = frozenset([500, 502, 503, 504])
 
-def scan_dir(path, max_depth=0):
-    return Scanner().scan_dir(path, max_depth)
+
+class FetchError(IOError):
+    pass
+
+
+def scan_dir(path, max_depth=0, workers=1, ordered=False):
+    return Scanner(workers=workers).scan_dir(path, max_depth, ordered)
 
 
 class Scanner(object):
     def __init__(self, base_url=BASE_URL, server_timezone=SERVER_TIMEZONE,
                  min_filesize=500,
-                 docs_to_skip=DOCS_TO_SKIP, paths_to_skip=PATHS_TO_SKIP):
+                 docs_to_skip=DOCS_TO_SKIP, paths_to_skip=PATHS_TO_SKIP,
+                 workers=1, pool_size=None, timeout=(10, 60),
+                 retries=3, backoff_factor=0.5, listing_cache=None,
+                 archive_cache=None, offline=False, streaming_parse=False):
+        """
+        Initialize a scanner.
+
+        :type workers: int
+        :param workers:
+          Number of directory listings to fetch concurrently.  With a
+          single worker the tree is scanned serially.
+        :type pool_size: int|None
+        :param pool_size:
+          Number of keep-alive connections to keep per host, defaults
+          to the number of workers
+        :type timeout: float|(float, float)
+        :param timeout: Connect and read timeouts of a request in seconds
+        :type retries: int
+        :param retries:
+          How many times to retry a request failing with a 5xx status,
+          a timeout or a connection error
+        :type backoff_factor: float
+        :param backoff_factor:
+          Sleep backoff_factor * 2^(n - 1) seconds before the nth retry
+        :type listing_cache: .cache.ListingCache|None
+        :param listing_cache:
+          Cache to store the directory listings to.  Cached listings
+          are revalidated with conditional GET requests.
+        :type archive_cache: .cache.ArchiveCache|None
+        :param archive_cache: Cache to store the document archives to
+        :type offline: bool
+        :param offline:
+          Read the listings and the archives from the caches only,
+          without any network access
+        :type streaming_parse: bool
+        :param streaming_parse:
+          Parse the documents in the streaming mode of the parser
+        """
         self.base_url = base_url
         self.tz = server_timezone
         self.min_filesize = min_filesize
         self.docs_to_skip = docs_to_skip
         self.paths_to_skip = paths_to_skip
+        self.workers = workers
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.listing_cache = listing_cache
+        self.archive_cache = archive_cache
+        self.offline = offline
+        self.streaming_parse = streaming_parse
+        self.session = _create_session(pool_size or max(workers, 1))
+        self._counters = collections.defaultdict(collections.Counter)
+        self._counters_lock = threading.Lock()
+
+    def get_worker_options(self):
+        """
+        Get the options for recreating this scanner in a worker process.
+
+        The options are picklable.  The worker scanner only creates and
+        downloads documents, so it gets its own HTTP session and its own
+        instance of the archive cache, but no listing cache.
+
+        :rtype: dict
+        """
+        archive_cache = self.archive_cache
+        return {
+            'base_url': self.base_url,
+            'server_timezone': self.tz,
+            'min_filesize': self.min_filesize,
+            'timeout': self.timeout,
+            'archive_cache': (
+                (archive_cache.directory, archive_cache.max_size) if archive_cache else None),
+            'offline': self.offline,
+            'streaming_parse': self.streaming_parse,
+        }
+
+    @classmethod
+    def from_worker_options(cls, options):
+        """
+        Create a scanner from the options of `get_worker_options`.
+
+        :type options: dict
+        :rtype: Scanner
+        """
+        options = dict(options)
+        archive_cache = options.pop('archive_cache')
+        if archive_cache:
+            # The cache size is scanned from the disk, since the other
+            # processes may have changed it
+            (directory, max_size) = archive_cache
+            options['archive_cache'] = ArchiveCache(directory, max_size)
+        return cls(**options)
+
+    def scan_dir(self, path, max_depth=0, ordered=False, modified_since=None):
+        """
+        Scan given directory for documents.
+
+        :type path: str
+        :param path: Path of the directory, e.g. /files
+        :type max_depth: int
+        :param max_depth: How many levels of subdirectories to descend to
+        :type ordered: bool
+        :param ordered:
+          Yield the documents in the same depth-first order as a serial
+          scan would, even when the listings are fetched concurrently.
+          Otherwise documents are yielded as soon as their directory
+          listing arrives.
+        :type modified_since: datetime.datetime|None
+        :param modified_since:
+          Skip the cached leaf directories which have not been modified
+          since this time.  Note that the modification time of a
+          directory only changes when files are added to it, removed
+          from it or renamed, so this assumes that documents are never
+          overwritten in place.
+        :rtype: Iterable[DocumentInfo]
+        """
+        if self.workers <= 1:
+            return self._scan_dir_serially(path, max_depth, modified_since)
+        return self._scan_dir_concurrently(path, max_depth, ordered, modified_since)
+
+    def list_dir(self, path):
+        """
+        Fetch and parse the directory listing of given path.
+
+        :type path: str
+        :rtype: list[.parse_dirlist.DirEntry]
+        :raises FetchError:
+          if the listing cannot be fetched, so that a failure is not
+          mistaken for an empty directory
+        """
+        if self.listing_cache is None:
+            if self.offline:
+                raise FetchError("Cannot list {} without a listing cache".format(path))
+            return list(parse_dir_listing(self.fetch_contents(path)))
+
+        cached = self.listing_cache.get(path)
+        if self.offline:
+            if cached is None:
+                LOG.warning("Listing not cached: %s", path)
+                return []
+            return cached.dir_entries
+        headers = cached.get_validator_headers() if cached else {}
+        response = self.fetch(path, headers=headers)
+        if response.status_code == 304 and cached:
+            LOG.debug("Listing not modified: %s", path)
+            return cached.dir_entries
+        elif response.status_code != 200:
+            raise self._get_status_error(response)
+
+        dir_entries = list(parse_dir_listing(response.content))
+        self.listing_cache.set(
+            path, dir_entries,
+            etag=response.headers.get('ETag'),
+            last_modified=response.headers.get('Last-Modified'))
+        return dir_entries
+
+    def _scan_dir_serially(self, path, max_depth, modified_since):
+        dir_entries = self.list_dir(path)
+        for (subdir, doc_info) in self._process_dir_entries(dir_entries, modified_since):
+            if subdir is None:
+                yield doc_info
+            elif max_depth > 0:  # Recurse to the subdirectory
+                yield from self._scan_dir_serially(subdir, max_depth - 1, modified_since)
+
+    def _scan_dir_concurrently(self, path, max_depth, ordered, modified_since):
+        with concurrent.futures.ThreadPoolExecutor(self.workers) as executor:
+            unfinished = set()
+
+            def fetch_listing(path):
+                listing = executor.submit(self.list_dir, path)
+                unfinished.add(listing)
+                listing.add_done_callback(unfinished.discard)
+                return listing
+
+            try:
+                if ordered:
+                    yield from self._scan_listing_in_order(
+                        fetch_listing, fetch_listing(path), max_depth, modified_since)
+                else:
+                    yield from self._scan_listings_as_completed(
+                        fetch_listing, fetch_listing(path), max_depth, modified_since)
+            finally:
+                # Do not keep fetching if the consumer stops early
+                for listing in list(unfinished):
+                    listing.cancel()
+
+    def _scan_listing_in_order(self, fetch_listing, listing, max_depth, modified_since):
+        entries = list(self._process_dir_entries(listing.result(), modified_since))
+
+        # Prefetch the subdirectory listings before descending to them
+        subdir_listings = {}
+        if max_depth > 0:
+            for (subdir, _doc_info) in entries:
+                if subdir is not None:
+                    subdir_listings[subdir] = fetch_listing(subdir)
+
+        for (subdir, doc_info) in entries:
+            if subdir is None:
+                yield doc_info
+            elif max_depth > 0:
+                yield from self._scan_listing_in_order(
+                    fetch_listing, subdir_listings[subdir], max_depth - 1, modified_since)
+
+    def _scan_listings_as_completed(self, fetch_listing, listing, max_depth, modified_since):
+        pending = {listing: max_depth}
+        while pending:
+            (done, _not_done) = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for listing in done:
+                depth = pending.pop(listing)
+                dir_entries = listing.result()
+                for (subdir, doc_info) in self._process_dir_entries(dir_entries, modified_since):
+                    if subdir is None:
+                        yield doc_info
+                    elif depth > 0:
+                        pending[fetch_listing(subdir)] = depth - 1
 
-    def scan_dir(self, path, max_depth=0):
-        dir_listing_html = self.fetch_contents(path)
-        for dir_entry in parse_dir_listing(dir_listing_html):
+    def _process_dir_entries(self, dir_entries, modified_since=None):
+        """
+        Filter dir entries to subdirectories and documents.
+
+        :type dir_entries: Iterable[.parse_dirlist.DirEntry]
+        :type modified_since: datetime.datetime|None
+        :rtype: Iterable[(str|None, DocumentInfo|None)]
+        :return:
+          Pairs of (subdirectory path, None) or (None, document info)
+          in the listing order
+        """
+        for dir_entry in dir_entries:
             if self._should_skip_dir_entry(dir_entry):
                 continue
 
+            if modified_since and self._is_unmodified_leaf_dir(dir_entry, modified_since):
+                LOG.debug("Skipping unmodified directory: %s", dir_entry.href)
+                continue
+
             if dir_entry.type == 'dir':
-                if max_depth > 0:  # Recurse to the subdirectory
-                    path = dir_entry.href
-                    for doc_info in self.scan_dir(path, max_depth - 1):
-                        yield doc_info
+                yield (dir_entry.href, None)
             else:
                 try:
-                    doc_info = DocumentInfo(dir_entry, self.base_url, self.tz)
+                    doc_info = self.create_document_info(dir_entry)
                 except ValueError:
                     LOG.debug("Skipping invalid filename: %s", dir_entry.href)
                     continue
@@ -48,15 +283,102 @@ class Scanner(object):
                 if self._should_skip_document(doc_info):
                     continue
 
-                yield doc_info
+                yield (None, doc_info)
+
+    def create_document_info(self, dir_entry):
+        """
+        Create document info downloading with this scanner's session.
+
+        :type dir_entry: .parse_dirlist.DirEntry
+        :rtype: DocumentInfo
+        :raises ValueError: if the file name is not a valid document name
+        """
+        return DocumentInfo(
+            dir_entry, self.base_url, self.tz,
+            session=self.session, timeout=self.timeout,
+            archive_cache=self.archive_cache, offline=self.offline,
+            streaming_parse=self.streaming_parse)
 
     def fetch_contents(self, path):
-        response = requests.get(self.base_url + path)
+        """
+        GET the contents of given path.
+
+        :type path: str
+        :rtype: bytes
+        :raises FetchError: if the request fails or the status is not 200
+        """
+        response = self.fetch(path)
         if response.status_code != 200:
-            LOG.warn("Failed to fetch: {}".format(self.base_url + path))
-            return None
+            raise self._get_status_error(response)
         return response.content
 
+    def _get_status_error(self, response):
+        self._count(urlparse(response.url).hostname, 'failures')
+        return FetchError("Failed to fetch {} (HTTP {})".format(
+            response.url, response.status_code))
+
+    def fetch(self, path, **kwargs):
+        """
+        GET given path from the server using the pooled session.
+
+        Timeouts, connection errors and 5xx responses are retried with
+        an exponential backoff.
+
+        :type path: str
+        :param kwargs: Extra arguments to pass to requests
+        :rtype: requests.Response
+        :raises FetchError: if the request fails after all the retries
+        """
+        url = self.base_url + path
+        host = urlparse(url).hostname
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self._count(host, 'retries')
+                time.sleep(self.backoff_factor * (2 ** (attempt - 1)))
+            self._count(host, 'requests')
+            try:
+                response = self.session.get(url, timeout=self.timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as error:
+                LOG.warning("Fetching %s failed: %s", url, error)
+                continue
+            if response.status_code not in RETRY_STATUSES:
+                return response
+            LOG.warning("Fetching %s failed: HTTP %d", url, response.status_code)
+        self._count(host, 'failures')
+        raise FetchError("Failed to fetch {} after {} attempts".format(
+            url, self.retries + 1))
+
+    def get_stats(self):
+        """
+        Get per-host request statistics.
+
+        :rtype: dict[str,dict[str,int]]
+        :return:
+          Mapping from host to counts of requests, retries, failures
+          and opened connections
+        """
+        with self._counters_lock:
+            stats = {host: dict(counter) for (host, counter) in self._counters.items()}
+        adapters = {id(x): x for x in self.session.adapters.values()}
+        for adapter in adapters.values():
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    host_stats = stats.setdefault(pool.host, {})
+                    host_stats['connections'] = (
+                        host_stats.get('connections', 0) + pool.num_connections)
+        return stats
+
+    def log_stats(self):
+        for (host, stats) in sorted(self.get_stats().items()):
+            LOG.info("%s: %s", host, ', '.join(
+                '{} {}'.format(count, name) for (name, count) in sorted(stats.items())))
+
+    def _count(self, host, name):
+        with self._counters_lock:
+            self._counters[host][name] += 1
+
     def _should_skip_dir_entry(self, dir_entry):
         if dir_entry.type == 'dir' and dir_entry.href.endswith('.zip/'):
             LOG.debug("Skipping directory ending with .zip: %s", dir_entry.href)
@@ -66,7 +388,7 @@ class Scanner(object):
         elif not dir_entry.href.endswith('.zip'):
             return True  # Skip non-zip files
         elif dir_entry.size < self.min_filesize:
-            LOG.warn("File too small: %s %d", dir_entry.href, dir_entry.size)
+            LOG.warning("File too small: %s %d", dir_entry.href, dir_entry.size)
             return True
         elif dir_entry.href in self.paths_to_skip:
             reason = self.paths_to_skip[dir_entry.href]
@@ -74,6 +396,16 @@ class Scanner(object):
             return True
         return False
 
+    def _is_unmodified_leaf_dir(self, dir_entry, modified_since):
+        if dir_entry.type != 'dir' or self.listing_cache is None:
+            return False
+        if self.tz.localize(dir_entry.mtime) >= modified_since:
+            return False
+        # The modification time of a directory does not reflect changes
+        # in its subdirectories, so only leaf directories can be skipped
+        cached = self.listing_cache.get(dir_entry.href)
+        return cached is not None and not cached.has_subdirs
+
     def _should_skip_document(self, doc_info):
         if doc_info.language != 'fi':
             # Skip non-Finnish documents (i.e. Swedish)
@@ -83,3 +415,11 @@ class Scanner(object):
             LOG.info("Skipping document (%s): %s", reason, doc_info.origin_id)
             return True
         return False
+
+
+def _create_session(pool_size):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
@@ -1,25 +1,78 @@
-import json
+import datetime
 import os
 
 import jsonschema
 import yaml
 
 
+def _is_string(checker, instance):
+    return isinstance(instance, (str, datetime.date))
+
+
+def _create_validator(schema):
+    """
+    Create a Draft 4 validator accepting dates as strings.
+
+    The type checkers of jsonschema 3 replace the ``types`` argument,
+    which is deprecated there and removed in jsonschema 4.
+
+    :rtype: jsonschema.Draft4Validator
+    """
+    if hasattr(jsonschema.Draft4Validator, 'TYPE_CHECKER'):
+        type_checker = jsonschema.Draft4Validator.TYPE_CHECKER.redefine('string', _is_string)
+        validator_class = jsonschema.validators.extend(jsonschema.Draft4Validator, type_checker=type_checker)
+        return validator_class(schema)
+    return jsonschema.Draft4Validator(schema, types={
+        'string': (str, datetime.date),
+    })
+
+
 class SchemaValidated(object):
     schema = None
+    validator = None
+
+    # Validate every Nth created instance.  Set to 1 to validate all
+    # instances or to 0 to skip the validation, e.g. for re-imports of
+    # already validated data.
+    validate_every = 1
+    _created_count = 0
 
     def __init__(self, *args, **kwargs):
-        self.validate()
+        if self._should_validate():
+            self.validate()
         super(SchemaValidated, self).__init__(*args, **kwargs)
 
     def validate(self):
-        jsonschema.validate(json.loads(self.as_json()), self.get_schema())
+        self.get_validator().validate(self.as_dict())
+
+    @classmethod
+    def _should_validate(cls):
+        if cls.validate_every <= 1:
+            return cls.validate_every == 1
+        cls._created_count += 1
+        return (cls._created_count % cls.validate_every == 1)
+
+    @classmethod
+    def get_validator(cls):
+        """
+        Get validator of the schema, compiling it on the first call.
+
+        The validator accepts dates and datetimes as strings, so that
+        the data can be validated without serializing it to JSON first.
+
+        :rtype: jsonschema.Draft4Validator
+        """
+        if cls.validator is None:
+            schema = cls.get_schema()
+            jsonschema.Draft4Validator.check_schema(schema)
+            cls.validator = _create_validator(schema)
+        return cls.validator
 
     @classmethod
     def get_schema(cls):
         if cls.schema is None:
             with open(cls._get_schema_file_full_path(), 'rb') as fp:
-                cls.schema = yaml.load(fp.read())
+                cls.schema = yaml.safe_load(fp.read())
         return cls.schema
 
     @classmethod
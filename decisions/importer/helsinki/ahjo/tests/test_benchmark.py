@@ -0,0 +1,35 @@
+from decisions.importer.helsinki.ahjo.benchmark import (
+    generate_minutes, run_benchmark, run_micro_benchmark, save_result)
+from decisions.importer.helsinki.ahjo.xmlparser import XmlParser
+
+
+def test_generated_minutes_parse(tmpdir):
+    path = tmpdir.join('minutes.xml')
+    path.write_binary(generate_minutes(actions=4, attendees=3, attachments=2))
+    document = XmlParser().parse(str(path))
+    assert len(document.event.actions) == 4
+    assert len(document.event.attendees) == 3
+    assert all(len(action.attachments) == 2 for action in document.event.actions)
+    assert not document.errors
+
+
+def test_generated_minutes_are_repeatable():
+    assert generate_minutes(seed=3) == generate_minutes(seed=3)
+    assert generate_minutes(seed=3) != generate_minutes(seed=4)
+
+
+def test_results_are_saved_and_compared(tmpdir):
+    filename = str(tmpdir.join('results.json'))
+    result = run_benchmark(documents=2, actions=2)
+    assert set(result['results']) == {'parse', 'validate', 'as_json', 'total'}
+    assert result['results']['total']['docs_per_second'] > 0
+    assert 'micro' not in result
+    assert save_result(filename, result) is None
+    assert save_result(filename, run_benchmark(documents=1, actions=2)) is None
+    assert save_result(filename, result) == result
+
+
+def test_micro_benchmark():
+    result = run_micro_benchmark(number=10)
+    assert set(result) >= {'parse_datetime', 'parse_funcid', 'parse_guid', 'import_action'}
+    assert all(x > 0 for x in result.values())
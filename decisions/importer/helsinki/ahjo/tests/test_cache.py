@@ -0,0 +1,37 @@
+import os
+
+import pytest
+
+from decisions.importer.helsinki.ahjo.cache import IdentityCache, ListingCache
+
+
+def test_identity_cache_counts_hits_and_misses():
+    created = []
+
+    def create(key):
+        created.append(key)
+        return key.upper()
+
+    cache = IdentityCache('Test', [('a', 'A')])
+    assert cache.get_or_create('a', lambda: create('a')) == 'A'
+    assert cache.get_or_create('b', lambda: create('b')) == 'B'
+    assert cache.get_or_create('b', lambda: create('b')) == 'B'
+    assert created == ['b']
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_identity_cache_evicts_least_recently_used():
+    cache = IdentityCache('Test', [('a', 1), ('b', 2)], max_size=2)
+    cache.get_or_create('a', lambda: None)
+    cache.get_or_create('c', lambda: 3)
+    assert 'b' not in cache
+    assert 'a' in cache and 'c' in cache
+    assert len(cache) == 2
+
+
+def test_listing_cache_removes_temporary_file_on_error(tmpdir):
+    cache = ListingCache(str(tmpdir))
+    with pytest.raises(TypeError):
+        cache._write(cache._get_filename('listing', '/files/'), {'entries': object()})
+    assert os.listdir(str(tmpdir)) == []
+    assert cache.get('/files/') is None
@@ -0,0 +1,116 @@
+import io
+import os
+import zipfile
+
+import pytest
+import pytz
+
+from decisions.importer.helsinki.ahjo import docinfo
+from decisions.importer.helsinki.ahjo.cache import ArchiveCache
+from decisions.importer.helsinki.ahjo.docinfo import DocumentInfo
+from decisions.importer.helsinki.ahjo.parse_dirlist import DirEntry
+
+ATTACHMENT_GUID = '{E2A1B5D2-3D4F-4B1C-9A66-1D2B3C4D5E6F}'
+
+
+def make_archive():
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w') as zipf:
+        zipf.writestr('Asu 2016-01-12 Asulk 1 Pk Su.xml', b'<Poytakirja/>')
+        zipf.writestr('Liite {}.pdf'.format(ATTACHMENT_GUID), b'%PDF-1.4')
+        zipf.writestr('kuva.png', b'')
+    return buf.getvalue()
+
+
+class FakeResponse(object):
+    status_code = 200
+
+    def __init__(self, content):
+        self.content = content
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class FakeSession(object):
+    def __init__(self, content):
+        self.content = content
+        self.requested_urls = []
+
+    def get(self, url, **kwargs):
+        self.requested_urls.append(url)
+        return FakeResponse(self.content)
+
+
+def make_doc_info(session, mtime_text='5/23/2017 10:04 AM', **kwargs):
+    dir_entry = DirEntry(
+        '/files/Asuntolautakunta_60014/Asu%202016-01-12%20Asulk%201%20Pk%20Su.zip',
+        ' {}        1234 '.format(mtime_text))
+    return DocumentInfo(dir_entry, 'http://example.com', pytz.utc, session=session, **kwargs)
+
+
+def read_xml(doc_info):
+    with doc_info.open_archive() as archive:
+        with doc_info._open_xml_file_from_zip(archive) as xml_file:
+            return xml_file.read()
+
+
+def test_archive_is_downloaded_once():
+    session = FakeSession(make_archive())
+    doc_info = make_doc_info(session)
+    with doc_info.open_archive() as archive:
+        with doc_info._open_xml_file_from_zip(archive) as xml_file:
+            assert xml_file.read() == b'<Poytakirja/>'
+        attachments = doc_info.get_attachment_names(archive)
+        guid = ATTACHMENT_GUID.strip('{}').lower()
+        assert list(attachments) == [guid]
+        assert archive.read(attachments[guid]) == b'%PDF-1.4'
+    assert session.requested_urls == [doc_info.url]
+
+
+@pytest.mark.parametrize('kwargs,streaming', [({}, False), ({'streaming_parse': True}, True)])
+def test_get_document_parse_mode(monkeypatch, kwargs, streaming):
+    calls = []
+    monkeypatch.setattr(docinfo, 'parse_xml', lambda xml_file, streaming: calls.append((xml_file.read(), streaming)))
+    make_doc_info(FakeSession(make_archive()), **kwargs).get_document()
+    assert calls == [(b'<Poytakirja/>', streaming)]
+
+
+def test_archive_cache(tmpdir):
+    session = FakeSession(make_archive())
+    cache = ArchiveCache(str(tmpdir))
+    assert read_xml(make_doc_info(session, archive_cache=cache)) == b'<Poytakirja/>'
+    assert read_xml(make_doc_info(session, archive_cache=cache)) == b'<Poytakirja/>'
+    assert len(session.requested_urls) == 1
+
+    # A changed document is downloaded again
+    changed = make_doc_info(session, '5/24/2017 10:04 AM', archive_cache=cache)
+    assert read_xml(changed) == b'<Poytakirja/>'
+    assert len(session.requested_urls) == 2
+
+
+def test_archive_cache_offline(tmpdir):
+    session = FakeSession(make_archive())
+    cache = ArchiveCache(str(tmpdir))
+    read_xml(make_doc_info(session, archive_cache=cache))
+    assert read_xml(make_doc_info(None, archive_cache=cache, offline=True)) == b'<Poytakirja/>'
+    with pytest.raises(IOError):
+        read_xml(make_doc_info(None, '1/1/2018 1:00 PM', archive_cache=cache, offline=True))
+
+
+def test_archive_cache_eviction(tmpdir):
+    archive = make_archive()
+    cache = ArchiveCache(str(tmpdir), max_size=2 * len(archive))
+    for (n, mtime_text) in enumerate(['5/1/2017 1:00 PM', '5/2/2017 1:00 PM', '5/3/2017 1:00 PM']):
+        filename = cache.fetch('/files/x.zip', mtime_text, lambda fp: fp.write(archive))
+        os.utime(filename, (n, n))
+    assert cache.get('/files/x.zip', '5/1/2017 1:00 PM') is None
+    assert cache.get('/files/x.zip', '5/2/2017 1:00 PM')
+    assert cache.get('/files/x.zip', '5/3/2017 1:00 PM')
@@ -0,0 +1,57 @@
+import datetime
+
+import jsonschema
+import pytest
+import pytz
+
+from decisions.importer.helsinki.ahjo.document import Document
+
+START = pytz.utc.localize(datetime.datetime(2016, 2, 2, 14, 30))
+
+
+def make_data(**event):
+    event.setdefault('name', 'Kaupunginhallitus 4/2016')
+    event.setdefault('start_date', START)
+    event.setdefault('end_date', START + datetime.timedelta(hours=3))
+    return {'type': 'minutes', 'event': event}
+
+
+@pytest.fixture
+def validate_every():
+    def set_validate_every(value):
+        Document.validate_every = value
+        Document._created_count = 0
+    yield set_validate_every
+    set_validate_every(1)
+
+
+def test_datetimes_are_valid_without_serializing():
+    document = Document(make_data())
+    assert document.event.start_date == START
+
+
+def test_invalid_document_raises():
+    with pytest.raises(jsonschema.ValidationError):
+        Document(make_data(location=123))
+
+
+def test_validation_can_be_skipped(validate_every):
+    validate_every(0)
+    Document(make_data(location=123))
+
+
+def test_validation_can_be_sampled(validate_every):
+    validate_every(3)
+    with pytest.raises(jsonschema.ValidationError):
+        Document(make_data(location=123))
+    Document(make_data(location=123))
+    Document(make_data(location=123))
+    with pytest.raises(jsonschema.ValidationError):
+        Document(make_data(location=123))
+
+
+def test_event_view_is_built_once():
+    document = Document(make_data(attendees=[{'name': 'Matti Meikäläinen'}]))
+    assert document.event is document.event
+    assert document.event.attendees[0].name == 'Matti Meikäläinen'
+    assert document.event.location is None
@@ -0,0 +1,67 @@
+import os
+
+import pytest
+
+from decisions.importer.helsinki.ahjo.importer import ChangeImporter
+
+from decisions.importer.helsinki.ahjo.tests.test_scanner import FakeScanner, scan_paths
+
+
+def load_path(doc_info):
+    return 'loaded:' + doc_info.path
+
+
+class RecordingImporter(ChangeImporter):
+    document_loader = staticmethod(load_path)
+
+    def __init__(self, imported_versions=None, **kwargs):
+        super(RecordingImporter, self).__init__(scanner=FakeScanner(), **kwargs)
+        self.imported_versions = dict(imported_versions or {})
+        self.handled = []
+
+    def get_imported_version(self, doc_info):
+        return self.imported_versions.get(doc_info.path)
+
+    def set_imported_version(self, doc_info, version):
+        self.imported_versions[doc_info.path] = version
+
+    def handle_document_changed(self, doc_info, document=None):
+        self.handled.append((doc_info.path, document))
+
+
+def test_serial_import():
+    importer = RecordingImporter()
+    importer.import_changes('/files/', ordered=True)
+    assert importer.handled == [(path, None) for path in scan_paths(FakeScanner())]
+
+
+@pytest.mark.parametrize('workers', [2, 3])
+def test_pipeline_import_keeps_order(workers):
+    importer = RecordingImporter(workers=workers)
+    importer.import_changes('/files/', ordered=True)
+    assert importer.handled == [
+        (path, 'loaded:' + path) for path in scan_paths(FakeScanner())]
+
+
+def test_pipeline_import_skips_unchanged():
+    paths = scan_paths(FakeScanner())
+    versions = {doc_info.path: doc_info.mtime_text
+                for doc_info in FakeScanner().scan_dir('/files/', max_depth=9999)}
+    del versions[paths[1]]
+    importer = RecordingImporter(imported_versions=versions, workers=2)
+    importer.import_changes('/files/', ordered=True)
+    assert importer.handled == [(paths[1], 'loaded:' + paths[1])]
+
+
+def load_session(doc_info):
+    return (os.getpid(), id(doc_info.session))
+
+
+def test_pipeline_workers_reuse_session():
+    importer = RecordingImporter(workers=2)
+    importer.document_loader = load_session
+    importer.import_changes('/files/', ordered=True)
+    sessions_by_pid = {}
+    for (_path, (pid, session_id)) in importer.handled:
+        sessions_by_pid.setdefault(pid, set()).add(session_id)
+    assert all(len(x) == 1 for x in sessions_by_pid.values())
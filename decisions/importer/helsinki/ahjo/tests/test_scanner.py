@@ -0,0 +1,215 @@
+import datetime
+import http.server
+import socketserver
+import threading
+
+import pytest
+
+from decisions.importer.helsinki.ahjo.cache import ArchiveCache, ListingCache
+from decisions.importer.helsinki.ahjo.parse_dirlist import DirEntry
+from decisions.importer.helsinki.ahjo.scanner import FetchError, Scanner
+
+# Directory tree as {path: [(href, size or None for a dir)]}
+TREE = {
+    '/files/': [
+        ('/files/Asuntolautakunta_60014/', None),
+        ('/files/Tietokeskus_02300/', None),
+        ('/files/Kaupunginvaltuusto_02900/', None),
+    ],
+    '/files/Asuntolautakunta_60014/': [
+        ('/files/Asuntolautakunta_60014/Asu%202016-01-12%20Asulk%201%20Pk%20Su.zip', 1000),
+        ('/files/Asuntolautakunta_60014/Asu%202016-01-12%20Asulk%201%20Pk%20Ru.zip', 1000),
+        ('/files/Asuntolautakunta_60014/Asu%202016-01-26%20Asulk%202%20Pk%20Su.zip', 1000),
+    ],
+    '/files/Tietokeskus_02300/': [
+        ('/files/Tietokeskus_02300/Tilastopaallikko_023400VH1/', None),
+        ('/files/Tietokeskus_02300/Tieke%202016-02-01%2002300%201%20Pk%20Su.zip', 1000),
+        ('/files/Tietokeskus_02300/too_small.zip', 100),
+    ],
+    '/files/Tietokeskus_02300/Tilastopaallikko_023400VH1/': [
+        ('/files/Tietokeskus_02300/Tilastopaallikko_023400VH1/'
+         'Tieke%202016-01-04%20023400VH1%201%20Pk%20Su.zip', 1000),
+    ],
+    '/files/Kaupunginvaltuusto_02900/': [
+        ('/files/Kaupunginvaltuusto_02900/Kanslia%202016-01-13%20Kvsto%201%20Pk%20Su.zip', 1000),
+        ('/files/Kaupunginvaltuusto_02900/readme.txt', 1000),
+    ],
+}
+
+
+def render_listing(entries):
+    lines = []
+    for (href, size) in entries:
+        size_or_dir = '&lt;dir&gt;' if size is None else str(size)
+        lines.append(
+            ' 5/23/2017 10:04 AM {:>12} <A HREF="{}">x</A><br>'.format(
+                size_or_dir, href))
+    return (
+        '<html><body><pre>'
+        '<A HREF="/">[To Parent Directory]</A><br><br>' +
+        ''.join(lines) +
+        '</pre></body></html>').encode('utf-8')
+
+
+class FakeScanner(Scanner):
+    def fetch_contents(self, path):
+        return render_listing(TREE[path])
+
+
+def scan_paths(scanner, **kwargs):
+    return [x.path for x in scanner.scan_dir('/files/', max_depth=9999, **kwargs)]
+
+
+def test_worker_scanner(tmpdir):
+    scanner = Scanner(
+        base_url='http://example.com', archive_cache=ArchiveCache(str(tmpdir), max_size=100), streaming_parse=True)
+    tmpdir.join('cached.zip').write(b'x' * 10)
+    worker_scanner = Scanner.from_worker_options(scanner.get_worker_options())
+    assert worker_scanner.session is not scanner.session
+    assert worker_scanner.archive_cache.max_size == 100
+    assert worker_scanner.archive_cache._total_size == 10
+
+    (_subdir, doc_info) = next(iter(scanner._process_dir_entries(
+        [DirEntry(TREE['/files/Asuntolautakunta_60014/'][0][0], ' 5/23/2017 10:04 AM  1000 ')])))
+    worker_doc_info = worker_scanner.create_document_info(doc_info.dir_entry)
+    assert worker_doc_info.url == doc_info.url
+    assert worker_doc_info.session is worker_scanner.session
+    assert worker_doc_info.streaming_parse
+
+
+def test_serial_scan():
+    assert scan_paths(FakeScanner()) == [
+        TREE['/files/Asuntolautakunta_60014/'][0][0],
+        TREE['/files/Asuntolautakunta_60014/'][2][0],
+        TREE['/files/Tietokeskus_02300/Tilastopaallikko_023400VH1/'][0][0],
+        TREE['/files/Tietokeskus_02300/'][1][0],
+        TREE['/files/Kaupunginvaltuusto_02900/'][0][0],
+    ]
+
+
+def test_serial_scan_max_depth():
+    assert list(FakeScanner().scan_dir('/files/', max_depth=0)) == []
+
+
+@pytest.mark.parametrize('workers', [2, 8])
+def test_concurrent_scan_ordered(workers):
+    serial = scan_paths(FakeScanner())
+    assert scan_paths(FakeScanner(workers=workers), ordered=True) == serial
+
+
+@pytest.mark.parametrize('workers', [2, 8])
+def test_concurrent_scan_unordered(workers):
+    serial = scan_paths(FakeScanner())
+    result = scan_paths(FakeScanner(workers=workers))
+    assert sorted(result) == sorted(serial)
+    assert len(result) == len(serial)
+
+
+class ListingRequestHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    failures_left = 0
+    statuses = []
+
+    def do_GET(self):
+        cls = type(self)
+        etag = '"{}"'.format(len(TREE.get(self.path, ())))
+        if cls.failures_left > 0:
+            cls.failures_left -= 1
+            (status, body) = (503, b'')
+        elif self.path not in TREE:
+            (status, body) = (404, b'')
+        elif self.headers.get('If-None-Match') == etag:
+            (status, body) = (304, b'')
+        else:
+            (status, body) = (200, render_listing(TREE[self.path]))
+        cls.statuses.append(status)
+        self.send_response(status)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ListingServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+@pytest.fixture
+def listing_server():
+    ListingRequestHandler.failures_left = 0
+    ListingRequestHandler.statuses = []
+    server = ListingServer(('127.0.0.1', 0), ListingRequestHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:{}'.format(server.server_port)
+    server.shutdown()
+    server.server_close()
+
+
+def test_fetch_reuses_connection(listing_server):
+    scanner = Scanner(base_url=listing_server)
+    assert len(scan_paths(scanner)) == 5
+    stats = scanner.get_stats()['127.0.0.1']
+    assert stats['requests'] == len(TREE)
+    assert stats['connections'] == 1
+    assert 'retries' not in stats
+
+
+def test_fetch_retries_server_errors(listing_server):
+    ListingRequestHandler.failures_left = 2
+    scanner = Scanner(base_url=listing_server, retries=2, backoff_factor=0)
+    assert scanner.list_dir('/files/')
+    stats = scanner.get_stats()['127.0.0.1']
+    assert stats['requests'] == 3
+    assert stats['retries'] == 2
+
+
+def test_fetch_raises_after_retries(listing_server):
+    ListingRequestHandler.failures_left = 3
+    scanner = Scanner(base_url=listing_server, retries=2, backoff_factor=0)
+    with pytest.raises(FetchError):
+        scanner.list_dir('/files/')
+    stats = scanner.get_stats()['127.0.0.1']
+    assert stats['failures'] == 1
+
+
+@pytest.mark.parametrize('cached', [False, True])
+def test_list_dir_raises_on_missing_listing(listing_server, tmpdir, cached):
+    listing_cache = ListingCache(str(tmpdir)) if cached else None
+    scanner = Scanner(base_url=listing_server, listing_cache=listing_cache)
+    with pytest.raises(FetchError):
+        scanner.list_dir('/files/missing/')
+    assert ListingRequestHandler.statuses == [404]
+    stats = scanner.get_stats()['127.0.0.1']
+    assert stats['failures'] == 1
+    assert 'retries' not in stats
+
+
+def test_listing_cache_revalidates(listing_server, tmpdir):
+    cache = ListingCache(str(tmpdir))
+    first = scan_paths(Scanner(base_url=listing_server, listing_cache=cache))
+    assert ListingRequestHandler.statuses == [200] * len(TREE)
+
+    ListingRequestHandler.statuses = []
+    second = scan_paths(Scanner(base_url=listing_server, listing_cache=cache))
+    assert ListingRequestHandler.statuses == [304] * len(TREE)
+    assert second == first
+
+
+def test_listing_cache_skips_unmodified_leaf_dirs(listing_server, tmpdir):
+    cache = ListingCache(str(tmpdir))
+    scanner = Scanner(base_url=listing_server, listing_cache=cache)
+    all_paths = scan_paths(scanner)
+
+    # All directories in the tree have the same modification time
+    mtime = scanner.tz.localize(datetime.datetime(2017, 5, 23, 10, 4))
+    ListingRequestHandler.statuses = []
+    paths = scan_paths(scanner, modified_since=mtime + datetime.timedelta(minutes=1))
+    assert paths == [TREE['/files/Tietokeskus_02300/'][1][0]]
+    # Root and the only non-leaf directory are fetched
+    assert len(ListingRequestHandler.statuses) == 2
+
+    assert scan_paths(scanner, modified_since=mtime) == all_paths
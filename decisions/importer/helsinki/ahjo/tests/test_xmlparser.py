@@ -1,8 +1,9 @@
 import datetime
 
 import pytest
+from lxml import etree
 
-from decisions.importer.helsinki.ahjo.xmlparser import XmlParser
+from decisions.importer.helsinki.ahjo.xmlparser import LOCAL_TZ, ParseError, XmlParser, parse_guid
 
 
 @pytest.mark.parametrize('raw,simplified', [
@@ -38,3 +39,160 @@ def test_parse_datetime_range_specials():
     assert p('') is None
     assert p('garbage') is None
     assert p('19.19.1999 99:99 - 99:99') is None
+
+
+def make_minutes(num_actions):
+    actions = ''.join("""
+    <Paatos>
+      <KuvailutiedotOpenDocument>
+        <Otsikko>Asia {num}</Otsikko>
+        <Tehtavaluokka>00 01 02 Tehtava</Tehtavaluokka>
+        <AsiaGuid>{{0DC9A5F0-6A8E-4B6E-9B2E-3A8F1C2D4E{num:02d}}}</AsiaGuid>
+        <Paatospaiva>02.02.2016 16:30:00</Paatospaiva>
+        <Pykala>{num}</Pykala>
+        {register_id}
+        <Asiakirjantila>Hyväksytty</Asiakirjantila>
+      </KuvailutiedotOpenDocument>
+      <SisaltoSektioToisto>
+        <SisaltoSektio>
+          <SisaltoOtsikko>Päätös</SisaltoOtsikko>
+          <TekstiSektio><taso1>
+            <Kappale><KappaleTeksti>Hyväksyttiin {num}.</KappaleTeksti></Kappale>
+          </taso1></TekstiSektio>
+        </SisaltoSektio>
+      </SisaltoSektioToisto>
+      <LiitteetOptio><Liitteet><LiitteetToisto>
+        <Liiteteksti>Liite {num}</Liiteteksti>
+        <JulkaisuKytkin>true</JulkaisuKytkin>
+        <LiitteetId>{{E2A1B5D2-3D4F-4B1C-9A66-1D2B3C4D5E{num:02d}}}</LiitteetId>
+        <Liitenumero>1</Liitenumero>
+      </LiitteetToisto></Liitteet></LiitteetOptio>
+    </Paatos>""".format(
+        num=num,
+        # Every other action lacks a register id to produce errors
+        register_id=('<Dnro><DnroLyhyt>HEL 2016-{:06d}</DnroLyhyt></Dnro>'.format(num)
+                     if num % 2 else ''))
+        for num in range(num_actions))
+    return """<?xml version="1.0" encoding="utf-8"?>
+<Poytakirja>
+  <YlatunnisteSektio>
+    <Paattaja>Kaupunginhallitus</Paattaja>
+    <Asiakirjatunnus>Pöytäkirja 4/2016</Asiakirjatunnus>
+    <Paivays>2016-02-02</Paivays>
+  </YlatunnisteSektio>
+  <PkKansilehtiSektio><KansilehtiToisto>
+    <Lasnaolotiedot><Osallistujaryhma>
+      <OsallistujaryhmaOtsikko>Jäsenet</OsallistujaryhmaOtsikko>
+      <Osallistujat><Nimi>Meikäläinen, Matti</Nimi></Osallistujat>
+      <Osallistujat><Titteli>Nimetön</Titteli></Osallistujat>
+    </Osallistujaryhma></Lasnaolotiedot>
+    <Kokoustiedot>
+      <Kokouspaikka>Kaupungintalo</Kokouspaikka>
+      <Kokousaika>02.02.2016 16:30 - 19:37</Kokousaika>
+    </Kokoustiedot>
+  </KansilehtiToisto></PkKansilehtiSektio>
+  <Paatokset>{actions}
+  </Paatokset>
+  <SahkoinenAllekirjoitusSektio/>
+</Poytakirja>
+""".format(actions=actions).encode('utf-8')
+
+
+@pytest.mark.parametrize('num_actions', [0, 1, 5])
+def test_streaming_parse_equals_full_parse(tmpdir, num_actions):
+    path = tmpdir.join('minutes.xml')
+    path.write_binary(make_minutes(num_actions))
+    full = XmlParser().parse(str(path))
+    streamed = XmlParser().parse(str(path), streaming=True)
+    assert len(full.event.actions) == num_actions
+    assert streamed.as_dict() == full.as_dict()
+
+
+class SignatureCheckingParser(XmlParser):
+    def import_document(self, ctx, root, *args, **kwargs):
+        attrs = super(SignatureCheckingParser, self).import_document(ctx, root, *args, **kwargs)
+        ctx.warning('Signatures checked')
+        return attrs
+
+
+def test_streaming_parse_keeps_error_order(tmpdir):
+    path = tmpdir.join('minutes.xml')
+    path.write_binary(make_minutes(3))
+    full = SignatureCheckingParser().parse(str(path))
+    streamed = SignatureCheckingParser().parse(str(path), streaming=True)
+    messages = [x['msg'] for x in streamed.as_dict()['errors']]
+    assert messages == [x['msg'] for x in full.as_dict()['errors']]
+    # Errors logged after the actions stay after the action errors
+    assert messages[-1] == 'Signatures checked'
+    assert any(x['state']['current_action'] for x in streamed.as_dict()['errors'][:-1])
+
+
+@pytest.mark.parametrize('raw', [
+    '2/23/2016 4:30:00 PM',
+    '12/1/2016 12:05:09 AM',
+    '12/1/2016 12:05:09 pm',
+    '02/23/2016 16:30:00',
+    '23.2.2016 4:30:00 PM',
+    '23.02.2016 16:30:00',
+    '1.1.2016 0:00:00',
+    '23.02.2016 16:5:00',
+])
+def test_parse_datetime_fast_path_matches_strptime(raw):
+    expected = XmlParser._parse_datetime_by_formats(raw)
+    assert expected is not None
+    assert XmlParser.parse_datetime(raw) == LOCAL_TZ.localize(expected)
+
+
+@pytest.mark.parametrize('raw', [
+    '23/02/2016 16:30:00',
+    '2/23/2016 13:30:00 PM',
+    '31.02.2016 16:30:00',
+    '2016-02-23 16:30:00',
+])
+def test_parse_datetime_invalid(raw):
+    with pytest.raises(ParseError):
+        XmlParser.parse_datetime(raw)
+
+
+def test_parse_funcid_and_guid():
+    assert XmlParser.parse_funcid('00 00 03 Valtuuston aloitetoiminta') == (
+        '00 00 03', 'Valtuuston aloitetoiminta')
+    assert parse_guid('{0DC9A5F0-6A8E-4B6E-9B2E-3A8F1C2D4E5F}') == (
+        '0dc9a5f0-6a8e-4b6e-9b2e-3a8f1c2d4e5f')
+    with pytest.raises(ParseError):
+        parse_guid('0DC9A5F0-6A8E-4B6E-9B2E-3A8F1C2D4E5F')
+
+
+def test_import_content_sanitizes_xhtml():
+    content = etree.fromstring("""
+    <SisaltoSektioToisto>
+      <SisaltoSektio>
+        <SisaltoOtsikko>Päätös</SisaltoOtsikko>
+        <TekstiSektio><taso1>
+          <Otsikko>Perustelut</Otsikko>
+          <Kappale><KappaleTeksti>A &amp; B &lt; C</KappaleTeksti></Kappale>
+          <XHTML><html:table xmlns:html="http://www.w3.org/1999/xhtml" border="1"><html:tr><html:td
+            class="x"><html:span>1</html:span><!-- note --></html:td><html:td/></html:tr></html:table></XHTML>
+        </taso1></TekstiSektio>
+      </SisaltoSektio>
+      <SisaltoSektio>
+        <SisaltoOtsikko>Esitys</SisaltoOtsikko>
+      </SisaltoSektio>
+    </SisaltoSektioToisto>""")
+    assert XmlParser().import_content(None, content) == (
+        '<h2>Päätös</h2>\n'
+        '<h2>Perustelut</h2>\n'
+        '<p>A &amp; B &lt; C</p>\n'
+        '<table><tr><td>1</td><td></td></tr></table>'
+        '<h2>Esitys</h2>\n')
+
+
+@pytest.mark.parametrize('prefix', ['', 'html:'])
+def test_clean_html_non_content_tags(prefix):
+    raw = etree.fromstring("""<XHTML xmlns:html="http://www.w3.org/1999/xhtml">
+      <{0}p>a<{0}script>bad()</{0}script>b</{0}p><{0}style>p {{ color: red }}</{0}style>
+      <{0}p>line<{0}br/>break</{0}p><{0}h3>T</{0}h3>after<{0}h6 id="x">U</{0}h6>
+    </XHTML>""".format(prefix))
+    assert XmlParser.clean_html(raw) == (
+        '\n      <p>ab</p>\n'
+        '      <p>line<br/>break</p><h2>T</h2>after<h2>U</h2>\n    ')
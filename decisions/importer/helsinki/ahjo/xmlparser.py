@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 
 import datetime
+import functools
 import logging
 import re
 
@@ -30,8 +31,24 @@ LOCAL_TZ = pytz.timezone('Europe/Helsinki')
 LOG = logging.getLogger(__name__)
 
 GUID_REGEX = r'\{([A-F0-9]{8}-(?:[A-F0-9]{4}-){3}[A-F0-9]{12})\}'
+GUID_RX = re.compile(GUID_REGEX)
 
-def parse_xml(source, except_treshold=logging.CRITICAL):
+FUNCID_RX = re.compile(r'((?:\d\d ){0,}\d\d) (.*)')
+
+# Timestamps like '2/23/2016 4:30:00 PM' or '23.02.2016 16:30:00'
+DATETIME_RX = re.compile(
+    r'(\d{1,2})([./])(\d{1,2})\2(\d{4}) (\d{1,2}):(\d\d):(\d\d)(?: ([AaPp][Mm]))?')
+
+DATETIME_FORMATS = [
+    '%m/%d/%Y %I:%M:%S %p',
+    '%m/%d/%Y %H:%M:%S',
+
+    '%d.%m.%Y %I:%M:%S %p',
+    '%d.%m.%Y %H:%M:%S',
+]
+
+
+def parse_xml(source, except_treshold=logging.CRITICAL, streaming=False):
     """
     Parse given XML file to a document.
 
@@ -42,10 +59,14 @@ def parse_xml(source, except_treshold=logging.CRITICAL):
       Logging message threshold level.  If a message with the given or
       any higher level is logged while parsing, then an exception is
       thrown.
+    :type streaming: bool
+    :param streaming:
+      Parse the actions incrementally and discard their elements as
+      soon as they are parsed, instead of building the full tree first
     :raises ParseError: if there is an error in parsing
     :rtype: Document
     """
-    return XmlParser().parse(source, except_treshold)
+    return XmlParser().parse(source, except_treshold, streaming=streaming)
 
 
 def parse_guid(raw):
@@ -63,7 +84,7 @@ def parse_guid(raw):
     if raw is None:
         return None
 
-    guid_match = re.fullmatch(GUID_REGEX, raw)
+    guid_match = GUID_RX.fullmatch(raw)
     if guid_match is not None:
         return guid_match.group(1).lower()
     else:
@@ -89,11 +110,72 @@ DATE_RANGE_RX = re.compile(
     r'(\d{1,2}[:.]\d\d)')
 
 
+# Tags allowed in the content hypertext.  Other tags are unwrapped, i.e.
+# replaced by their content.
+HYPERTEXT_TAGS = {'p', 'br', 'h1', 'h2', 'table', 'thead', 'tbody', 'tr', 'th', 'td'}
+
+# Tags renamed to allowed ones, so that the boundaries of their content
+# are kept
+RENAMED_TAGS = {'h3': 'h2', 'h4': 'h2', 'h5': 'h2', 'h6': 'h2'}
+
+# Tags which are removed with their content, since it is not text
+REMOVED_TAGS = {'script', 'style'}
+
+# Allowed tags which are serialized without an end tag
+VOID_TAGS = {'br'}
+
+
 class XmlParser:
     @classmethod
     def clean_html(cls, raw):
-        # TODO
-        return ''.join([str(etree.tostring(el)) for el in raw])
+        """
+        Convert the children of an XHTML element to content hypertext.
+
+        Only the tags in HYPERTEXT_TAGS are kept and they are stripped of
+        their attributes and namespaces.  The tags in RENAMED_TAGS are
+        renamed to allowed ones and the ones in REMOVED_TAGS are removed
+        with their content.  Other tags are unwrapped, and comments and
+        processing instructions are dropped.  The element is sanitized
+        in place, so that the result can be serialized by lxml in a
+        single pass.
+
+        :type raw: Element
+        :rtype: str
+        """
+        etree.strip_elements(raw, etree.Comment, etree.ProcessingInstruction, with_tail=False)
+        tags_to_remove = set()
+        tags_to_unwrap = set()
+        renamed = False
+        for el in raw.iterdescendants():
+            tag = el.tag
+            if tag not in HYPERTEXT_TAGS:
+                tag = etree.QName(el).localname.lower()
+                tag = RENAMED_TAGS.get(tag, tag)
+                if tag not in HYPERTEXT_TAGS:
+                    if tag in REMOVED_TAGS:
+                        tags_to_remove.add(el.tag)
+                    else:
+                        tags_to_unwrap.add(el.tag)
+                    continue
+                el.tag = tag
+                renamed = True
+            if el.keys():
+                el.attrib.clear()
+            if el.text is None and not len(el) and tag not in VOID_TAGS:
+                el.text = ''  # Serialize as <td></td> rather than <td/>
+        if tags_to_remove:
+            etree.strip_elements(raw, *tags_to_remove, with_tail=False)
+        if tags_to_unwrap:
+            etree.strip_tags(raw, *tags_to_unwrap)
+        raw.attrib.clear()
+        if renamed:
+            etree.cleanup_namespaces(raw)
+
+        serialized = etree.tostring(raw, encoding='unicode', with_tail=False)
+        if serialized.endswith('/>'):
+            return ''
+        # Strip the start and end tags of the XHTML element itself
+        return serialized[serialized.index('>') + 1:serialized.rindex('<')]
 
     @classmethod
     def parse_funcid(cls, raw):
@@ -114,7 +196,7 @@ class XmlParser:
         if raw is None:
             return (None, None)
 
-        match = re.fullmatch(r'((?:\d\d ){0,}\d\d) (.*)', raw)
+        match = FUNCID_RX.fullmatch(raw)
         return (match.group(1), match.group(2))
 
     @classmethod
@@ -149,27 +231,52 @@ class XmlParser:
         if raw is None:
             return None
 
-        date = None
+        return _parse_localized_datetime(cls, raw)
 
-        formats = [
-            '%m/%d/%Y %I:%M:%S %p',
-            '%m/%d/%Y %H:%M:%S',
+    @classmethod
+    def _parse_datetime_by_shape(cls, raw):
+        """
+        Parse a timestamp without strptime, if it has a known shape.
+
+        :rtype: datetime.datetime|None
+        """
+        m = DATETIME_RX.fullmatch(raw)
+        if not m:
+            return None
+        (first, separator, second, year, hour, minute, second_of_minute, am_pm) = m.groups()
+        (month, day) = (first, second) if separator == '/' else (second, first)
+        hour = int(hour)
+        if am_pm:
+            if not 1 <= hour <= 12:
+                return None
+            hour = (hour % 12) + (12 if am_pm.upper() == 'PM' else 0)
+        try:
+            return datetime.datetime(
+                int(year), int(month), int(day), hour, int(minute), int(second_of_minute))
+        except ValueError:
+            return None
 
-            '%d.%m.%Y %I:%M:%S %p',
-            '%d.%m.%Y %H:%M:%S',
-        ]
+    # Index of the last format in DATETIME_FORMATS which matched
+    _last_datetime_format = 0
 
-        for fmt in formats:
-            try:
-                date = datetime.datetime.strptime(raw, fmt)
-                break
-            except ValueError as r:
-                pass
+    @classmethod
+    def _parse_datetime_by_formats(cls, raw):
+        """
+        Parse a timestamp by trying the formats in DATETIME_FORMATS.
 
-        if date is None:
-            raise ParseError('Unknown timestamp')
+        The last successful format is tried first.
 
-        return LOCAL_TZ.localize(date)
+        :rtype: datetime.datetime|None
+        """
+        last = cls._last_datetime_format
+        for index in [last] + [x for x in range(len(DATETIME_FORMATS)) if x != last]:
+            try:
+                date = datetime.datetime.strptime(raw, DATETIME_FORMATS[index])
+            except ValueError:
+                continue
+            cls._last_datetime_format = index
+            return date
+        return None
 
     @classmethod
     def parse_datetime_range(cls, raw):
@@ -341,24 +448,27 @@ class XmlParser:
         if content is None:
             return None
 
-        s = ""
+        parts = []
 
         for section in content:
             heading = self.gt(section, 'SisaltoOtsikko')
             if heading is not None:
-                s += '<h2>{}</h2>\n'.format(heading)
+                parts.append('<h2>{}</h2>\n'.format(_escape(heading)))
 
             mystery = section.find('TekstiSektio/taso1')
             if mystery is not None:
                 for el in mystery:
                     if el.tag == 'Kappale':
-                        s += '<p>{}</p>\n'.format(self.gt(el, 'KappaleTeksti'))
+                        text = self.gt(el, 'KappaleTeksti')
+                        if text is not None:
+                            parts.append('<p>{}</p>\n'.format(_escape(text)))
                     elif el.tag == 'Otsikko':
-                        s += '<h3>{}<h3>\n'.format(el.text)
+                        # Only two heading levels are allowed
+                        parts.append('<h2>{}</h2>\n'.format(_escape(el.text or '')))
                     elif el.tag == 'XHTML':
-                        s += self.clean_html(el)
+                        parts.append(self.clean_html(el))
 
-            return s
+        return ''.join(parts)
 
     def import_action(self, ctx, action):
         """
@@ -433,9 +543,20 @@ class XmlParser:
 
         return attrs
 
-    def import_document(self, ctx, root):
+    def import_document(self, ctx, root, actions=None, action_errors=()):
         """
         Parse a single 'pöytäkirja' or 'viranhaltijan päätös'.
+
+        :type actions: list[dict]|None
+        :param actions:
+          The already parsed actions of the document, if they have been
+          parsed while streaming.  Otherwise they are parsed from the
+          'Paatokset' element of the root.
+        :type action_errors: list[dict]
+        :param action_errors:
+          Errors logged while parsing the given actions.  They are added
+          to the errors of the context where the actions would have
+          been parsed, to keep the errors in the document order.
         """
 
         attrs = {}
@@ -443,11 +564,13 @@ class XmlParser:
         event_metadata = root.find('PkKansilehtiSektio/KansilehtiToisto')
         event_metadata2 = root.find('YlatunnisteSektio')
 
-        actions = root.find('Paatokset')
-
         attrs['type'] = 'minutes'
         attrs['event'] = self.import_event(ctx, event_metadata, event_metadata2)
-        attrs['event']['actions'] = [self.import_action(ctx, ac) for ac in actions]
+        if actions is None:
+            actions = [self.import_action(ctx, ac) for ac in root.find('Paatokset')]
+        else:
+            ctx.errors.extend(action_errors)
+        attrs['event']['actions'] = actions
 
         # If this is a viranhaltijan päätös, we will add the
         # viranhaltija as the only person to the attendees.
@@ -468,7 +591,7 @@ class XmlParser:
     def import_esityslista(self, ctx, root):
         raise NotImplementedError("Parsing of agendas is not implemented")
 
-    def parse(self, source, except_treshold=logging.CRITICAL):
+    def parse(self, source, except_treshold=logging.CRITICAL, streaming=False):
         """
         Initiate parsing of a single document.
         """
@@ -476,6 +599,9 @@ class XmlParser:
         filename = source if isinstance(source, str) else source.name
         ctx = ParseContext(filename, except_treshold)
 
+        if streaming:
+            return self.parse_streaming(ctx, source)
+
         xml = etree.parse(source)
         root = xml.getroot()
 
@@ -488,6 +614,57 @@ class XmlParser:
 
         return Document(data, ctx.errors)
 
+    def parse_streaming(self, ctx, source):
+        """
+        Parse a document with iterparse, one action at a time.
+
+        Every action under 'Paatokset' is parsed as soon as its end tag
+        is seen and then cleared, so only the rest of the document and
+        a single action are kept in memory.  The resulting document is
+        the same as from a full parse, including the order of errors.
+        """
+        # The actions are logged to a context of their own, since in a
+        # full parse the event errors come before the action errors.
+        # They are merged to the document errors by `import_document`.
+        actions_ctx = ParseContext(ctx.filename, ctx.except_treshold)
+        actions = []
+        root = None
+        for (_event, el) in etree.iterparse(source, events=('end',)):
+            if root is None:
+                root = el.getroottree().getroot()
+                if root.tag == 'Esityslista':
+                    self.import_esityslista(ctx, root)
+                elif root.tag != 'Poytakirja':
+                    raise ValueError("Unknown root tag: {!r}".format(root.tag))
+            parent = el.getparent()
+            if parent is None or parent.tag != 'Paatokset' or parent.getparent() is not root:
+                continue
+            actions.append(self.import_action(actions_ctx, el))
+            el.clear()
+            while el.getprevious() is not None:
+                del parent[0]
+
+        data = self.import_document(ctx, root, actions, actions_ctx.errors)
+        return Document(data, ctx.errors)
+
+
+@functools.lru_cache(maxsize=1024)
+def _parse_localized_datetime(parser_class, raw):
+    # The actions of a document usually share the same timestamp, so
+    # cache the results to skip the slow localization of repeated ones
+    date = parser_class._parse_datetime_by_shape(raw)
+    if date is None:
+        date = parser_class._parse_datetime_by_formats(raw)
+
+    if date is None:
+        raise ParseError('Unknown timestamp')
+
+    return LOCAL_TZ.localize(date)
+
+
+def _escape(text):
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
 
 def _set_if_non_empty(mapping, key, value):
     if value:
@@ -0,0 +1,115 @@
+"""
+Benchmark of building the organization hierarchy of HelsinkiImporter.
+
+The benchmark generates a synthetic organization export in the format
+of the Helsinki organization API and measures the conversion of it to
+organizations and posts.  The database is not touched.
+"""
+import copy
+import datetime
+import random
+import resource
+import time
+
+from ..base import Importer
+from .organizations import HelsinkiImporter, Org
+
+NAMES = [
+    'Kaupunginhallitus', 'Kaupunkiympäristön toimiala', 'Rakennusvirasto',
+    'Kasvatuksen ja koulutuksen lautakunta', 'Liikuntapalvelut', 'Yksikkö',
+    'Osasto', 'Palvelukokonaisuus', 'Toimikunta']
+ORG_TYPES = [
+    Org.BOARD, Org.COMMITTEE, Org.FIELD, Org.DEPARTMENT, Org.DIVISION,
+    Org.UNIT, Org.WORKING_GROUP, Org.PACKAGED_SERVICE]
+
+
+def generate_organizations(count=50000, depth=2000, posts=0.1, seed=0):
+    """
+    Generate a synthetic organization export.
+
+    :type count: int
+    :param count: Number of organizations and posts
+    :type depth: int
+    :param depth: Depth of the deepest branch of the hierarchy
+    :type posts: float
+    :param posts: Fraction of the leaves which are office holder posts
+    :type seed: int
+    :param seed: Seed of the random generator for repeatable output
+    :rtype: list[dict]
+    """
+    rnd = random.Random(seed)
+    start = datetime.date(2010, 1, 1)
+    orgs = []
+    for num in range(count):
+        org_id = str(1000 + num)
+        if num == 0:
+            parent_id = None
+        elif num < depth:
+            # A single deep branch
+            parent_id = orgs[-1]['id']
+        else:
+            parent_id = orgs[rnd.randrange(num)]['id']
+        founded = start + datetime.timedelta(days=rnd.randrange(3000))
+        orgs.append({
+            'id': org_id,
+            'type': (Org.CITY if num == 0 else rnd.choice(ORG_TYPES)).value,
+            'name_fin': '{} {}'.format(rnd.choice(NAMES), num),
+            'name_swe': None,
+            'shortname': 'O{}'.format(num),
+            'start_time': '{}T00:00:00'.format(founded.isoformat()),
+            'end_time': None,
+            'modified_time': '{}T{:02d}:{:02d}:{:02d}.{:03d}'.format(
+                (founded + datetime.timedelta(days=rnd.randrange(365))).isoformat(),
+                rnd.randrange(24), rnd.randrange(60), rnd.randrange(60), rnd.randrange(1000)),
+            'visitaddress_street': 'Pohjoisesplanadi 11-13',
+            'visitaddress_zip': '17',
+            'people': [],
+            'parents': [{'id': parent_id, 'primary': True, 'end_time': None}] if parent_id else [],
+        })
+
+    # Office holders are leaves of the hierarchy
+    parent_ids = {x['parents'][0]['id'] for x in orgs if x['parents']}
+    for org in orgs:
+        if org['id'] not in parent_ids and org['parents'] and rnd.random() < posts:
+            org['type'] = Org.OFFICE_HOLDER.value
+    return orgs
+
+
+def run_benchmark(count=50000, depth=2000, rounds=3, **generator_kwargs):
+    """
+    Run the organization hierarchy benchmark.
+
+    :type count: int
+    :type depth: int
+    :type rounds: int
+    :param rounds: Number of builds to run, the fastest is reported
+    :param generator_kwargs: Other arguments for `generate_organizations`
+    :rtype: dict
+    """
+    org_list = generate_organizations(count=count, depth=depth, **generator_kwargs)
+    # The hierarchy is built without a data source, since it does not
+    # use the database
+    importer = HelsinkiImporter.__new__(HelsinkiImporter)
+    Importer.__init__(importer, {'verbosity': 0, 'include_people': False})
+
+    times = []
+    for _ in range(rounds):
+        orgs = copy.deepcopy(org_list)
+        start = time.perf_counter()
+        (output_orgs, output_posts) = importer.build_organizations(orgs)
+        times.append(time.perf_counter() - start)
+
+    return {
+        'date': datetime.datetime.utcnow().isoformat(),
+        'parameters': dict(generator_kwargs, count=count, depth=depth),
+        'organizations': len(output_orgs),
+        'posts': len(output_posts),
+        'results': {
+            'build': {
+                'seconds': min(times),
+                'nodes_per_second': count / min(times),
+            },
+        },
+        # Kilobytes on Linux
+        'peak_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
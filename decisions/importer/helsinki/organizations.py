@@ -3,6 +3,8 @@
 
 import json
 import datetime
+import functools
+import re
 import pytz
 from enum import Enum
 
@@ -16,6 +18,62 @@ from ..base import Importer
 
 LOCAL_TZ = pytz.timezone('Europe/Helsinki')
 
+ISO_DATETIME_RX = re.compile(
+    r'(\d{4})-(\d\d)-(\d\d)(?:[T ](\d\d):(\d\d)(?::(\d\d)(?:\.(\d{1,6})\d*)?)?)?$')
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_datetime(value):
+    """
+    Parse a timestamp of the organization export.
+
+    The export uses local ISO 8601 timestamps, which are parsed with a
+    regular expression.  Anything else is left to dateutil.
+
+    :type value: str
+    :rtype: datetime.datetime
+    """
+    match = ISO_DATETIME_RX.match(value)
+    if not match:
+        return dateutil_parse(value)
+    (year, month, day, hour, minute, second, fraction) = match.groups()
+    return datetime.datetime(
+        int(year), int(month), int(day), int(hour or 0), int(minute or 0), int(second or 0),
+        int(fraction.ljust(6, '0')) if fraction else 0)
+
+
+def parse_local_datetime(value):
+    """
+    Parse a timestamp of the organization export to local time.
+
+    Timestamps without an offset are in local time.  Timestamps with
+    one are converted to local time, keeping the instant they refer to.
+
+    :type value: str
+    :rtype: datetime.datetime
+    """
+    value = parse_datetime(value)
+    if value.tzinfo is not None:
+        return value.astimezone(LOCAL_TZ)
+    tzinfo = _get_local_tzinfo(value.date())
+    if tzinfo is None:
+        return LOCAL_TZ.localize(value)
+    return value.replace(tzinfo=tzinfo)
+
+
+@functools.lru_cache(maxsize=4096)
+def _get_local_tzinfo(date):
+    """
+    Get the local time zone of a day, if it is the same for all of it.
+
+    :type date: datetime.date
+    :rtype: datetime.tzinfo|None
+    :return: The time zone, or None on the days the UTC offset changes
+    """
+    first = LOCAL_TZ.localize(datetime.datetime.combine(date, datetime.time.min))
+    last = LOCAL_TZ.localize(datetime.datetime.combine(date, datetime.time.max))
+    return first.tzinfo if first.tzinfo is last.tzinfo else None
+
 
 class Org(Enum):
     COUNCIL = 1
@@ -72,7 +130,6 @@ class HelsinkiImporter(Importer):
         if created:
             self.logger.debug('Created new data source "helsinki"')
 
-    @transaction.atomic()
     def _import_organization(self, info):
         org_type = Org(info['type'])
         org = dict(origin_id=info['id'])
@@ -104,15 +161,15 @@ class HelsinkiImporter(Importer):
 
         org['founding_date'] = None
         if info['start_time']:
-            d = dateutil_parse(info['start_time'])
+            d = parse_datetime(info['start_time'])
             # 2009-01-01 means "no data"
             if not (d.year == 2009 and d.month == 1 and d.day == 1):
-                org['founding_date'] = d.date().strftime('%Y-%m-%d')
+                org['founding_date'] = d.date().isoformat()
 
         org['dissolution_date'] = None
         if info['end_time']:
-            d = dateutil_parse(info['end_time'])
-            org['dissolution_date'] = d.date().strftime('%Y-%m-%d')
+            d = parse_datetime(info['end_time'])
+            org['dissolution_date'] = d.date().isoformat()
 
         org['contact_details'] = []
         if info['visitaddress_street'] or info['visitaddress_zip']:
@@ -124,7 +181,7 @@ class HelsinkiImporter(Importer):
             cd['postcode'] = z
             org['contact_details'].append(cd)
 
-        org['modified_at'] = LOCAL_TZ.localize(dateutil_parse(info['modified_time']))
+        org['modified_at'] = parse_local_datetime(info['modified_time'])
 
         # Remove orgs that are actually posts from the org hierarchy
         if org_type in [Org.OFFICE_HOLDER, Org.TRUSTEE]:
@@ -196,17 +253,21 @@ class HelsinkiImporter(Importer):
                 obj.save()
             by_id_dict[obj.origin_id] = obj
 
-    def import_organizations(self, filename):
-        self._import_organization_classes()
-
-        self.logger.info('Importing organizations...')
+    def build_organizations(self, org_list):
+        """
+        Convert an organization export into organizations and posts.
 
-        with open(filename, 'r') as org_file:
-            org_list = json.load(org_file)
+        The hierarchy is walked depth first with an explicit stack, so
+        it can be arbitrarily deep, and each organization and post is
+        output after its parent.
 
+        :type org_list: list[dict]
+        :rtype: (list[dict], list[dict])
+        :return: Organizations and posts as `update_organizations` and
+          `update_posts` take them
+        """
         date_now = datetime.datetime.now().strftime('%Y-%m-%d')
         for org in org_list:
-            org['children'] = []
             if not org['parents']:
                 org['parent'] = None
                 del org['parents']
@@ -226,36 +287,55 @@ class HelsinkiImporter(Importer):
         self.skip_orgs = set()
 
         self.org_dict = {org['id']: org for org in org_list}
+        index_by_id = {org['id']: index for (index, org) in enumerate(org_list)}
+        children = [[] for _ in org_list]
         roots = []
-        for org in org_list:
+        for (index, org) in enumerate(org_list):
             if not org['parent']:
-                roots.append(org)
+                roots.append(index)
                 continue
-            self.org_dict[org['parent']]['children'].append(org)
+            children[index_by_id[org['parent']]].append(index)
+        for (index, org) in enumerate(org_list):
+            org['children'] = [org_list[x] for x in children[index]]
 
         output_org_list = []
         output_post_list = []
 
-        def import_nested(parent, org):
+        stack = list(reversed(roots))
+        while stack:
+            index = stack.pop()
+            org = org_list[index]
             output_org = self._import_organization(org)
             if not output_org:
-                return
+                continue
 
             entity_type = output_org.pop('entity_type')
             if entity_type == 'post':
                 output_post_list.append(output_org)
-                return
+                continue
 
             output_org_list.append(output_org)
             for child in org['children']:
                 assert child['parent'] == org['id']
                 child['parent'] = org
-                import_nested(output_org, child)
+            stack.extend(reversed(children[index]))
+
+        return (output_org_list, output_post_list)
+
+    def import_organizations(self, filename):
+        self._import_organization_classes()
+
+        self.logger.info('Importing organizations...')
+
+        with open(filename, 'r') as org_file:
+            org_list = json.load(org_file)
 
-        for root in roots:
-            import_nested(None, root)
+        (output_org_list, output_post_list) = self.build_organizations(org_list)
 
-        self.update_organizations(output_org_list)
-        self.update_posts(output_post_list)
+        # The posts refer to the organizations, so they are saved in the
+        # same transaction
+        with transaction.atomic():
+            self.update_organizations(output_org_list)
+            self.update_posts(output_post_list)
 
         self.logger.info('Import done!')
@@ -0,0 +1,108 @@
+"""
+Maintenance of the materialized ancestors of hierarchical models.
+"""
+import logging
+
+from .bulk import DEFAULT_BATCH_SIZE, bulk_update
+
+logger = logging.getLogger(__name__)
+
+# Separator of the names of the levels of a full name
+FULL_NAME_SEPARATOR = ' / '
+
+
+def get_ancestor_ids(parent_ids):
+    """
+    Get the ancestors of each node of a hierarchy.
+
+    :type parent_ids: dict[int,int|None]
+    :param parent_ids: Primary key of the parent by the primary key
+    :rtype: dict[int,list[int]]
+    :return: Primary keys of the ancestors, from the root to the parent,
+      by the primary key.  A parent missing from `parent_ids` is treated
+      as a root.
+    """
+    ancestors = {}
+    for pk in parent_ids:
+        # Walk up to the nearest node with known ancestors and fill in
+        # the ancestors of the nodes on the way back down
+        path = []
+        node = pk
+        while node in parent_ids and node not in ancestors:
+            if node in path:
+                logger.error('Cycle in the hierarchy at %s' % node)
+                ancestors[node] = []
+                break
+            path.append(node)
+            node = parent_ids.get(node)
+        for node in reversed(path):
+            if node in ancestors:
+                continue
+            parent = parent_ids.get(node)
+            if parent is None:
+                ancestors[node] = []
+            elif parent in ancestors:
+                ancestors[node] = ancestors[parent] + [parent]
+            else:
+                logger.warning('Parent %s of %s does not exist' % (parent, node))
+                ancestors[node] = [parent]
+    return ancestors
+
+
+def get_level_name(name, code=None):
+    """
+    Get the name of a level of a full name, prefixed with its code.
+
+    Names which already start with the code, e.g. ones made of the
+    code alone, are not prefixed again.
+
+    :type name: str
+    :type code: str|None
+    :rtype: str
+    """
+    if not code or name.startswith(code):
+        return name
+    return '%s %s' % (code, name)
+
+
+def update_ancestor_ids(model, batch_size=DEFAULT_BATCH_SIZE, name_field=None, code_field=None):
+    """
+    Update the ``ancestor_ids`` of every object of a model with a parent.
+
+    The hierarchy is read with one query and only the objects whose
+    ancestors changed are written.
+
+    :type model: type
+    :type name_field: str|None
+    :param name_field: Name of a field whose values from the root to
+      each object are also joined to its ``full_name``
+    :type code_field: str|None
+    :param code_field: Name of a field whose value prefixes the name
+      of each level of the ``full_name``
+    :rtype: int
+    :return: Number of updated objects
+    """
+    fields = ['pk', 'parent_id', 'ancestor_ids']
+    if name_field:
+        fields += [name_field, 'full_name']
+        if code_field:
+            fields.append(code_field)
+    rows = list(model.objects.values_list(*fields))
+    ancestors = get_ancestor_ids({row[0]: row[1] for row in rows})
+    if name_field:
+        names = {row[0]: get_level_name(row[3], row[5] if code_field else None) for row in rows}
+
+    changed = []
+    for row in rows:
+        pk = row[0]
+        values = {'ancestor_ids': ancestors[pk]}
+        if name_field:
+            values['full_name'] = FULL_NAME_SEPARATOR.join(
+                names[x] for x in ancestors[pk] + [pk] if x in names)
+        if list(row[2] or []) != values['ancestor_ids'] or (name_field and row[4] != values['full_name']):
+            changed.append(model(pk=pk, **values))
+    update_fields = ['ancestor_ids', 'full_name'] if name_field else ['ancestor_ids']
+    bulk_update(model, changed, update_fields, batch_size)
+    if changed:
+        logger.info('Updated ancestors of %d %s objects' % (len(changed), model.__name__))
+    return len(changed)
@@ -0,0 +1,148 @@
+"""
+Incremental reading of arrays in large JSON files.
+"""
+import json
+import re
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+WHITESPACE_RX = re.compile(r'[ \t\n\r]*')
+SEPARATOR_RX = re.compile(r'[ \t\n\r]*([,\]])[ \t\n\r]*')
+
+# Characters that may continue a number, which no complete value can
+# be followed by
+NUMBER_CONTINUATION = frozenset('0123456789.eE+-')
+
+
+def iterate_array(filename, key, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Iterate items of an array in the top level object of a JSON file.
+
+    Only one item is held in memory at a time.  The values before the
+    array are decoded and thrown away, item by item if they are arrays
+    too, so the memory use stays bounded for any size of the file.
+
+    :type filename: str
+    :type key: str
+    :param key: Key of the array in the top level object
+    :type chunk_size: int
+    :param chunk_size: Number of characters to read from the file at once
+    :rtype: collections.Iterable[object]
+    :raises KeyError: If the top level object does not have the key
+    :raises ValueError: If the file is not valid JSON
+    """
+    with open(filename, 'r', encoding='utf-8') as fp:
+        reader = JsonStreamReader(fp, chunk_size)
+        reader.expect('{')
+        while not reader.consume('}'):
+            name = reader.decode_value()
+            reader.expect(':')
+            if name == key:
+                yield from reader.iterate_value()
+                return
+            for _item in reader.iterate_value():
+                pass
+            reader.consume(',')
+    raise KeyError(key)
+
+
+class JsonStreamReader(object):
+    """
+    Reader of JSON values from a file, decoding them a chunk at a time.
+    """
+
+    def __init__(self, fp, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def iterate_value(self):
+        """
+        Iterate the items of the next value if it is an array.
+
+        Any other value is decoded and yielded as the only item.
+        """
+        if not self.consume('['):
+            yield self.decode_value()
+            return
+        if self.consume(']'):
+            return
+        while True:
+            value = self.decode_value()
+            separator = self._read_separator()
+            yield value
+            if separator == ']':
+                return
+
+    def decode_value(self):
+        self._skip_whitespace()
+        while True:
+            try:
+                (value, end) = self.decoder.raw_decode(self.buffer, self.pos)
+            except ValueError:
+                if self.eof:
+                    raise
+            else:
+                # A number cut at the end of the buffer may have decoded
+                # as a shorter one, e.g. "12." as 12, so it is complete
+                # only if a character that cannot continue it follows
+                if self.eof or (end < len(self.buffer) and self.buffer[end] not in NUMBER_CONTINUATION):
+                    self.pos = end
+                    return value
+            self._read_chunk()
+
+    def consume(self, char):
+        """
+        Skip the next character if it is the given one.
+
+        :type char: str
+        :rtype: bool
+        :return: True if the character was skipped
+        """
+        self._skip_whitespace()
+        if self.buffer.startswith(char, self.pos):
+            self.pos += 1
+            return True
+        return False
+
+    def expect(self, char):
+        if not self.consume(char):
+            raise ValueError('Expected {!r} at {!r}'.format(
+                char, self.buffer[self.pos:self.pos + 20]))
+
+    def _skip_whitespace(self):
+        while True:
+            self.pos = WHITESPACE_RX.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer) or self.eof:
+                return
+            self._read_chunk()
+
+    def _read_separator(self):
+        """
+        Read the separator after an item of an array and any whitespace.
+
+        :rtype: str
+        :return: The separator, i.e. a comma or a closing bracket
+        """
+        while True:
+            match = SEPARATOR_RX.match(self.buffer, self.pos)
+            if match and (match.end() < len(self.buffer) or self.eof):
+                self.pos = match.end()
+                return match.group(1)
+            if self.eof or not (match or self._at_whitespace_end()):
+                raise ValueError('Expected "," or "]" at {!r}'.format(
+                    self.buffer[self.pos:self.pos + 20]))
+            self._read_chunk()
+
+    def _at_whitespace_end(self):
+        return WHITESPACE_RX.match(self.buffer, self.pos).end() == len(self.buffer)
+
+    def _read_chunk(self):
+        chunk = self.fp.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
@@ -1,13 +1,34 @@
 # -*- coding: utf-8 -*-
+import collections
 import json
 
 from django.conf import settings
+from django.contrib.gis.geos import GEOSGeometry
+from django.db import transaction
 
 from decisions.models import (
     Action, Attachment, Case, CaseGeometry, Content, DataSource, Event,
     Function, Organization, Post)
 
 from .base import Importer
+from .bulk import DEFAULT_BATCH_SIZE, ModelChanges, bulk_create
+from .hierarchy import update_ancestor_ids
+from .json_stream import iterate_array
+
+
+class StreamedData(object):
+    """
+    Open Ahjo dump whose arrays are read from the file when iterated.
+
+    Each access of a key reads the file again from the start, and holds
+    only one item of the array in memory at a time.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+
+    def __getitem__(self, key):
+        return iterate_array(self.filename, key)
 
 
 class OpenAhjoImporter(Importer):
@@ -20,38 +41,131 @@ class OpenAhjoImporter(Importer):
         if created:
             self.logger.debug('Created new data source "open_ahjo"')
         self.meeting_to_org = None
-
+        self.batch_size = self.options.get('batch_size') or DEFAULT_BATCH_SIZE
+        self.counts = collections.Counter()
+
+    def _get_pk_map(self, model, scoped=True):
+        """
+        Get the primary keys of a model by their origin ids.
+
+        :type model: type
+        :type scoped: bool
+        :param scoped:
+          Only include the objects of our data source.  Organizations and
+          posts are not scoped, since they come from another importer.
+        :rtype: dict[str,int]
+        """
+        queryset = model.objects.all()
+        if scoped:
+            queryset = queryset.filter(data_source=self.data_source)
+        return dict(queryset.values_list('origin_id', 'pk'))
+
+    def _sync(self, model, values, batch_saved=None):
+        """
+        Create or update the objects of our data source in batches.
+
+        Each batch costs a query for loading the existing objects and
+        at most a few queries for writing the new and changed ones.  The
+        values are consumed a batch at a time, so they can be generated
+        from a stream.
+
+        :type model: type
+        :type values: collections.Iterable[(str|int,dict)]
+        :param values: Pairs of an origin id and field values by attribute
+          name, e.g. ``(123, {'ordering': 1, 'action_id': 42})``
+        :type batch_saved: function|None
+        :param batch_saved: Function to call with the (origin id, primary
+          key) pairs of each saved batch
+        :rtype: dict[str,int]
+        :return: Primary keys of the saved objects by origin id
+        """
+        pks = {}
+        batch = collections.OrderedDict()
+        for (origin_id, obj_values) in values:
+            # The ids of the dump are integers, but origin ids are strings
+            origin_id = str(origin_id)
+            # The last values win, if there are duplicates
+            batch.pop(origin_id, None)
+            batch[origin_id] = obj_values
+            if len(batch) >= self.batch_size:
+                pks.update(self._save_batch(model, batch, batch_saved))
+                batch = collections.OrderedDict()
+        pks.update(self._save_batch(model, batch, batch_saved))
+        self._log_counts(model)
+        return pks
+
+    def _save_batch(self, model, values_by_origin_id, batch_saved):
+        saved = self._sync_batch(model, values_by_origin_id)
+        if saved and batch_saved:
+            batch_saved(saved)
+        return saved
+
+    def _sync_batch(self, model, values_by_origin_id):
+        if not values_by_origin_id:
+            return []
+        existing = {x.origin_id: x for x in model.objects.filter(
+            data_source=self.data_source, origin_id__in=list(values_by_origin_id))}
+        changes = ModelChanges(model, self.data_source, self.counts, self.batch_size)
+        objs = [changes.add(existing.get(origin_id), obj_values, origin_id)
+                for (origin_id, obj_values) in values_by_origin_id.items()]
+        changes.save()
+        return [(obj.origin_id, obj.pk) for obj in objs]
+
+    def _log_counts(self, model):
+        name = model.__name__
+        self.logger.info('%s: %d created, %d updated' % (
+            name, self.counts[(name, 'created')], self.counts[(name, 'updated')]))
+
+    @transaction.atomic
     def _import_functions(self, data):
         self.logger.info('Importing functions...')
 
-        for function_data in data['categories']:
-            defaults = dict(
-                name=function_data['name'],
-                function_id=function_data['origin_id'],
-            )
-
-            parent_id = function_data['parent']
-            if parent_id:
-                try:
-                    defaults['parent'] = Function.objects.get(origin_id=parent_id)
-                except Function.DoesNotExist:
-                    self.logger('Function parent %s does not exist' % parent_id)
+        functions_data = collections.OrderedDict((str(x['id']), x) for x in data['categories'])
+        existing = {x.origin_id: x for x in Function.objects.filter(data_source=self.data_source)}
+        pks = self._get_pk_map(Function)
+
+        # Create the functions a tree level at a time, so that the
+        # parents of each level have primary keys
+        pending = list(functions_data.values())
+        orphans = set()
+        while pending:
+            changes = ModelChanges(Function, self.data_source, self.counts, self.batch_size)
+            deferred = []
+            for function_data in pending:
+                origin_id = str(function_data['id'])
+                parent_id = str(function_data['parent']) if function_data['parent'] else None
+                if parent_id and parent_id not in pks and origin_id not in orphans:
+                    deferred.append(function_data)
                     continue
-
-            function, created = Function.objects.update_or_create(
-                origin_id=function_data['id'],
-                data_source=self.data_source,
-                defaults=defaults
-            )
-
-            if created:
-                self.logger.info('Created function %s' % function)
-
+                function = changes.add(existing.get(origin_id), {
+                    'name': function_data['name'],
+                    'function_id': function_data['origin_id'],
+                    'parent_id': pks.get(parent_id) if parent_id else None,
+                }, origin_id)
+                existing[function.origin_id] = function
+            changes.save()
+            pks.update((x.origin_id, x.pk) for x in existing.values())
+            if deferred and len(deferred) == len(pending):
+                # None of the remaining parents will appear, so import
+                # the rest without a parent
+                for function_data in deferred:
+                    self.logger.error('Function parent %s does not exist' % function_data['parent'])
+                    orphans.add(str(function_data['id']))
+            pending = deferred
+
+        update_ancestor_ids(Function, self.batch_size, name_field='name', code_field='function_id')
+        self._log_counts(Function)
+
+    @transaction.atomic
     def _import_events(self, data):
         self.logger.info('Importing events...')
 
-        for meeting_data in data['meetings']:
-            defaults = dict(
+        self._sync(Event, self._get_event_values(data['meetings']))
+
+    def _get_event_values(self, meetings):
+        orgs = self._get_pk_map(Organization, scoped=False)
+        for meeting_data in meetings:
+            values = dict(
                 start_date=meeting_data['date'],
                 end_date=meeting_data['date'],
             )
@@ -60,175 +174,187 @@ class OpenAhjoImporter(Importer):
             if organization_data:
                 if organization_data['type'] == 'office_holder':
                     continue
-                try:
-                    organization = Organization.objects.get(origin_id=organization_data['origin_id'])
-                    defaults['organization'] = organization
-                except Organization.DoesNotExist:
+                organization_id = orgs.get(str(organization_data['origin_id']))
+                if not organization_id:
                     self.logger.error('Organization %s does not exist' % organization_data['origin_id'])
                     continue
+                values['organization_id'] = organization_id
 
-            event, created = Event.objects.update_or_create(
-                data_source=self.data_source,
-                origin_id=meeting_data['id'],
-                defaults=defaults
-            )
-
-            if created:
-                self.logger.info('Created event %s' % event)
+            yield (meeting_data['id'], values)
 
+    @transaction.atomic
     def _import_case_geometries(self, data):
         self.logger.info('Importing case geometries...')
 
-        for geometry_data in data['issue_geometries']:
-            defaults = dict(
+        self._sync(CaseGeometry, self._get_case_geometry_values(data['issue_geometries']))
+
+    def _get_case_geometry_values(self, issue_geometries):
+        srid = CaseGeometry._meta.get_field('geometry').srid
+        for geometry_data in issue_geometries:
+            geometry = geometry_data['geometry']
+            if isinstance(geometry, dict):
+                geometry = json.dumps(geometry)
+            yield (geometry_data['id'], dict(
                 name=geometry_data['name'],
                 type=geometry_data['type'],
-                geometry=geometry_data['geometry'],
-            )
-
-            case_geometry, created = CaseGeometry.objects.update_or_create(
-                data_source=self.data_source,
-                origin_id=geometry_data['id'],
-                defaults=defaults,
-            )
-
-            if created:
-                self.logger.info('Created case geometry %s' % case_geometry)
+                # Parsed here so that unchanged geometries compare equal.
+                # GeoJSON has no SRID, so it is in the SRID of the field
+                # like the saved geometries.
+                geometry=GEOSGeometry(geometry, srid=srid),
+            ))
 
+    @transaction.atomic
     def _import_cases(self, data):
         self.logger.info('Importing cases...')
 
-        for issue_data in data['issues']:
-            defaults = dict(
-                title=issue_data['subject'],
-                register_id=issue_data['register_id'],
-            )
-
-            try:
-                defaults['function'] = Function.objects.get(origin_id=issue_data['category'])
-            except Function.DoesNotExist:
-                self.logger.error('Function %s does not exist' % issue_data['category'])
-                continue
+        # Geometry origin ids of the cases read but not yet saved, so
+        # that only a batch of them is kept in memory
+        pending_geometries = {}
+        geometries = self._get_pk_map(CaseGeometry, scoped=False)
 
-            case, created = Case.objects.update_or_create(
-                data_source=self.data_source,
-                origin_id=issue_data['id'],
-                defaults=defaults,
-            )
+        def update_geometries(cases):
+            self._update_case_geometries(cases, pending_geometries, geometries)
+            for (origin_id, _case_id) in cases:
+                pending_geometries.pop(origin_id, None)
 
-            if created:
-                self.logger.info('Created case %s' % case)
+        self._sync(Case, self._get_case_values(data['issues'], pending_geometries), update_geometries)
 
-            case.geometries = CaseGeometry.objects.filter(origin_id__in=issue_data['geometries'])
+    def _get_case_values(self, issues, geometries_by_origin_id):
+        functions = self._get_pk_map(Function)
+        for issue_data in issues:
+            function_id = functions.get(str(issue_data['category']))
+            if not function_id:
+                self.logger.error('Function %s does not exist' % issue_data['category'])
+                continue
 
+            geometries_by_origin_id[str(issue_data['id'])] = [str(x) for x in issue_data['geometries']]
+            yield (issue_data['id'], dict(
+                title=issue_data['subject'],
+                register_id=issue_data['register_id'],
+                function_id=function_id,
+            ))
+
+    def _update_case_geometries(self, cases, geometries_by_origin_id, geometries):
+        """
+        Set the geometries of a batch of saved cases.
+
+        :type cases: list[(str,int)]
+        :param cases: Origin ids and primary keys of the cases
+        :type geometries_by_origin_id: dict[str,list[str]]
+        :param geometries_by_origin_id: Geometry origin ids by case origin id
+        :type geometries: dict[str,int]
+        :param geometries: Geometry primary keys by origin id
+        """
+        through = Case.geometries.through
+        wanted = set()
+        for (origin_id, case_id) in cases:
+            wanted.update(
+                (case_id, geometries[x]) for x in geometries_by_origin_id[origin_id]
+                if x in geometries)
+
+        current = {
+            (x.case_id, x.casegeometry_id): x.pk for x in through.objects.filter(
+                case_id__in=[case_id for (_origin_id, case_id) in cases])}
+        stale = [pk for (key, pk) in current.items() if key not in wanted]
+        if stale:
+            through.objects.filter(pk__in=stale).delete()
+        bulk_create(through, [
+            through(case_id=case_id, casegeometry_id=geometry_id)
+            for (case_id, geometry_id) in wanted if (case_id, geometry_id) not in current
+        ], self.batch_size)
+
+    @transaction.atomic
     def _import_actions(self, data):
         self.logger.info('Importing actions...')
 
-        for agenda_item_data in data['agenda_items']:
+        self._sync(Action, self._get_action_values(data['agenda_items']))
+
+    def _get_action_values(self, agenda_items):
+        cases = self._get_pk_map(Case)
+        events = self._get_pk_map(Event)
+        posts = self._get_pk_map(Post, scoped=False)
+        for agenda_item_data in agenda_items:
             org = self.meeting_to_org.get(agenda_item_data['meeting'])
             if not org:
                 self.logger.error('Cannot find matching org for meeting %s' % agenda_item_data['meeting'])
                 continue
 
-            defaults = dict(
+            values = dict(
                 title=agenda_item_data['subject'],
                 ordering=agenda_item_data['index'],
                 resolution=agenda_item_data['resolution'] or '',
             )
             if agenda_item_data['issue']:
-                try:
-                    case = Case.objects.get(origin_id=agenda_item_data['issue'])
-                    defaults['case'] = case
-                except Case.DoesNotExist:
+                values['case_id'] = cases.get(str(agenda_item_data['issue']))
+                if not values['case_id']:
                     self.logger.error('Case %s does not exist' % agenda_item_data['issue'])
                     continue
             if org['type'] == 'office_holder':
-                try:
-                    post = Post.objects.get(origin_id=org['origin_id'])
-                    defaults['post'] = post
-                except Post.DoesNotExist:
+                values['post_id'] = posts.get(str(org['origin_id']))
+                if not values['post_id']:
                     self.logger.error('Post %s does not exist' % org['origin_id'])
                     continue
             else:
-                try:
-                    event = Event.objects.get(origin_id=agenda_item_data['meeting'])
-                    defaults['event'] = event
-                except Event.DoesNotExist:
+                values['event_id'] = events.get(str(agenda_item_data['meeting']))
+                if not values['event_id']:
                     self.logger.error('Event %s does not exist' % agenda_item_data['meeting'])
                     continue
 
-            action, created = Action.objects.update_or_create(
-                data_source=self.data_source,
-                origin_id=agenda_item_data['id'],
-                defaults=defaults
-            )
-
-            if created:
-                self.logger.info('Created action %s' % action)
+            yield (agenda_item_data['id'], values)
 
+    @transaction.atomic
     def _import_contents(self, data):
         self.logger.info('Importing contents...')
 
-        for content_section_data in data['content_sections']:
-            defaults = dict(
-                hypertext=content_section_data['text'],
-                type=content_section_data['type'],
-                ordering=content_section_data['index'],
-            )
+        self._sync(Content, self._get_content_values(data['content_sections']))
 
+    def _get_content_values(self, content_sections):
+        actions = self._get_pk_map(Action)
+        for content_section_data in content_sections:
             action_id = content_section_data.get('agenda_item')
-            try:
-                action = Action.objects.get(origin_id=action_id)
-                defaults['action'] = action
-            except Action.DoesNotExist:
+            if str(action_id) not in actions:
                 self.logger.error('Action %s does not exist' % action_id)
                 continue
 
-            content, created = Content.objects.update_or_create(
-                data_source=self.data_source,
-                origin_id=content_section_data['id'],
-                defaults=defaults
-            )
-
-            if created:
-                self.logger.info('Created content %s' % content)
+            yield (content_section_data['id'], dict(
+                hypertext=content_section_data['text'],
+                type=content_section_data['type'],
+                ordering=content_section_data['index'],
+                action_id=actions[str(action_id)],
+            ))
 
+    @transaction.atomic
     def _import_attachments(self, data):
         self.logger.info('Importing attachments...')
 
+        self._sync(Attachment, self._get_attachment_values(data['attachments']))
+
+    def _get_attachment_values(self, attachments):
         url_base = getattr(settings, 'OPEN_AHJO_ATTACHMENT_URL_BASE', None)
+        actions = self._get_pk_map(Action)
+        for attachment_data in attachments:
+            action_id = attachment_data.get('agenda_item')
+            if str(action_id) not in actions:
+                self.logger.error('Action %s does not exist' % action_id)
+                continue
 
-        for attachment_data in data['attachments']:
-            defaults = dict(
+            yield (attachment_data['id'], dict(
                 name=attachment_data['name'] or '',
                 url=url_base + attachment_data['url'] if attachment_data['url'] and url_base else '',
                 number=attachment_data['number'],
                 public=attachment_data['public'],
                 confidentiality_reason=attachment_data['confidentiality_reason'] or '',
-            )
-
-            action_id = attachment_data.get('agenda_item')
-            try:
-                action = Action.objects.get(origin_id=action_id)
-                defaults['action'] = action
-            except Action.DoesNotExist:
-                self.logger.error('Action %s does not exist' % action_id)
-                continue
-
-            attachment, created = Attachment.objects.update_or_create(
-                data_source=self.data_source,
-                origin_id=attachment_data['id'],
-                defaults=defaults
-            )
-
-            if created:
-                self.logger.info('Created attachment %s' % attachment)
+                action_id=actions[str(action_id)],
+            ))
 
     def import_data(self):
         self.logger.info('Importing open ahjo data...')
 
-        with open(self.options['filename'], 'r') as data_file:
-            data = json.load(data_file)
+        if self.options.get('stream'):
+            data = StreamedData(self.options['filename'])
+        else:
+            with open(self.options['filename'], 'r') as data_file:
+                data = json.load(data_file)
 
         # pre calc meeting to org mapping
         org_dict = {o['origin_id']: o for o in data['organizations']}
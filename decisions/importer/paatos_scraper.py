@@ -1,18 +1,78 @@
 # -*- coding: utf-8 -*-
+import collections
+import io
 import json
-import os
-import os.path
-import tempfile
+import threading
+import time
 import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import dateutil.parser
+from django.db import IntegrityError, connection, transaction
 from django.utils.text import slugify
 
 from decisions.models import (
     Action, Attachment, Case, CaseGeometry, Content, DataSource, Event,
-    Function, Organization)
+    Function, Organization, OrganizationClass)
 
 from .base import Importer
+from .hierarchy import update_ancestor_ids
+
+
+class ArchiveIndex(object):
+    """
+    Directory structure of a ZIP archive, for reading it in place.
+    """
+
+    def __init__(self, archive):
+        """
+        Index the member names of the archive.
+
+        The directories need not have members of their own, since they
+        are derived from the paths of the files.
+
+        :type archive: zipfile.ZipFile
+        """
+        self.zipfile = archive
+        self.files = set()
+        self.children = collections.defaultdict(collections.OrderedDict)
+        for name in archive.namelist():
+            if not name.endswith('/'):
+                self.files.add(name)
+            parts = name.rstrip('/').split('/')
+            for depth in range(1, len(parts)):
+                self.children['/'.join(parts[:depth])][parts[depth]] = None
+
+    def is_file(self, name):
+        return name in self.files
+
+    def list_directory(self, path):
+        """
+        List the names in a directory in the order of the archive.
+
+        :type path: str
+        :rtype: list[str]
+        :return: Names of the entries, or an empty list if the directory
+          does not exist
+        """
+        return list(self.children.get(path, ()))
+
+    def reopen(self):
+        """
+        Get a copy of the index with a new handle of the archive file.
+
+        The copy can be read in another thread.  Its file should be
+        closed with `close` after use.
+
+        :rtype: ArchiveIndex
+        """
+        copy = ArchiveIndex.__new__(ArchiveIndex)
+        copy.__dict__.update(self.__dict__)
+        copy.zipfile = zipfile.ZipFile(self.zipfile.filename, 'r')
+        return copy
+
+    def close(self):
+        self.zipfile.close()
 
 
 class PaatosScraperImporter(Importer):
@@ -24,21 +84,79 @@ class PaatosScraperImporter(Importer):
         )
         if created:
             self.logger.debug('Created new data source "%s"' % identifier)
+        self.workers = self.options.get('workers') or 1
+        self.org_class_by_id = {}
+        # Functions are shared by the organizations, which may be
+        # imported concurrently.  They are unique by their origin id, so
+        # two threads creating the same function at once would make one
+        # of them fail on the unique constraint.  The lock serializes the
+        # creation and the updates of `functions_by_id` instead.
+        self.function_lock = threading.Lock()
+
+        # Primary keys by origin id of the objects of the data source,
+        # loaded by `_load_pk_maps` and filled as objects are saved
+        self.organizations_by_id = {}
+        self.functions_by_id = {}
+        self.cases_by_id = {}
+        self.events_by_id = {}
+        self.actions_by_id = {}
+
+    def _load_pk_maps(self):
+        for (pks, model) in [
+                (self.organizations_by_id, Organization),
+                (self.functions_by_id, Function),
+                (self.cases_by_id, Case),
+                (self.events_by_id, Event),
+                (self.actions_by_id, Action)]:
+            pks.clear()
+            pks.update(model.objects.filter(data_source=self.data_source).values_list('origin_id', 'pk'))
 
     def _import_organization(self, data):
+        """
+        Import an organization without its parent.
+
+        :rtype: (str, str|None)
+        :return: Origin ids of the organization and its parent
+        """
         classification = data['classification'].title()
-        org = dict(origin_id=data['sourceId'])
-        org['classification'] = classification
+        if classification not in self.org_class_by_id:
+            self.org_class_by_id[classification], _created = OrganizationClass.objects.get_or_create(
+                data_source=self.data_source, origin_id=classification,
+                defaults={'name': classification})
 
+        org = dict(classification=classification)
         org['name'] = data['name']
-        org['slug'] = slugify(org['origin_id'])
+        org['slug'] = slugify(data['sourceId'])
 
         org['founding_date'] = data['founding_date']
         org['dissolution_date'] = data['dissolution_date']
 
-        org['parent'] = data['parent']
-
-        self.save_organization(org)
+        obj = Organization.objects.filter(data_source=self.data_source, origin_id=data['sourceId']).first()
+        if not obj:
+            obj = Organization(data_source=self.data_source, origin_id=data['sourceId'])
+        self.save_organization(obj, org)
+        if obj.pk:
+            self.organizations_by_id[obj.origin_id] = obj.pk
+        return (data['sourceId'], data['parent'])
+
+    def _update_organization_parents(self, parents):
+        """
+        Set the parents of the imported organizations.
+
+        :type parents: dict[str,str|None]
+        :param parents: Origin ids of the parents by the origin id
+        """
+        orgs = {x.origin_id: x for x in Organization.objects.filter(data_source=self.data_source)}
+        for (origin_id, parent_id) in parents.items():
+            parent = orgs.get(parent_id) if parent_id else None
+            if parent_id and not parent:
+                self.logger.error('Parent organization %s does not exist' % parent_id)
+            obj = orgs[origin_id]
+            obj._changed_fields = []
+            self._update_fields(obj, {'parent_id': parent.id if parent else None})
+            if obj._changed_fields:
+                obj.save(update_fields=['parent'])
+        update_ancestor_ids(Organization, name_field='name')
 
     def _import_function(self, name, source_id):
         self.logger.info('Importing functions...')
@@ -53,6 +171,7 @@ class PaatosScraperImporter(Importer):
             data_source=self.data_source,
             defaults=defaults
         )
+        self.functions_by_id[function.origin_id] = function.pk
 
         if created:
             self.logger.info('Created function %s' % function)
@@ -68,10 +187,8 @@ class PaatosScraperImporter(Importer):
             name=data['name']
         )
 
-        try:
-            organization = Organization.objects.get(origin_id=organization_source_id)
-            defaults['organization'] = organization
-        except Organization.DoesNotExist:
+        defaults['organization_id'] = self.organizations_by_id.get(organization_source_id)
+        if not defaults['organization_id']:
             self.logger.error('Organization %s does not exist' % organization_source_id)
             return
 
@@ -80,6 +197,7 @@ class PaatosScraperImporter(Importer):
             origin_id=data['sourceId'],
             defaults=defaults
         )
+        self.events_by_id[event.origin_id] = event.pk
 
         if created:
             self.logger.info('Created event %s' % event)
@@ -94,20 +212,53 @@ class PaatosScraperImporter(Importer):
                 register_id=case_data['registerId'],
             )
 
-            try:
-                defaults['function'] = Function.objects.get(origin_id=case_data['functionId'])
-            except Function.DoesNotExist:
-                defaults['function'] = self._import_function(case_data['functionId'], case_data['functionId'])
+            with self.function_lock:
+                defaults['function_id'] = self.functions_by_id.get(case_data['functionId'])
+                if not defaults['function_id']:
+                    defaults['function_id'] = self._import_function(
+                        case_data['functionId'], case_data['functionId']).pk
 
-            case, created = Case.objects.update_or_create(
-                data_source=self.data_source,
-                origin_id=case_data['sourceId'],
-                defaults=defaults,
-            )
+            try:
+                (case, created) = self._save_case(case_data['sourceId'], defaults)
+            except IntegrityError as error:
+                other_sources = Case.objects.filter(
+                    register_id=case_data['registerId']).exclude(data_source=self.data_source)
+                if other_sources.exists():
+                    self.logger.error('Case %s exists in another data source' % case_data['registerId'])
+                else:
+                    self.logger.error('Cannot save case %s: %s' % (case_data['registerId'], error))
+                continue
+            self.cases_by_id[case.origin_id] = case.pk
 
             if created:
                 self.logger.info('Created case %s' % case)
 
+    def _save_case(self, origin_id, defaults):
+        """
+        Create or update a case by its origin id.
+
+        Another organization may create the same case concurrently
+        between the lookup and the insert of `update_or_create`, which
+        makes the insert fail on the unique origin id.  The case exists
+        then, so the upsert is retried once to update it.
+
+        :type origin_id: str
+        :type defaults: dict
+        :rtype: (Case, bool)
+        :raises IntegrityError: if the case cannot be saved
+        """
+        for retry in (True, False):
+            try:
+                with transaction.atomic():
+                    return Case.objects.update_or_create(
+                        data_source=self.data_source,
+                        origin_id=origin_id,
+                        defaults=defaults,
+                    )
+            except IntegrityError:
+                if not retry:
+                    raise
+
     def _import_action(self, data):
         self.logger.info('Importing action...')
 
@@ -117,16 +268,12 @@ class PaatosScraperImporter(Importer):
             article_number=data['articleNumber']
         )
         if data['caseId']:
-            try:
-                case = Case.objects.get(origin_id=data['caseId'])
-                defaults['case'] = case
-            except Case.DoesNotExist:
+            defaults['case_id'] = self.cases_by_id.get(data['caseId'])
+            if not defaults['case_id']:
                 self.logger.error('Case %s does not exist' % data['caseId'])
                 return
-        try:
-            event = Event.objects.get(origin_id=data['eventId'])
-            defaults['event'] = event
-        except Event.DoesNotExist:
+        defaults['event_id'] = self.events_by_id.get(data['eventId'])
+        if not defaults['event_id']:
             self.logger.error('Event %s does not exist' % data['eventId'])
             return
 
@@ -135,6 +282,7 @@ class PaatosScraperImporter(Importer):
             origin_id=data['sourceId'],
             defaults=defaults
         )
+        self.actions_by_id[action.origin_id] = action.pk
 
         if created:
             self.logger.info('Created action %s' % action)
@@ -142,6 +290,11 @@ class PaatosScraperImporter(Importer):
     def _import_contents(self, data, action_source_id):
         self.logger.info('Importing action contents...')
 
+        action_id = self.actions_by_id.get(action_source_id)
+        if not action_id:
+            self.logger.error('Action %s does not exist' % action_source_id)
+            return
+
         for content_data in data:
 
             content_title = content_data['title']
@@ -153,16 +306,10 @@ class PaatosScraperImporter(Importer):
                 title=content_title,
                 hypertext=content_data['content'],
                 type='',
-                ordering=content_data['order']
+                ordering=content_data['order'],
+                action_id=action_id,
             )
 
-            try:
-                action = Action.objects.get(origin_id=action_source_id)
-                defaults['action'] = action
-            except Action.DoesNotExist:
-                self.logger.error('Action %s does not exist' % action_source_id)
-                continue
-
             content, created = Content.objects.update_or_create(
                 data_source=self.data_source,
                 origin_id=str(content_data['order']) + '-' + action_source_id,
@@ -184,10 +331,8 @@ class PaatosScraperImporter(Importer):
                 confidentiality_reason=attachment_data['confidentialityReason'] or '',
             )
 
-            try:
-                action = Action.objects.get(origin_id=attachment_data['actionId'])
-                defaults['action'] = action
-            except Action.DoesNotExist:
+            defaults['action_id'] = self.actions_by_id.get(attachment_data['actionId'])
+            if not defaults['action_id']:
                 self.logger.error('Action %s does not exist' % attachment_data['actionId'])
                 continue
 
@@ -200,50 +345,60 @@ class PaatosScraperImporter(Importer):
             if created:
                 self.logger.info('Created attachment %s' % attachment)
 
-    def _handle_organization(self, organization_path):
-        if os.path.isfile(organization_path):
-            with open(organization_path, 'r') as org_file:
-                self._import_organization(json.load(org_file))
-
-    def _handle_organization_cases(self, cases_path):
-        if os.path.isfile(cases_path):
-            with open(cases_path, 'r') as cases_file:
-                self._import_cases(json.load(cases_file))
-
-    def _handle_organization_events(self, events_path, organization_source_id):
-        if os.path.exists(events_path):
-            for event_source_id in os.listdir(events_path):
-                event_json_path = events_path + '/' + event_source_id + '/index.json'
-                if os.path.isfile(event_json_path):
-                    with open(event_json_path, 'r') as event_file:
-                        self._import_event(json.load(event_file), organization_source_id)
-                        action_folder = events_path + '/' + event_source_id + '/actions'
-                        self._handle_organization_event_actions(
-                            action_folder,
-                            organization_source_id,
-                            event_source_id)
-
-    def _handle_organization_event_actions(self, actions_path, organization_source_id, event_source_id):
-        if os.path.exists(actions_path):
-            for action_source_id in os.listdir(actions_path):
-                action_file_path = actions_path + '/' + action_source_id + '/index.json'
-                contents_file_path = actions_path + '/' + action_source_id + '/contents.json'
-                attachment_file_path = actions_path + '/' + action_source_id + '/attachments.json'
-                if os.path.isfile(action_file_path):
-                    with open(action_file_path, 'r') as action_file:
-                        self._import_action(json.load(action_file))
-                        self._handle_contents(contents_file_path, action_source_id)
-                        self._handle_attachments(attachment_file_path)
-
-    def _handle_contents(self, contents_path, action_id):
-        if os.path.isfile(contents_path):
-            with open(contents_path, 'r') as contents_file:
-                self._import_contents(json.load(contents_file), action_id)
-
-    def _handle_attachments(self, attachment_path):
-        if os.path.isfile(attachment_path):
-            with open(attachment_path, 'r') as attachment_file:
-                self._import_attachments(json.load(attachment_file))
+    def _read_json(self, archive, name):
+        """
+        Read a JSON file from the archive.
+
+        :type archive: ArchiveIndex
+        :type name: str
+        :rtype: object|None
+        :return: The decoded data, or None if the file does not exist
+        """
+        if not archive.is_file(name):
+            return None
+        with archive.zipfile.open(name) as fp:
+            return json.load(io.TextIOWrapper(fp, encoding='utf-8'))
+
+    def _handle_organization(self, archive, organization_path):
+        data = self._read_json(archive, organization_path)
+        if data is not None:
+            return self._import_organization(data)
+
+    def _handle_organization_cases(self, archive, cases_path):
+        data = self._read_json(archive, cases_path)
+        if data is not None:
+            self._import_cases(data)
+
+    def _handle_organization_events(self, archive, events_path, organization_source_id):
+        for event_source_id in archive.list_directory(events_path):
+            event_data = self._read_json(archive, events_path + '/' + event_source_id + '/index.json')
+            if event_data is not None:
+                self._import_event(event_data, organization_source_id)
+                action_folder = events_path + '/' + event_source_id + '/actions'
+                self._handle_organization_event_actions(
+                    archive,
+                    action_folder,
+                    organization_source_id,
+                    event_source_id)
+
+    def _handle_organization_event_actions(self, archive, actions_path, organization_source_id, event_source_id):
+        for action_source_id in archive.list_directory(actions_path):
+            action_path = actions_path + '/' + action_source_id
+            action_data = self._read_json(archive, action_path + '/index.json')
+            if action_data is not None:
+                self._import_action(action_data)
+                self._handle_contents(archive, action_path + '/contents.json', action_source_id)
+                self._handle_attachments(archive, action_path + '/attachments.json')
+
+    def _handle_contents(self, archive, contents_path, action_id):
+        data = self._read_json(archive, contents_path)
+        if data is not None:
+            self._import_contents(data, action_id)
+
+    def _handle_attachments(self, archive, attachment_path):
+        data = self._read_json(archive, attachment_path)
+        if data is not None:
+            self._import_attachments(data)
 
     def import_data(self):
         self.logger.info('Importing data...')
@@ -257,14 +412,74 @@ class PaatosScraperImporter(Importer):
             Content.objects.all().delete()
             Attachment.objects.all().delete()
 
-        with tempfile.TemporaryDirectory() as temp_dirpath:
-            zip_ref = zipfile.ZipFile(self.options['zipfile'], 'r')
-            zip_ref.extractall(temp_dirpath)
-            zip_ref.close()
-            for organization_source_id in os.listdir(temp_dirpath + '/organizations'):
-                current_path = temp_dirpath + '/organizations/' + organization_source_id
-                self._handle_organization(current_path + '/index.json')
-                self._handle_organization_cases(current_path + '/cases.json')
-                self._handle_organization_events(current_path + '/events', organization_source_id)
-
-            self.logger.info('Import done!')
+        self._load_pk_maps()
+
+        start = time.perf_counter()
+        with zipfile.ZipFile(self.options['zipfile'], 'r') as zip_ref:
+            archive = ArchiveIndex(zip_ref)
+            organization_source_ids = archive.list_directory('organizations')
+
+            # Organizations are imported first, so that they exist for
+            # the parents and the events regardless of the order
+            parents = dict(filter(None, (
+                self._handle_organization(archive, 'organizations/' + x + '/index.json')
+                for x in organization_source_ids)))
+            self._update_organization_parents(parents)
+
+            # The cases of all organizations are imported before the
+            # events, since actions may refer to the cases of others
+            timings = collections.Counter()
+            for handler in [self._import_organization_cases, self._import_organization_events]:
+                timings.update(self._run_per_organization(handler, archive, organization_source_ids))
+
+        update_ancestor_ids(Function, name_field='name', code_field='function_id')
+        self._log_timings(timings, time.perf_counter() - start)
+        self.logger.info('Import done!')
+
+    def _import_organization_cases(self, archive, organization_source_id):
+        self._handle_organization_cases(archive, 'organizations/' + organization_source_id + '/cases.json')
+
+    def _import_organization_events(self, archive, organization_source_id):
+        self._handle_organization_events(
+            archive, 'organizations/' + organization_source_id + '/events', organization_source_id)
+
+    def _run_per_organization(self, handler, archive, organization_source_ids):
+        """
+        Run a handler for each organization, concurrently if configured.
+
+        :type handler: (ArchiveIndex, str) -> None
+        :rtype: dict[str,float]
+        :return: Seconds spent by the origin id of the organization
+        """
+        if self.workers <= 1:
+            return {x: self._run_timed(handler, archive, x) for x in organization_source_ids}
+
+        timings = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {
+                executor.submit(self._run_in_thread, handler, archive, x): x
+                for x in organization_source_ids
+            }
+            for future in as_completed(futures):
+                timings[futures[future]] = future.result()
+        return timings
+
+    def _run_timed(self, handler, archive, organization_source_id):
+        start = time.perf_counter()
+        handler(archive, organization_source_id)
+        return time.perf_counter() - start
+
+    def _run_in_thread(self, handler, archive, organization_source_id):
+        archive = archive.reopen()
+        try:
+            return self._run_timed(handler, archive, organization_source_id)
+        finally:
+            archive.close()
+            # Each thread has a database connection of its own
+            connection.close()
+
+    def _log_timings(self, timings, total_seconds):
+        self.logger.info('Imported %d organizations in %.1f s with %d workers (%.1f s of work)' % (
+            len(timings), total_seconds, self.workers, sum(timings.values())))
+        for (organization_source_id, seconds) in sorted(timings.items(), key=lambda x: -x[1]):
+            self.logger.info('  %-40s %8.2f s' % (organization_source_id, seconds))
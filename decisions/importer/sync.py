@@ -1,5 +1,7 @@
+import collections
 import logging
 
+from .bulk import DEFAULT_BATCH_SIZE, bulk_create, bulk_update
 
 logger = logging.getLogger(__name__)
 
@@ -7,7 +9,8 @@ logger = logging.getLogger(__name__)
 class ModelSyncher(object):
 
     def __init__(self, queryset, generate_obj_id, delete_func=None,
-                 delete_limit=0.4, skip_delete=False):
+                 delete_limit=0.4, skip_delete=False, bulk=False,
+                 batch_size=DEFAULT_BATCH_SIZE):
         """
         Initialize a ModelSyncher.
 
@@ -15,8 +18,12 @@ class ModelSyncher(object):
         :param generate_obj_id: function that should generate same ids for "same" objects
         :param delete_func: function for de-persisting objects
         :param delete_limit: failsafe maximum fraction of objects to delete
+        :param bulk: collect the objects passed to save() and write them
+          in batches on flush() and finish()
+        :param batch_size: maximum number of objects per query in bulk mode
         """
         d = {}
+        self.model = queryset.model
         self.generate_obj_id = generate_obj_id
         # Generate a list of all objects
         for obj in queryset:
@@ -28,6 +35,12 @@ class ModelSyncher(object):
         self.delete_limit = delete_limit
         self.delete_func = delete_func
         self.skip_delete = skip_delete
+        self.bulk = bulk
+        self.batch_size = batch_size
+        self.counts = collections.Counter()
+        self._new = collections.OrderedDict()
+        self._changed = collections.OrderedDict()
+        self._changed_fields = set()
 
     def mark(self, obj):
         """
@@ -54,13 +67,64 @@ class ModelSyncher(object):
         """
         return self.obj_dict.get(obj_id, None)
 
+    def save(self, obj, fields=None):
+        """
+        Save a new or a changed object.
+
+        In bulk mode the object is written on the next flush.  Until
+        then a new object has no primary key.
+
+        :param obj: Object to be saved
+        :param fields: names of the changed fields of an existing object,
+          or None to save all of them
+        """
+        if not self.bulk:
+            if obj.pk is None:
+                obj.save()
+                self.counts['created'] += 1
+            else:
+                obj.save(update_fields=fields)
+                self.counts['updated'] += 1
+            return
+
+        if obj.pk is None:
+            self._new[id(obj)] = obj
+            return
+        if fields is None:
+            fields = [f.attname for f in self.model._meta.concrete_fields if not f.primary_key]
+        self._changed[id(obj)] = obj
+        self._changed_fields.update(fields)
+
+    def flush(self):
+        """
+        Write the objects collected in bulk mode.
+        """
+        new = list(self._new.values())
+        changed = list(self._changed.values())
+        bulk_create(self.model, new, self.batch_size)
+        bulk_update(self.model, changed, self._changed_fields, self.batch_size)
+        self.counts['created'] += len(new)
+        self.counts['updated'] += len(changed)
+        self._new.clear()
+        self._changed.clear()
+        self._changed_fields = set()
+
     def finish(self):
         """
         Run synchronization, applying delete_func to items not mark():ed
+
+        :returns: numbers of created, updated and deleted objects
+        :rtype: collections.Counter
         """
-        if self.skip_delete:
-            return
+        self.flush()
+        if not self.skip_delete:
+            self._delete_unmarked()
 
+        logger.info("%s: %d created, %d updated, %d deleted" % (
+            self.model.__name__, self.counts['created'], self.counts['updated'], self.counts['deleted']))
+        return self.counts
+
+    def _delete_unmarked(self):
         delete_list = []
         for obj_id, obj in self.obj_dict.items():
             if not obj._found:
@@ -71,9 +135,14 @@ class ModelSyncher(object):
             if len(delete_list) > 5 and len(delete_list) > max_delete_count:
                 raise Exception("Attempting to delete more than %d%% of total items" % int(self.delete_limit * 100))
 
-        for obj in delete_list:
-            if self.delete_func:
+        if self.delete_func:
+            for obj in delete_list:
                 self.delete_func(obj)
-            else:
-                logger.info("Deleting object %s" % obj)
-                obj.delete()
+        else:
+            if delete_list:
+                logger.info("Deleting %s objects %s" % (
+                    self.model.__name__, ', '.join(str(self.generate_obj_id(x)) for x in delete_list)))
+            pks = [obj.pk for obj in delete_list]
+            for start in range(0, len(pks), self.batch_size):
+                self.model.objects.filter(pk__in=pks[start:start + self.batch_size]).delete()
+        self.counts['deleted'] += len(delete_list)
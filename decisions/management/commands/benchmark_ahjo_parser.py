@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand
+
+from decisions.importer.helsinki.ahjo.benchmark import (
+    run_benchmark, save_result)
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the Ahjo XML parser with a synthetic corpus'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--documents', type=int, default=20, help=(
+                "Number of documents to generate"))
+        parser.add_argument(
+            '--actions', type=int, default=20, help=(
+                "Number of actions per document"))
+        parser.add_argument(
+            '--attendees', type=int, default=15, help=(
+                "Number of attendees per document"))
+        parser.add_argument(
+            '--attachments', type=int, default=2, help=(
+                "Number of attachments per action"))
+        parser.add_argument(
+            '--xhtml-sections', type=int, default=1, help=(
+                "Number of XHTML tables per action"))
+        parser.add_argument(
+            '--full-parse', action='store_true', default=False, help=(
+                "Build the full XML tree instead of streaming"))
+        parser.add_argument(
+            '--micro', action='store_true', default=False, help=(
+                "Also measure the per-call cost of the parser helpers"))
+        parser.add_argument(
+            '--output', type=str, metavar='FILE', help=(
+                "JSON file to append the results to and to compare "
+                "them against"))
+
+    def handle(self, *args, **options):
+        result = run_benchmark(
+            documents=options['documents'],
+            streaming=not options['full_parse'],
+            micro=options['micro'],
+            actions=options['actions'],
+            attendees=options['attendees'],
+            attachments=options['attachments'],
+            xhtml_sections=options['xhtml_sections'])
+        previous = save_result(options['output'], result) if options['output'] else None
+
+        self.stdout.write("{} documents, {:.2f} MB of XML".format(
+            options['documents'], result['bytes'] / 1e6))
+        for name in ['parse', 'validate', 'as_json', 'total']:
+            phase = result['results'][name]
+            line = "{:10} {:8.3f} s {:10.1f} docs/s {:8.2f} MB/s".format(
+                name, phase['seconds'], phase['docs_per_second'], phase['mb_per_second'])
+            if previous:
+                before = previous['results'][name]['seconds']
+                line += "  ({:+.1%} time vs. {})".format(
+                    phase['seconds'] / before - 1, previous['revision'] or 'previous')
+            self.stdout.write(line)
+        for (name, microseconds) in sorted(result.get('micro', {}).items()):
+            line = "{:24} {:8.2f} us/call".format(name, microseconds)
+            if previous and name in previous.get('micro', {}):
+                line += "  ({:+.1%} vs. {})".format(
+                    microseconds / previous['micro'][name] - 1,
+                    previous['revision'] or 'previous')
+            self.stdout.write(line)
+        self.stdout.write("Peak RSS {:.1f} MB".format(result['peak_rss'] / 1024))
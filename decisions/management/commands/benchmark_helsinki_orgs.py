@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from decisions.importer.helsinki.organization_benchmark import run_benchmark
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks building the Helsinki organization hierarchy with a synthetic export'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--organizations', type=int, default=50000, help=(
+                "Number of organizations and posts to generate"))
+        parser.add_argument(
+            '--depth', type=int, default=2000, help=(
+                "Depth of the deepest branch of the hierarchy"))
+        parser.add_argument(
+            '--rounds', type=int, default=3, help=(
+                "Number of builds to run, the fastest is reported"))
+
+    def handle(self, *args, **options):
+        result = run_benchmark(
+            count=options['organizations'],
+            depth=options['depth'],
+            rounds=options['rounds'])
+        build = result['results']['build']
+        self.stdout.write("{} organizations, {} posts".format(
+            result['organizations'], result['posts']))
+        self.stdout.write("build {:8.3f} s {:10.1f} nodes/s".format(
+            build['seconds'], build['nodes_per_second']))
+        self.stdout.write("Peak RSS {:.1f} MB".format(result['peak_rss'] / 1024))
@@ -1,4 +1,4 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 
 from decisions.importer.helsinki import ahjo
 
@@ -11,7 +11,79 @@ class Command(BaseCommand):
             'root', type=str, help=(
                 "Root path of the import, "
                 "e.g. /files or /files/Asuntolautakunta_60014"))
+        parser.add_argument(
+            '--scan-workers', type=int, default=1, help=(
+                "Number of directory listings to fetch concurrently"))
+        parser.add_argument(
+            '--parse-workers', type=int, default=1, help=(
+                "Number of processes to download and parse documents in"))
+        parser.add_argument(
+            '--bulk', action='store_true', default=False, help=(
+                "Write the actions of each document with bulk queries"))
+        parser.add_argument(
+            '--identity-cache-size', type=int, metavar='N', help=(
+                "Maximum number of persons and functions to cache "
+                "in memory (default: unlimited)"))
+        parser.add_argument(
+            '--validate-every', type=int, default=1, metavar='N', help=(
+                "Validate only every Nth parsed document against the "
+                "schema, or none with 0 (default: 1, i.e. all)"))
+        parser.add_argument(
+            '--retries', type=int, default=3, help=(
+                "How many times to retry failed HTTP requests"))
+        parser.add_argument(
+            '--timeout', type=float, default=60, help=(
+                "HTTP read timeout in seconds"))
+        parser.add_argument(
+            '--listing-cache', type=str, metavar='DIR', help=(
+                "Directory to cache the directory listings in"))
+        parser.add_argument(
+            '--archive-cache', type=str, metavar='DIR', help=(
+                "Directory to cache the document ZIP files in"))
+        parser.add_argument(
+            '--archive-cache-size', type=int, metavar='MB', help=(
+                "Maximum size of the document cache in megabytes"))
+        parser.add_argument(
+            '--offline', action='store_true', default=False, help=(
+                "Read everything from the caches without network access"))
+        parser.add_argument(
+            '--incremental', action='store_true', default=False, help=(
+                "Skip directories not modified since the last successful "
+                "import (requires --listing-cache)"))
+        parser.add_argument(
+            '--streaming-parse', action='store_true', default=False, help=(
+                "Parse the actions of the documents incrementally "
+                "instead of building the full XML tree first"))
+        parser.add_argument(
+            '--ordered', action='store_true', default=False, help=(
+                "Import documents in directory listing order "
+                "even when scanning concurrently"))
 
     def handle(self, root, *args, **options):
-        db_importer = ahjo.DatabaseImporter()
-        db_importer.import_changes(root)
+        ahjo.Document.validate_every = options['validate_every']
+        listing_cache = None
+        if options['listing_cache']:
+            listing_cache = ahjo.ListingCache(options['listing_cache'])
+        elif options['incremental'] or options['offline']:
+            raise CommandError("--incremental and --offline require --listing-cache")
+        archive_cache = None
+        if options['archive_cache']:
+            max_size = options['archive_cache_size']
+            archive_cache = ahjo.ArchiveCache(
+                options['archive_cache'],
+                max_size=(max_size * 1024 * 1024 if max_size else None))
+        scanner = ahjo.Scanner(
+            workers=options['scan_workers'],
+            retries=options['retries'],
+            timeout=(10, options['timeout']),
+            listing_cache=listing_cache,
+            archive_cache=archive_cache,
+            offline=options['offline'],
+            streaming_parse=options['streaming_parse'])
+        db_importer = ahjo.DatabaseImporter(
+            scanner=scanner, workers=options['parse_workers'],
+            bulk=options['bulk'],
+            identity_cache_size=options['identity_cache_size'])
+        db_importer.import_changes(
+            root, ordered=options['ordered'],
+            incremental=options['incremental'])
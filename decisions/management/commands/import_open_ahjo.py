@@ -10,6 +10,10 @@ class Command(BaseCommand):
         parser.add_argument('filename', type=str)
         parser.add_argument('--flush', action='store_true', dest='flush', default=False,
                             help='Delete all existing objects first')
+        parser.add_argument('--batch-size', type=int, dest='batch_size', default=None,
+                            help='Number of objects to write per query')
+        parser.add_argument('--stream', action='store_true', dest='stream', default=False,
+                            help='Read the data file incrementally instead of loading it at once')
 
     def handle(self, *args, **options):
         importer = OpenAhjoImporter(options)
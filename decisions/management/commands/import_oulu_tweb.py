@@ -10,6 +10,8 @@ class Command(BaseCommand):
         parser.add_argument('zipfile', type=str)
         parser.add_argument('--flush', action='store_true', dest='flush', default=False,
                             help='Delete all existing objects first')
+        parser.add_argument('--workers', type=int, dest='workers', default=1,
+                            help='Number of organizations to import concurrently')
 
     def handle(self, *args, **options):
         defaults = dict(
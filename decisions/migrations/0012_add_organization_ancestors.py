@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+def get_ancestor_ids(parent_ids):
+    # Frozen copy of the ancestor computation at the time of this
+    # migration, so that later changes to the importers do not affect it
+    ancestors = {}
+    for pk in parent_ids:
+        path = []
+        node = pk
+        while node in parent_ids and node not in ancestors and node not in path:
+            path.append(node)
+            node = parent_ids[node]
+        for node in reversed(path):
+            parent = parent_ids[node]
+            if parent is None or (parent in path and parent not in ancestors):
+                ancestors[node] = []
+            else:
+                ancestors[node] = ancestors.get(parent, []) + [parent]
+    return ancestors
+
+
+def fill_hierarchy(apps, schema_editor):
+    Organization = apps.get_model('decisions', 'Organization')
+    rows = list(Organization.objects.values_list('pk', 'parent_id', 'name'))
+    ancestors = get_ancestor_ids({pk: parent_id for (pk, parent_id, _name) in rows})
+    names = {pk: name for (pk, _parent_id, name) in rows}
+    for (pk, _parent_id, _name) in rows:
+        Organization.objects.filter(pk=pk).update(
+            ancestor_ids=ancestors[pk],
+            full_name=' / '.join(names[x] for x in ancestors[pk] + [pk] if x in names))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('decisions', '0011_add_post_to_event'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='organization',
+            name='ancestor_ids',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), blank=True, default=list, help_text='IDs of the organizations containing this organization, from the root to the parent', size=None),
+        ),
+        migrations.AddField(
+            model_name='organization',
+            name='full_name',
+            field=models.TextField(blank=True, help_text='Names of the organizations from the root to this organization, separated by slashes'),
+        ),
+        migrations.AddIndex(
+            model_name='organization',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['ancestor_ids'], name='decisions_org_ancestor_ids'),
+        ),
+        migrations.RunPython(fill_hierarchy, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+def get_ancestor_ids(parent_ids):
+    # Frozen copy of the ancestor computation at the time of this
+    # migration, so that later changes to the importers do not affect it
+    ancestors = {}
+    for pk in parent_ids:
+        path = []
+        node = pk
+        while node in parent_ids and node not in ancestors and node not in path:
+            path.append(node)
+            node = parent_ids[node]
+        for node in reversed(path):
+            parent = parent_ids[node]
+            if parent is None or (parent in path and parent not in ancestors):
+                ancestors[node] = []
+            else:
+                ancestors[node] = ancestors.get(parent, []) + [parent]
+    return ancestors
+
+
+def get_level_name(name, code):
+    if not code or name.startswith(code):
+        return name
+    return '%s %s' % (code, name)
+
+
+def fill_hierarchy(apps, schema_editor):
+    Function = apps.get_model('decisions', 'Function')
+    rows = list(Function.objects.values_list('pk', 'parent_id', 'name', 'function_id'))
+    ancestors = get_ancestor_ids({pk: parent_id for (pk, parent_id, _name, _code) in rows})
+    names = {pk: get_level_name(name, code) for (pk, _parent_id, name, code) in rows}
+    for (pk, _parent_id, _name, _code) in rows:
+        Function.objects.filter(pk=pk).update(
+            ancestor_ids=ancestors[pk],
+            full_name=' / '.join(names[x] for x in ancestors[pk] + [pk] if x in names))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('decisions', '0012_add_organization_ancestors'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='function',
+            name='ancestor_ids',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), blank=True, default=list, help_text='IDs of the functions containing this function, from the root to the parent', size=None),
+        ),
+        migrations.AddField(
+            model_name='function',
+            name='full_name',
+            field=models.TextField(blank=True, help_text='Codes and names of the functions from the root to this function, separated by slashes'),
+        ),
+        migrations.AlterField(
+            model_name='function',
+            name='function_id',
+            field=models.CharField(db_index=True, help_text='Original identifier of this function', max_length=32),
+        ),
+        migrations.AddIndex(
+            model_name='function',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['ancestor_ids'], name='decisions_func_ancestor_ids'),
+        ),
+        migrations.RunPython(fill_hierarchy, migrations.RunPython.noop),
+    ]
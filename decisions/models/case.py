@@ -1,5 +1,7 @@
 # -*- coding: UTF-8 -*-
 from django.contrib.gis.db import models
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
 from django.utils.translation import ugettext_lazy as _
 
 from .base import DataModel
@@ -7,11 +9,18 @@ from .base import DataModel
 
 class Function(DataModel):
     name = models.CharField(max_length=255, help_text=_('Name of this function'))
-    function_id = models.CharField(max_length=32, help_text=_('Original identifier of this function'))
+    function_id = models.CharField(max_length=32, help_text=_('Original identifier of this function'), db_index=True)
     parent = models.ForeignKey('self', help_text=_('Parent function of this function'), blank=True, null=True)
+    ancestor_ids = ArrayField(models.IntegerField(), default=list, blank=True, help_text=_(
+        'IDs of the functions containing this function, from the root to the parent'))
+    full_name = models.TextField(blank=True, help_text=_(
+        'Codes and names of the functions from the root to this function, separated by slashes'))
+
+    class Meta(DataModel.Meta):
+        indexes = [GinIndex(fields=['ancestor_ids'], name='decisions_func_ancestor_ids')]
 
     def __str__(self):
-        return '%s / %s' % (self.parent, self.name) if self.parent else self.name
+        return self.full_name or self.name
 
 
 class CaseGeometry(DataModel):
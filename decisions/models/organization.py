@@ -1,5 +1,7 @@
 # -*- coding: UTF-8 -*-
 
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
 from django.db import models
 from django.utils.translation import ugettext_lazy as _
 
@@ -30,16 +32,18 @@ class Organization(DataModel):
     dissolution_date = models.DateField(help_text=_('A date of dissolution'), blank=True, null=True, db_index=True)
     parent = models.ForeignKey('self', help_text=_('The organizations that contain this organization'), null=True,
                                blank=True)
+    ancestor_ids = ArrayField(models.IntegerField(), default=list, blank=True, help_text=_(
+        'IDs of the organizations containing this organization, from the root to the parent'))
+    full_name = models.TextField(blank=True, help_text=_(
+        'Names of the organizations from the root to this organization, separated by slashes'))
     # FIXME: Add contact details
 
     class Meta:
         ordering = ['id']
+        indexes = [GinIndex(fields=['ancestor_ids'], name='decisions_org_ancestor_ids')]
 
     def __str__(self):
-        if self.parent:
-            return '%s / %s' % (self.parent, self.name)  # TODO cache
-        else:
-            return self.name
+        return self.full_name or self.name
 
 
 class PostClass(DataModel):
@@ -0,0 +1,70 @@
+import pytest
+import pytz
+
+from decisions.importer.helsinki.ahjo.benchmark import generate_minutes
+from decisions.importer.helsinki.ahjo.db_importer import DatabaseImporter
+from decisions.importer.helsinki.ahjo.docinfo import DocumentInfo
+from decisions.importer.helsinki.ahjo.parse_dirlist import DirEntry
+from decisions.importer.helsinki.ahjo.xmlparser import parse_xml
+from decisions.models import (
+    Action, Attachment, Case, Content, DataSource, Event, Organization)
+
+DOC_INFO = DocumentInfo(
+    DirEntry('/files/Asuntolautakunta_60014/Asu%202016-01-12%20Asulk%201%20Pk%20Su.zip',
+             ' 5/23/2017 10:04 AM        1234 '),
+    'http://example.com', pytz.utc)
+
+ROW_FIELDS = [
+    (Event, ('origin_id', 'name', 'start_date', 'organization__origin_id')),
+    (Case, ('register_id', 'title', 'function__function_id')),
+    (Action, ('origin_id', 'title', 'ordering', 'resolution', 'article_number', 'case__register_id')),
+    (Content, ('origin_id', 'action__origin_id', 'hypertext', 'type', 'ordering')),
+    (Attachment, ('origin_id', 'action__origin_id', 'name', 'public', 'number', 'confidentiality_reason')),
+]
+
+
+@pytest.fixture
+def data_source():
+    data_source = DataSource.objects.create(identifier='helsinki', name='Helsinki')
+    Organization.objects.create(
+        data_source=data_source, origin_id=DOC_INFO.policymaker_id, name='Asuntolautakunta', slug='asuntolautakunta')
+    return data_source
+
+
+@pytest.fixture
+def minutes_file(tmpdir):
+    path = tmpdir.join('minutes.xml')
+    path.write_binary(generate_minutes(actions=5, attendees=3, attachments=2))
+    return str(path)
+
+
+def _import_document(data_source, document, bulk):
+    importer = DatabaseImporter(data_source=data_source, bulk=bulk)
+    importer._import_document(DOC_INFO, document)
+    return importer
+
+
+def _get_rows():
+    return {
+        model.__name__: sorted(model.objects.values_list(*fields))
+        for (model, fields) in ROW_FIELDS}
+
+
+@pytest.mark.django_db
+def test_bulk_import_matches_serial_import(data_source, minutes_file):
+    _import_document(data_source, parse_xml(minutes_file), bulk=False)
+    serial_rows = _get_rows()
+    assert len(serial_rows['Action']) == 5
+    assert len(serial_rows['Attachment']) == 10
+
+    Event.objects.all().delete()
+    Case.objects.all().delete()
+    importer = _import_document(data_source, parse_xml(minutes_file), bulk=True)
+    assert _get_rows() == serial_rows
+    assert importer.counts[('Action', 'created')] == 5
+
+    document = parse_xml(minutes_file)
+    document.event.actions[0].title = 'Muutettu otsikko'
+    importer = _import_document(data_source, document, bulk=True)
+    assert importer.counts[('Action', 'updated')] == 1
+    assert not [key for (key, count) in importer.counts.items() if count and key[1] != 'updated']
@@ -0,0 +1,40 @@
+import pytest
+
+from decisions.factories import ActionFactory, CaseFactory
+from decisions.importer.bulk import bulk_create, bulk_update, set_changed_fields
+from decisions.models import Action
+
+
+@pytest.mark.django_db
+def test_set_changed_fields(action):
+    changed = set_changed_fields(action, {
+        'title': action.title,
+        'resolution': 'decided',
+        'case_id': None,
+    })
+    assert sorted(changed) == ['case_id', 'resolution']
+    assert action.resolution == 'decided'
+    assert action.case_id is None
+
+
+@pytest.mark.django_db
+def test_bulk_create_sets_pks(event):
+    actions = [Action(title=str(i), ordering=i, event=event) for i in range(3)]
+    bulk_create(Action, actions)
+    assert all(x.pk for x in actions)
+    assert sorted(event.actions.values_list('title', flat=True)) == ['0', '1', '2']
+
+
+@pytest.mark.django_db
+def test_bulk_update(django_assert_num_queries):
+    actions = ActionFactory.create_batch(5)
+    case = CaseFactory()
+    for (num, action) in enumerate(actions):
+        action.ordering = num * 10
+        action.case_id = case.pk if num % 2 else None
+    with django_assert_num_queries(2):
+        bulk_update(Action, actions, ['ordering', 'case_id'], batch_size=3)
+    updated = Action.objects.filter(pk__in=[x.pk for x in actions]).order_by('pk')
+    for (num, action) in enumerate(updated):
+        assert action.ordering == num * 10
+        assert action.case_id == (case.pk if num % 2 else None)
@@ -0,0 +1,39 @@
+import datetime
+
+import pytest
+from django.utils import timezone
+
+from decisions.importer.diff import get_field_table, update_fields
+from decisions.models import Organization
+
+
+def test_field_table():
+    table = get_field_table(Organization, ('slug',))
+    assert 'slug' not in table
+    assert table['parent_id'].name == 'parent'
+    assert table['name'].max_length == 255
+    assert table['founding_date'].internal_type == 'DateField'
+
+
+def test_update_fields():
+    created_at = timezone.make_aware(datetime.datetime(2017, 1, 2, 3, 4, 5))
+    orgs = [
+        Organization(name='A', founding_date=datetime.date(2017, 1, 1), created_at=created_at),
+        Organization(name='B', founding_date=datetime.date(2017, 1, 1), created_at=created_at),
+    ]
+    changed = update_fields(orgs, [
+        {'name': 'A', 'founding_date': '2017-01-01', 'created_at': created_at.isoformat()},
+        {'name': 'C', 'founding_date': '2017-02-01', 'parent_id': None},
+    ])
+    assert changed == [[], ['name', 'founding_date']]
+    assert orgs[1].name == 'C'
+    assert orgs[1].founding_date == '2017-02-01'
+
+
+def test_update_fields_errors():
+    with pytest.raises(Exception):
+        update_fields([Organization()], [{'unknown': 1}])
+    with pytest.raises(Exception):
+        update_fields([Organization()], [{'abbreviation': 'x' * 51}])
+    with pytest.raises(Exception):
+        update_fields([Organization()], [{'slug': 'x'}], skip_fields=['slug'])
@@ -0,0 +1,59 @@
+import datetime
+import sys
+
+import pytz
+
+from decisions.importer.base import Importer
+from decisions.importer.helsinki.organization_benchmark import (
+    generate_organizations, run_benchmark)
+from decisions.importer.helsinki.organizations import (
+    HelsinkiImporter, parse_datetime, parse_local_datetime)
+
+
+def _get_importer():
+    importer = HelsinkiImporter.__new__(HelsinkiImporter)
+    Importer.__init__(importer, {'verbosity': 0, 'include_people': False})
+    return importer
+
+
+def test_parse_datetime():
+    assert parse_datetime('2016-09-21T13:55:14.327') == datetime.datetime(2016, 9, 21, 13, 55, 14, 327000)
+    assert parse_datetime('2009-01-01') == datetime.datetime(2009, 1, 1)
+    assert parse_datetime('21.9.2016') == datetime.datetime(2016, 9, 21)
+
+
+def test_parse_local_datetime():
+    assert parse_local_datetime('2016-01-10T12:00:00').utcoffset() == datetime.timedelta(hours=2)
+    assert parse_local_datetime('2016-07-10T12:00:00').utcoffset() == datetime.timedelta(hours=3)
+    # The day of the change to the summer time
+    assert parse_local_datetime('2016-03-27T02:00:00').utcoffset() == datetime.timedelta(hours=2)
+    assert parse_local_datetime('2016-03-27T05:00:00').utcoffset() == datetime.timedelta(hours=3)
+    # Timestamps with an offset keep their instant
+    for value in ['2016-01-10T10:00:00Z', '2016-01-10T11:00:00+01:00']:
+        parsed = parse_local_datetime(value)
+        assert parsed == pytz.utc.localize(datetime.datetime(2016, 1, 10, 10))
+        assert parsed.utcoffset() == datetime.timedelta(hours=2)
+
+
+def test_build_deep_hierarchy():
+    count = sys.getrecursionlimit() * 2
+    (orgs, posts) = _get_importer().build_organizations(generate_organizations(count, depth=count, posts=0))
+    assert len(orgs) == count
+    seen = set()
+    for org in orgs:
+        assert org['parent_id'] is None or org['parent_id'] in seen
+        seen.add(org['origin_id'])
+
+
+def test_build_posts():
+    (orgs, posts) = _get_importer().build_organizations(generate_organizations(1000, depth=10, posts=0.5))
+    org_ids = {x['origin_id'] for x in orgs}
+    assert posts
+    assert len(orgs) + len(posts) == 1000
+    assert all(x['organization_id'] in org_ids for x in posts)
+
+
+def test_benchmark():
+    result = run_benchmark(count=200, depth=50, rounds=1)
+    assert result['organizations'] + result['posts'] == 200
+    assert result['results']['build']['nodes_per_second'] > 0
@@ -0,0 +1,95 @@
+import pytest
+from rest_framework.reverse import reverse
+
+from decisions.factories import FunctionFactory, OrganizationFactory
+from decisions.importer.base import Importer
+from decisions.importer.hierarchy import (
+    get_ancestor_ids, get_level_name, update_ancestor_ids)
+from decisions.models import DataSource, Function, Organization
+
+
+def test_get_ancestor_ids():
+    ancestors = get_ancestor_ids({4: 3, 1: None, 3: 2, 2: 1, 5: 1, 6: 99})
+    assert ancestors == {1: [], 2: [1], 3: [1, 2], 4: [1, 2, 3], 5: [1], 6: [99]}
+
+
+def test_get_level_name():
+    assert get_level_name('Hallinto', '00') == '00 Hallinto'
+    assert get_level_name('00 01', '00 01') == '00 01'
+    assert get_level_name('Hallinto') == 'Hallinto'
+
+
+def test_get_ancestor_ids_missing_parent(caplog):
+    assert get_ancestor_ids({1: None, 2: 99, 3: 2}) == {1: [], 2: [99], 3: [99, 2]}
+    assert [x.getMessage() for x in caplog.records] == ['Parent 99 of 2 does not exist']
+
+
+def test_get_ancestor_ids_cycle(caplog):
+    ancestors = get_ancestor_ids({1: 2, 2: 1, 3: 2})
+    assert set(ancestors) == {1, 2, 3}
+    assert ancestors[3][-1] == 2
+    assert [x.getMessage() for x in caplog.records] == ['Cycle in the hierarchy at 1']
+
+
+@pytest.mark.django_db
+def test_update_organizations_reparents_subtree():
+    importer = Importer({'verbosity': 0})
+    importer.data_source = DataSource.objects.create(identifier='test', name='Test')
+    orgs = [
+        {'origin_id': 'a', 'name': 'A', 'parent_id': None},
+        {'origin_id': 'b', 'name': 'B', 'parent_id': 'a'},
+        {'origin_id': 'c', 'name': 'C', 'parent_id': 'b'},
+        {'origin_id': 'd', 'name': 'D', 'parent_id': None},
+    ]
+    importer.update_organizations(orgs)
+    by_id = {x.origin_id: x for x in Organization.objects.all()}
+    assert by_id['c'].ancestor_ids == [by_id['a'].pk, by_id['b'].pk]
+    assert str(by_id['c']) == 'A / B / C'
+
+    # Moving a subtree refreshes the ancestors of its descendants too
+    orgs[1]['parent_id'] = 'd'
+    importer.update_organizations(orgs)
+    by_id = {x.origin_id: x for x in Organization.objects.all()}
+    assert by_id['b'].ancestor_ids == [by_id['d'].pk]
+    assert by_id['c'].ancestor_ids == [by_id['d'].pk, by_id['b'].pk]
+    assert str(by_id['c']) == 'D / B / C'
+    assert by_id['a'].ancestor_ids == []
+
+
+@pytest.mark.django_db
+def test_organization_hierarchy_filters(client):
+    root = OrganizationFactory(parent=None)
+    child = OrganizationFactory(parent=root)
+    grandchild = OrganizationFactory(parent=child)
+    other = OrganizationFactory(parent=None)
+    assert update_ancestor_ids(Organization, name_field='name') > 0
+    grandchild = Organization.objects.get(pk=grandchild.pk)
+    assert grandchild.ancestor_ids == [root.pk, child.pk]
+    assert str(grandchild) == ' / '.join([root.name, child.name, grandchild.name])
+    assert update_ancestor_ids(Organization, name_field='name') == 0
+
+    url = reverse('v1:organization-list')
+    response = client.get(url, {'descendants_of': root.pk})
+    assert [x['id'] for x in response.json()['results']] == [child.pk, grandchild.pk]
+    response = client.get(url, {'ancestors_of': grandchild.pk})
+    assert [x['id'] for x in response.json()['results']] == [root.pk, child.pk]
+    response = client.get(url, {'descendants_of': other.pk})
+    assert response.json()['results'] == []
+
+
+@pytest.mark.django_db
+def test_function_hierarchy(client, case):
+    root = FunctionFactory(name='Hallinto', function_id='00', parent=None)
+    child = FunctionFactory(name='Hallintoasiat', function_id='00 00', parent=root)
+    case.function = FunctionFactory(name='Asiakirjat', function_id='00 00 01', parent=child)
+    case.save()
+    update_ancestor_ids(Function, name_field='name', code_field='function_id')
+    function = Function.objects.get(pk=case.function.pk)
+    assert function.ancestor_ids == [root.pk, child.pk]
+    assert str(function) == '00 Hallinto / 00 00 Hallintoasiat / 00 00 01 Asiakirjat'
+
+    url = reverse('v1:case-list')
+    response = client.get(url, {'function_prefix': '00 00'})
+    assert [x['id'] for x in response.json()['results']] == [case.pk]
+    response = client.get(url, {'function_prefix': '01'})
+    assert response.json()['results'] == []
@@ -0,0 +1,52 @@
+import json
+
+import pytest
+
+from decisions.importer.json_stream import iterate_array
+
+DATA = {
+    'organizations': [{'id': 1, 'name': 'Kaupunginhallitus'}],
+    'count': 12345,
+    'meetings': [{'id': n, 'date': '2016-01-{:02d}'.format(n + 1), 'tags': ['a', [1.5, None]]}
+                 for n in range(25)],
+    'empty': [],
+    'text': 'unicode äö "quoted" [not an array]',
+}
+
+
+@pytest.fixture
+def data_file(tmpdir):
+    path = tmpdir.join('data.json')
+    path.write_text(json.dumps(DATA, indent=2), encoding='utf-8')
+    return str(path)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 64 * 1024])
+@pytest.mark.parametrize('key', sorted(DATA))
+def test_iterate_array(data_file, key, chunk_size):
+    items = list(iterate_array(data_file, key, chunk_size=chunk_size))
+    expected = DATA[key] if isinstance(DATA[key], list) else [DATA[key]]
+    assert items == expected
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 5, 10])
+def test_iterate_array_numbers(tmpdir, chunk_size):
+    text = '{"a": [12.5, 3, -0.25, 1e10, 2.5E-3, 7e+2, [1.125, 40], 100], "b": 6.02e23}'
+    path = tmpdir.join('data.json')
+    path.write_text(text, encoding='utf-8')
+    for key in ['a', 'b']:
+        items = list(iterate_array(str(path), key, chunk_size=chunk_size))
+        expected = json.loads(text)[key]
+        assert items == (expected if isinstance(expected, list) else [expected])
+
+
+def test_iterate_array_missing_key(data_file):
+    with pytest.raises(KeyError):
+        list(iterate_array(data_file, 'missing'))
+
+
+def test_iterate_array_invalid(tmpdir):
+    path = tmpdir.join('data.json')
+    path.write_text('{"meetings": [{"id": 1}, {"id": ', encoding='utf-8')
+    with pytest.raises(ValueError):
+        list(iterate_array(str(path), 'meetings', chunk_size=4))
@@ -0,0 +1,62 @@
+import json
+import os
+
+import pytest
+
+from decisions.factories import OrganizationFactory
+from decisions.importer.open_ahjo import OpenAhjoImporter
+from decisions.models import Action, Attachment, Case, Content, Event, Function
+
+DUMP_FILE = os.path.join(os.path.dirname(__file__), 'data', 'open_ahjo.json')
+
+
+@pytest.fixture
+def council():
+    return OrganizationFactory(origin_id='02900')
+
+
+@pytest.fixture
+def dump():
+    with open(DUMP_FILE, encoding='utf-8') as fp:
+        return json.load(fp)
+
+
+def _import(tmpdir, dump, stream):
+    filename = tmpdir.join('open_ahjo.json')
+    filename.write_text(json.dumps(dump), encoding='utf-8')
+    importer = OpenAhjoImporter({
+        'verbosity': 0, 'filename': str(filename), 'flush': False, 'batch_size': 2, 'stream': stream})
+    importer.import_data()
+    return importer
+
+
+def _get_case_geometries():
+    return {
+        case.origin_id: sorted(x.origin_id for x in case.geometries.all())
+        for case in Case.objects.prefetch_related('geometries')}
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('stream', [False, True])
+def test_open_ahjo_import(tmpdir, council, dump, stream):
+    importer = _import(tmpdir, dump, stream)
+    functions = {x.origin_id: x for x in Function.objects.all()}
+    assert functions['101'].parent == functions['100']
+    # The function with a missing parent is imported without one
+    assert functions['102'].parent is None
+    assert str(functions['101']) == '00 Hallinto / 00 01 Hallintoasiat'
+    assert importer.counts[('Case', 'created')] == 3
+    assert _get_case_geometries() == {'300': ['200', '201'], '301': ['201'], '302': []}
+    assert Event.objects.count() == 2
+    assert Action.objects.get(origin_id='400').case.origin_id == '300'
+    assert Content.objects.get(origin_id='501').action.origin_id == '401'
+    assert Attachment.objects.get(origin_id='600').action.origin_id == '400'
+
+    dump['issues'][0]['subject'] = 'Asemakaavan muutos, Kluuvi'
+    dump['issues'][0]['geometries'] = [200]
+    dump['issues'][1]['geometries'] = [200]
+    importer = _import(tmpdir, dump, stream)
+    changes = {key: count for (key, count) in importer.counts.items() if count}
+    assert changes == {('Case', 'updated'): 1}
+    assert Case.objects.get(origin_id='300').title == 'Asemakaavan muutos, Kluuvi'
+    assert _get_case_geometries() == {'300': ['200'], '301': ['200'], '302': []}
@@ -0,0 +1,148 @@
+import io
+import json
+import zipfile
+
+import pytest
+
+from decisions.importer.paatos_scraper import (
+    ArchiveIndex, PaatosScraperImporter)
+from decisions.models import (
+    Action, Attachment, Case, Content, DataSource, Event, Function,
+    Organization)
+
+# Members in the order of the archive, which is not alphabetical.  The
+# directories have no members of their own.
+ARCHIVE_MEMBERS = [
+    ('organizations/b/index.json', {
+        'sourceId': 'b', 'name': 'Board', 'classification': 'board',
+        'founding_date': None, 'dissolution_date': None, 'parent': 'a'}),
+    ('organizations/b/cases.json', [
+        {'sourceId': 'c1', 'registerId': 'R 1/2017', 'title': 'Case 1', 'functionId': '00 01'}]),
+    ('organizations/b/events/e2/index.json', {
+        'sourceId': 'e2', 'name': 'Meeting 2', 'startDate': '2017-02-01', 'endDate': '2017-02-01'}),
+    ('organizations/b/events/e2/actions/a1/index.json', {
+        'sourceId': 'a1', 'title': 'Action 1', 'ordering': 1, 'articleNumber': '1',
+        'caseId': 'c1', 'eventId': 'e2'}),
+    ('organizations/b/events/e2/actions/a1/contents.json', [
+        {'title': 'Päätös', 'content': '<p>Hyväksyttiin.</p>', 'order': 1}]),
+    ('organizations/b/events/e2/actions/a1/attachments.json', [
+        {'sourceId': 'att1', 'name': 'Liite', 'url': 'http://example.com/att1', 'number': 1,
+         'public': True, 'confidentialityReason': None, 'actionId': 'a1'}]),
+    ('organizations/b/events/e1/index.json', {
+        'sourceId': 'e1', 'name': 'Meeting 1', 'startDate': '2017-01-01', 'endDate': '2017-01-01'}),
+    ('organizations/a/index.json', {
+        'sourceId': 'a', 'name': 'Council', 'classification': 'council',
+        'founding_date': None, 'dissolution_date': None, 'parent': None}),
+    ('organizations/a/cases.json', [
+        {'sourceId': 'c2', 'registerId': 'R 2/2017', 'title': 'Case 2', 'functionId': '00 01'}]),
+    ('organizations/a/events/e3/index.json', {
+        'sourceId': 'e3', 'name': 'Meeting 3', 'startDate': '2017-03-01', 'endDate': '2017-03-01'}),
+    # The action refers to a case of another organization
+    ('organizations/a/events/e3/actions/a2/index.json', {
+        'sourceId': 'a2', 'title': 'Action 2', 'ordering': 1, 'articleNumber': '1',
+        'caseId': 'c1', 'eventId': 'e3'}),
+]
+
+
+def _build_archive(members=ARCHIVE_MEMBERS):
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, 'w') as archive:
+        for (name, content) in members:
+            archive.writestr(name, json.dumps(content).encode('utf-8'))
+    return data.getvalue()
+
+
+@pytest.fixture
+def archive_file(tmpdir):
+    path = tmpdir.join('paatos.zip')
+    path.write_binary(_build_archive())
+    return str(path)
+
+
+def _import(archive_file, workers=1):
+    importer = PaatosScraperImporter('test', {'name': 'Test'}, {
+        'verbosity': 0, 'zipfile': archive_file, 'flush': False, 'workers': workers})
+    importer.import_data()
+    return importer
+
+
+def test_archive_index():
+    with zipfile.ZipFile(io.BytesIO(_build_archive())) as archive:
+        index = ArchiveIndex(archive)
+        assert index.list_directory('organizations') == ['b', 'a']
+        assert index.list_directory('organizations/b') == ['index.json', 'cases.json', 'events']
+        assert index.list_directory('organizations/b/events') == ['e2', 'e1']
+        assert index.list_directory('organizations/c/events') == []
+        assert index.is_file('organizations/b/cases.json')
+        assert not index.is_file('organizations/b/events')
+        assert not index.is_file('organizations/b/events/e1/cases.json')
+
+
+# The threads of the workers have database connections of their own,
+# which do not see the data of a test transaction
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.parametrize('workers', [1, 2])
+def test_import(archive_file, workers):
+    _import(archive_file, workers)
+    assert str(Organization.objects.get(origin_id='b')) == 'Council / Board'
+    # The events of an organization are walked in the order of the archive
+    events = Event.objects.filter(organization__origin_id='b').order_by('pk')
+    assert list(events.values_list('origin_id', flat=True)) == ['e2', 'e1']
+    action = Action.objects.get(origin_id='a1')
+    assert action.case.register_id == 'R 1/2017'
+    assert action.event.origin_id == 'e2'
+    assert Content.objects.get(origin_id='1-a1').action == action
+    assert Attachment.objects.get(origin_id='att1').action == action
+    assert Action.objects.get(origin_id='a2').case == action.case
+    # The organizations share the function created by either of them
+    assert Function.objects.get().origin_id == '00 01'
+    assert set(Case.objects.values_list('function__origin_id', flat=True)) == {'00 01'}
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.parametrize('workers', [1, 2])
+def test_import_is_scoped_to_data_source(archive_file, workers):
+    # Objects of another data source with the same origin ids
+    other = DataSource.objects.create(identifier='other', name='Other')
+    organization = Organization.objects.create(data_source=other, origin_id='b', name='Other board', slug='b')
+    function = Function.objects.create(data_source=other, origin_id='00 01', name='Other', function_id='00 01')
+    case = Case.objects.create(
+        data_source=other, origin_id='c1', register_id='OTHER 1/2017', title='Other case', function=function)
+    event = Event.objects.create(
+        data_source=other, origin_id='e2', name='Other meeting', start_date='2017-02-01T00:00:00Z',
+        organization=organization)
+
+    importer = _import(archive_file, workers)
+    action = Action.objects.get(origin_id='a1')
+    assert action.data_source == importer.data_source
+    assert action.case.data_source == importer.data_source
+    assert action.event.data_source == importer.data_source
+    assert action.event.organization.data_source == importer.data_source
+    assert Function.objects.get(data_source=importer.data_source).origin_id == '00 01'
+    assert not Action.objects.filter(data_source=other).exists()
+    for obj in [organization, function, case, event]:
+        obj.refresh_from_db()
+    assert organization.name == 'Other board'
+    assert organization.parent is None
+    assert case.title == 'Other case'
+    assert event.name == 'Other meeting'
+    assert not event.actions.exists()
+
+
+@pytest.mark.django_db
+def test_reimport_with_changed_register_id(tmpdir, archive_file):
+    _import(archive_file)
+    case = Case.objects.get(origin_id='c1')
+
+    members = [(name, content) for (name, content) in ARCHIVE_MEMBERS if name != 'organizations/b/cases.json']
+    members.append(('organizations/b/cases.json', [
+        {'sourceId': 'c1', 'registerId': 'R 1/2018', 'title': 'Case 1', 'functionId': '00 01'}]))
+    changed_file = tmpdir.join('changed.zip')
+    changed_file.write_binary(_build_archive(members))
+    _import(str(changed_file))
+
+    # The case is matched by its origin id and its register id updated
+    assert Case.objects.count() == 2
+    case.refresh_from_db()
+    assert case.register_id == 'R 1/2018'
+    assert Action.objects.get(origin_id='a1').case == case
@@ -0,0 +1,42 @@
+import pytest
+
+from decisions.factories import OrganizationFactory
+from decisions.importer.sync import ModelSyncher
+from decisions.models import Organization
+
+
+def _get_syncher(**kwargs):
+    return ModelSyncher(Organization.objects.all(), lambda x: x.origin_id, **kwargs)
+
+
+@pytest.mark.django_db
+def test_bulk_syncher():
+    kept = OrganizationFactory(origin_id='kept')
+    OrganizationFactory(origin_id='old1')
+    OrganizationFactory(origin_id='old2')
+    syncher = _get_syncher(bulk=True, delete_limit=None)
+
+    new = Organization(origin_id='new', name='New', slug='new')
+    syncher.mark(new)
+    syncher.save(new)
+    kept = syncher.get('kept')
+    syncher.mark(kept)
+    kept.name = 'Renamed'
+    syncher.save(kept, ['name'])
+    assert new.pk is None
+
+    counts = syncher.finish()
+    assert new.pk is not None
+    assert Organization.objects.get(pk=kept.pk).name == 'Renamed'
+    assert sorted(Organization.objects.values_list('origin_id', flat=True)) == ['kept', 'new']
+    assert (counts['created'], counts['updated'], counts['deleted']) == (1, 1, 2)
+
+
+@pytest.mark.django_db
+def test_syncher_delete_limit():
+    for num in range(10):
+        OrganizationFactory(origin_id=str(num))
+    syncher = _get_syncher(delete_limit=0.5)
+    with pytest.raises(Exception):
+        syncher.finish()
+    assert Organization.objects.count() == 10